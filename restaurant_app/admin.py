@@ -7,6 +7,26 @@ from django.utils.html import format_html
 from django.contrib import admin
 from django.contrib.auth.models import Group
 from restaurant_app.models import *
+from restaurant_app.resources import (
+    CategoryResource,
+    CustomerDetailsResource,
+    DishResource,
+    SidebarItemResource,
+)
+
+
+
+class BulkImportMixin:
+    """
+    The Import page goes through the bulk resources in `import_resource_classes`.
+    Export keeps the default resource, so exported files still have every
+    column (id included) as before.
+    """
+    import_resource_classes = []
+
+    def get_import_resource_classes(self, request):
+        return self.import_resource_classes
+
 
 admin.site.unregister(Group)
 admin.site.unregister(BlacklistedToken)
@@ -54,23 +74,26 @@ class CustomUserAdmin(UnflodModelAdmin):
 
 admin.site.register(User, CustomUserAdmin)
 
-class CustomerDetailsAdmin(UnflodModelAdmin, ImportExportModelAdmin):
+class CustomerDetailsAdmin(BulkImportMixin, UnflodModelAdmin, ImportExportModelAdmin):
     import_form_class = ImportForm
     export_form_class = ExportForm
+    import_resource_classes = [CustomerDetailsResource]
     list_display = ('customer_name', 'phone_number', 'address')
     search_fields = ('customer_name', 'phone_number')
 
 admin.site.register(CustomerDetails, CustomerDetailsAdmin)
 
-class CategoryAdmin(UnflodModelAdmin, ImportExportModelAdmin):
+class CategoryAdmin(BulkImportMixin, UnflodModelAdmin, ImportExportModelAdmin):
     import_form_class = ImportForm
     export_form_class = ExportForm
+    import_resource_classes = [CategoryResource]
     list_display = ('name',)  # Adjust fields as needed
     search_fields = ('name',)
 
-class DishAdmin(UnflodModelAdmin, ImportExportModelAdmin):
+class DishAdmin(BulkImportMixin, UnflodModelAdmin, ImportExportModelAdmin):
     import_form_class = ImportForm
     export_form_class = ExportForm
+    import_resource_classes = [DishResource]
     list_display = ('name', 'category', 'price')  # Adjust fields as needed
     list_filter = ('category',)
     search_fields = ('name',)
@@ -82,6 +105,7 @@ admin.site.register(DishSize, UnflodModelAdmin)
 admin.site.register(OnlineOrder, UnflodModelAdmin)
 admin.site.register(Order, UnflodModelAdmin)
 admin.site.register(OrderItem, UnflodModelAdmin)
+admin.site.register(ShortLink, UnflodModelAdmin)
 admin.site.register(Bill, UnflodModelAdmin)
 admin.site.register(Notification, UnflodModelAdmin)
 admin.site.register(Floor, UnflodModelAdmin)
@@ -118,14 +142,18 @@ admin.site.register(MessType, UnflodModelAdmin)
 
 admin.site.register(CreditUser, UnflodModelAdmin)
 admin.site.register(CreditOrder, UnflodModelAdmin)
+admin.site.register(CreditReminder, UnflodModelAdmin)
+admin.site.register(OutboundMessage, UnflodModelAdmin)
+admin.site.register(PrintJob, UnflodModelAdmin)
 admin.site.register(MessTransaction, UnflodModelAdmin)
     
 admin.site.register(LogoInfo, UnflodModelAdmin)
 
 @admin.register(SidebarItem)
-class SidebarItemAdmin(UnflodModelAdmin,ImportExportModelAdmin):
+class SidebarItemAdmin(BulkImportMixin, UnflodModelAdmin,ImportExportModelAdmin):
     import_form_class = ImportForm
     export_form_class = ExportForm
+    import_resource_classes = [SidebarItemResource]
     list_display = ('label', 'path', 'icon', 'active_status')
     list_filter = ('active',)
     search_fields = ('label', 'path')
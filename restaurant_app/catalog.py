@@ -0,0 +1,140 @@
+"""
+Menu catalog snapshot for POS terminals.
+
+The whole menu (categories, dishes with sizes, variants, online order
+platforms and FOC products) is serialised once per catalog version and
+kept in process memory, so booting a terminal costs one version lookup
+instead of six list requests and a query per dish.
+"""
+import hashlib
+import threading
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Prefetch, Value
+from django.db.models.functions import Round
+from rest_framework.renderers import JSONRenderer
+
+from .models import (
+    Category,
+    Dish,
+    DishSize,
+    DishVariant,
+    FOCProduct,
+    Menu,
+    MenuItem,
+    OnlineOrder,
+    bump_catalog_version,
+    get_catalog_version,
+)
+from .serializers import (
+    CategorySerializer,
+    DishSerializer,
+    DishVariantSerializer,
+    FOCProductSerializer,
+    OnlineOrderSerializer,
+)
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+class CatalogSnapshot:
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        self.etag = f'"{version}-{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def build_catalog(request=None):
+    context = {'request': request}
+    dishes = Dish.objects.select_related('category').prefetch_related(
+        Prefetch('size', queryset=DishSize.objects.order_by('id'))
+    ).order_by('id')
+    return {
+        'categories': CategorySerializer(Category.objects.order_by('id'), many=True, context=context).data,
+        'dishes': DishSerializer(dishes, many=True, context=context).data,
+        'variants': DishVariantSerializer(DishVariant.objects.order_by('id'), many=True, context=context).data,
+        'online_orders': OnlineOrderSerializer(OnlineOrder.objects.order_by('id'), many=True, context=context).data,
+        'foc_products': FOCProductSerializer(FOCProduct.objects.order_by('id'), many=True, context=context).data,
+    }
+
+
+def get_catalog_snapshot(request=None):
+    """
+    Current snapshot, rebuilt only when the catalog version has moved.
+    Image URLs are absolute, so snapshots are kept per scheme and host.
+    """
+    version = get_catalog_version()
+    host = f"{request.scheme}://{request.get_host()}" if request else ''
+    snapshot = _snapshots.get(host)
+    if snapshot and snapshot.version == version:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshots.get(host)
+        if snapshot and snapshot.version == version:
+            return snapshot
+        data = build_catalog(request)
+        data = {'version': version, **data}
+        snapshot = CatalogSnapshot(version, JSONRenderer().render(data))
+        _snapshots[host] = snapshot
+    return snapshot
+
+
+# Dish.price and DishSize.price are max_digits=6, decimal_places=2
+MAX_PRICE = Decimal("9999.99")
+
+
+class PriceAdjustmentError(Exception):
+    pass
+
+
+def adjusted_price(field, percent, round_to):
+    """SQL expression: `field` changed by `percent`, rounded to a multiple of `round_to`."""
+    factor = Value(1 + percent / Decimal(100))
+    step = Value(round_to)
+    return ExpressionWrapper(
+        Round(F(field) * factor / step) * step,
+        output_field=DecimalField(max_digits=6, decimal_places=2),
+    )
+
+
+def adjust_prices(percent, round_to=Decimal("0.01"), category=None, dish_ids=None, include_sizes=True):
+    """
+    Change the price of every matching dish with one UPDATE (and one more
+    for their sizes). Menus holding those dishes get their totals refreshed
+    and the catalog version moves once. Returns the number of dishes changed.
+    Raises PriceAdjustmentError, changing nothing, if a price would go
+    above MAX_PRICE.
+    """
+    dishes = Dish.objects.all()
+    if category is not None:
+        dishes = dishes.filter(category=category)
+    if dish_ids is not None:
+        dishes = dishes.filter(id__in=dish_ids)
+
+    with transaction.atomic():
+        # Rounding keeps the order of prices, so the highest one tells
+        # whether any row would overflow the column
+        highest = [dishes.aggregate(highest=Max("price"))["highest"]]
+        if include_sizes:
+            highest.append(DishSize.objects.filter(dish__in=dishes.values("id")).aggregate(highest=Max("price"))["highest"])
+        highest = max((price for price in highest if price is not None), default=None)
+        if highest is not None:
+            steps = (highest * (1 + percent / Decimal(100)) / round_to).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+            if steps * round_to > MAX_PRICE:
+                raise PriceAdjustmentError(
+                    f"A price of {highest} would become {steps * round_to}, above the maximum of {MAX_PRICE}."
+                )
+
+        changed = dishes.update(price=adjusted_price("price", percent, round_to))
+        if include_sizes:
+            DishSize.objects.filter(dish__in=dishes.values("id")).update(
+                price=adjusted_price("price", percent, round_to)
+            )
+        Menu.refresh_sub_totals(Menu.objects.filter(
+            pk__in=MenuItem.objects.filter(dish__in=dishes.values("id")).values("menu_id")
+        ))
+        bump_catalog_version()
+    return changed
@@ -0,0 +1,174 @@
+"""
+Credit customer reports: aging of what is owed, and a per-customer
+statement of orders and payments with a running balance.
+
+Both are computed from history (credit orders and CreditTransaction), not
+from the stored CreditUser.total_due.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import (
+    Count, DecimalField, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, Window,
+)
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import CreditOrder, CreditTransaction, CreditUser
+
+ZERO = Decimal("0.00")
+CENTS = Decimal("0.01")
+
+# Oldest first, which is the order payments are applied in
+AGING_BUCKETS = ("days_90_plus", "days_60", "days_30", "current")
+
+
+def money(expression):
+    return Coalesce(expression, Value(ZERO), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def per_credit_user(queryset, aggregate):
+    """Correlated subquery of one aggregate over a customer's rows."""
+    return Subquery(
+        queryset.filter(credit_user=OuterRef("pk")).order_by().values("credit_user")
+        .annotate(value=aggregate).values("value")
+    )
+
+
+def annotate_credit_summary(queryset):
+    """
+    Counters that stand in for the nested credit orders in list views.
+    Each is its own subquery, so orders and payments don't multiply each
+    other as they would in a join.
+    """
+    ordered = money(per_credit_user(CreditOrder.objects.all(), Sum("order__total_amount")))
+    paid = money(per_credit_user(CreditTransaction.objects.all(), Sum("received_amount")))
+    return queryset.annotate(
+        order_count=Coalesce(per_credit_user(CreditOrder.objects.all(), Count("id")), 0),
+        last_order_date=per_credit_user(CreditOrder.objects.all(), Max("order__created_at")),
+        last_payment_date=per_credit_user(CreditTransaction.objects.all(), Max("date")),
+        ordered_amount=ordered,
+        paid_amount=paid,
+        outstanding=ordered - paid,
+    )
+
+
+def aging_report(as_of=None):
+    """
+    Outstanding credit per customer split by order age: current (under 30
+    days), 30, 60 and 90+ days. Orders are summed per bucket and payments
+    per customer in one grouped query; payments then settle the oldest
+    buckets first.
+    """
+    as_of = as_of or timezone.now().date()
+    order_day = "credit_orders__order__created_at__date"
+    amount = "credit_orders__order__total_amount"
+    bucket_filters = {
+        "current": Q(**{f"{order_day}__gt": as_of - timedelta(days=30)}),
+        "days_30": Q(**{f"{order_day}__gt": as_of - timedelta(days=60), f"{order_day}__lte": as_of - timedelta(days=30)}),
+        "days_60": Q(**{f"{order_day}__gt": as_of - timedelta(days=90), f"{order_day}__lte": as_of - timedelta(days=60)}),
+        "days_90_plus": Q(**{f"{order_day}__lte": as_of - timedelta(days=90)}),
+    }
+    paid = (
+        CreditTransaction.objects.filter(credit_user=OuterRef("pk"), date__lte=as_of)
+        .order_by().values("credit_user").annotate(total=Sum("received_amount")).values("total")
+    )
+    rows = (
+        CreditUser.objects.order_by()
+        .annotate(
+            **{
+                bucket: money(Sum(amount, filter=condition & Q(**{f"{order_day}__lte": as_of})))
+                for bucket, condition in bucket_filters.items()
+            },
+            paid=money(Subquery(paid)),
+        )
+        .values("id", "username", "mobile_number", "due_date", "limit_amount", "is_active", "paid", *AGING_BUCKETS)
+    )
+
+    results = []
+    for row in rows:
+        unapplied = row.pop("paid")
+        for bucket in AGING_BUCKETS:
+            applied = min(unapplied, row[bucket])
+            row[bucket] -= applied
+            unapplied -= applied
+        row["outstanding"] = sum(row[bucket] for bucket in AGING_BUCKETS)
+        row["advance"] = unapplied
+        for field in (*AGING_BUCKETS, "outstanding", "advance"):
+            row[field] = row[field].quantize(CENTS)
+        results.append(row)
+    results.sort(key=lambda row: tuple(-row[bucket] for bucket in AGING_BUCKETS))
+    return results
+
+
+def statement_queryset(credit_user):
+    """
+    Orders (debit) and payments (credit) of one customer, oldest first,
+    each with the balance after it. Within a day orders come before
+    payments.
+
+    Each half gets its running total from a window function and adds the
+    other half's total up to the same point from a correlated subquery, so
+    the union can be paginated by the database with correct balances on
+    every page.
+    """
+    orders = CreditOrder.objects.filter(credit_user=credit_user)
+    payments = CreditTransaction.objects.filter(credit_user=credit_user)
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+
+    payments_before_day = (
+        payments.filter(date__lt=OuterRef("entry_date"))
+        .order_by().values("credit_user").annotate(total=Sum("received_amount")).values("total")
+    )
+    order_entries = (
+        orders.annotate(
+            entry_date=TruncDate("order__created_at"),
+            entry_type=Value("order"),
+            sequence=Value(0, output_field=IntegerField()),
+            entry_id=F("order_id"),
+            reference=F("order__invoice_number"),
+            debit=money(F("order__total_amount")),
+            credit=Value(ZERO, output_field=decimal),
+            running_balance=Window(
+                Sum("order__total_amount"), order_by=[TruncDate("order__created_at").asc(), F("id").asc()]
+            ) - money(Subquery(payments_before_day)),
+        )
+        .order_by()
+        .values_list("entry_date", "sequence", "entry_id", "entry_type", "reference", "debit", "credit", "running_balance")
+    )
+
+    orders_to_day = (
+        orders.filter(order__created_at__date__lte=OuterRef("date"))
+        .order_by().values("credit_user").annotate(total=Sum("order__total_amount")).values("total")
+    )
+    payment_entries = (
+        payments.annotate(
+            entry_date=F("date"),
+            entry_type=Value("payment"),
+            sequence=Value(1, output_field=IntegerField()),
+            entry_id=F("id"),
+            reference=F("payment_method"),
+            debit=Value(ZERO, output_field=decimal),
+            credit=money(F("received_amount")),
+            running_balance=money(Subquery(orders_to_day)) - Window(
+                Sum("received_amount"), order_by=[F("date").asc(), F("id").asc()]
+            ),
+        )
+        .order_by()
+        .values_list("entry_date", "sequence", "entry_id", "entry_type", "reference", "debit", "credit", "running_balance")
+    )
+    return order_entries.union(payment_entries, all=True).order_by("entry_date", "sequence", "entry_id")
+
+
+STATEMENT_FIELDS = ("date", "sequence", "id", "type", "reference", "debit", "credit", "balance")
+
+
+def statement_rows(entries):
+    rows = []
+    for entry in entries:
+        row = dict(zip(STATEMENT_FIELDS, entry))
+        row.pop("sequence")
+        for field in ("debit", "credit", "balance"):
+            row[field] = Decimal(row[field]).quantize(CENTS)
+        rows.append(row)
+    return rows
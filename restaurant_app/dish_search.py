@@ -0,0 +1,250 @@
+"""
+In-memory dish search.
+
+Dish names (English and Arabic) and descriptions are split into words and
+indexed by padded trigrams, the same scheme as Postgres pg_trgm. A query
+only scores dishes that share trigrams with it, so prefixes, substrings and
+typos ("chiken") are all found without scanning the table, and results are
+ranked by match quality with sales popularity as a tie-breaker.
+
+The index is rebuilt whenever the catalog version moves (any Dish change
+bumps it). Popularity is refreshed every POPULARITY_TTL seconds on a
+background thread; searches keep ranking with the previous counts meanwhile.
+"""
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import Lower
+
+from .models import Dish, OrderItem, get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_TTL = 600
+SIMILARITY_THRESHOLD = 0.3
+
+# Relative weight of a match in each field
+FIELD_WEIGHTS = {'name': 1.0, 'arabic_name': 1.0, 'description': 0.5}
+
+ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ة': 'ه', 'ؤ': 'و', 'ئ': 'ي',
+    'ـ': None,  # tatweel
+})
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lowercase, drop accents and Arabic diacritics, fold Arabic letter variants."""
+    text = unicodedata.normalize('NFKD', text or '').translate(ARABIC_FOLDING)
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return WORD_RE.findall(normalize(text))
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance_within_one(a, b):
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+def word_score(token, token_grams, word, word_grams):
+    if word == token:
+        return 1.0
+    if word.startswith(token):
+        return 0.9
+    if token in word:
+        return 0.7
+    similarity = len(token_grams & word_grams) / len(token_grams | word_grams)
+    if similarity >= SIMILARITY_THRESHOLD:
+        return 0.6 * similarity
+    # Short words share too few trigrams to survive a typo, allow one edit
+    if len(token) >= 4 and edit_distance_within_one(token, word):
+        return 0.3
+    return 0.0
+
+
+class DishSearchIndex:
+    """
+    Words are indexed once however many dishes use them, so a query scores
+    each distinct candidate word and then fans out to its dishes.
+    """
+    def __init__(self, dishes, sold_by_dish=None, sold_by_name=None):
+        self.words = []  # word id -> (word, trigrams)
+        self.word_dishes = []  # word id -> {dish id: field weight}
+        self.postings = defaultdict(set)  # trigram -> word ids
+        self.names = {}  # dish id -> normalized name, for sales not linked to a dish
+
+        word_ids = {}
+        for dish_id, name, arabic_name, description in dishes:
+            self.names[dish_id] = normalize(name).strip()
+            for field, text in (('name', name), ('arabic_name', arabic_name), ('description', description)):
+                for word in tokenize(text):
+                    word_id = word_ids.get(word)
+                    if word_id is None:
+                        word_id = word_ids[word] = len(self.words)
+                        grams = trigrams(word)
+                        self.words.append((word, grams))
+                        self.word_dishes.append({})
+                        for gram in grams:
+                            self.postings[gram].add(word_id)
+                    weights = self.word_dishes[word_id]
+                    weights[dish_id] = max(weights.get(dish_id, 0.0), FIELD_WEIGHTS[field])
+        self.set_popularity(sold_by_dish or {}, sold_by_name or {})
+
+    def set_popularity(self, sold_by_dish, sold_by_name):
+        """Swap in new sales counts, keyed by dish id and by name for unlinked items."""
+        sold = {
+            dish_id: sold_by_dish.get(dish_id, 0) + sold_by_name.get(name, 0)
+            for dish_id, name in self.names.items()
+        }
+        top_sold = max(sold.values(), default=0)
+        self.popularity = {
+            dish_id: math.log1p(count) / math.log1p(top_sold) if top_sold else 0.0
+            for dish_id, count in sold.items()
+        }
+
+    def candidate_words(self, token, grams):
+        if len(token) < 3:
+            # Too short for typo tolerance: only words starting with it
+            return self.postings.get(f"  {token}"[:3] if len(token) == 1 else f" {token}", set())
+        hits = Counter()
+        for gram in grams:
+            hits.update(self.postings.get(gram, ()))
+        needed = max(1, math.ceil(len(grams) * SIMILARITY_THRESHOLD) - 1)
+        return {word_id for word_id, count in hits.items() if count >= needed}
+
+    def match_token(self, token, grams):
+        """Best weighted score per dish for one query word."""
+        scores = {}
+        for word_id in self.candidate_words(token, grams):
+            word, word_grams = self.words[word_id]
+            score = word_score(token, grams, word, word_grams)
+            if not score:
+                continue
+            for dish_id, weight in self.word_dishes[word_id].items():
+                if weight * score > scores.get(dish_id, 0.0):
+                    scores[dish_id] = weight * score
+        return scores
+
+    def search(self, query, limit=50):
+        tokens = [(token, trigrams(token)) for token in tokenize(query)]
+        if not tokens:
+            return []
+
+        totals = None
+        for token, grams in tokens:
+            scores = self.match_token(token, grams)
+            if totals is None:
+                totals = scores
+            else:
+                # Every query word has to match something in the dish
+                totals = {dish_id: total + scores[dish_id] for dish_id, total in totals.items() if dish_id in scores}
+
+        ranked = sorted(
+            (-(total / len(tokens) + 0.1 * self.popularity[dish_id]), dish_id)
+            for dish_id, total in totals.items()
+        )
+        return [dish_id for _, dish_id in ranked[:limit]]
+
+
+_index = None
+_index_version = None
+_sales = ({}, {})  # (sold by dish id, sold by name) from the last refresh
+_sales_refreshed_at = None
+_refreshing = False
+_lock = threading.Lock()
+
+
+def load_sales():
+    """Quantities sold per dish id, and per name for order items with no dish link."""
+    sold_by_dish = dict(
+        OrderItem.objects.filter(dish__isnull=False).values('dish_id').annotate(
+            sold=Sum('quantity')
+        ).values_list('dish_id', 'sold')
+    )
+    # Items from before dish ids were recorded only have the name
+    sold_by_name = Counter()
+    unlinked = OrderItem.objects.filter(dish__isnull=True).annotate(name=Lower('dish_name')).values('name').annotate(
+        sold=Sum('quantity')
+    ).values_list('name', 'sold')
+    for name, sold in unlinked:
+        sold_by_name[normalize(name).strip()] += sold or 0
+    return sold_by_dish, sold_by_name
+
+
+def refresh_popularity():
+    """Reload the sales counts and re-rank the live index with them."""
+    global _sales, _sales_refreshed_at
+    sales = load_sales()
+    with _lock:
+        _sales = sales
+        _sales_refreshed_at = time.monotonic()
+        if _index is not None:
+            _index.set_popularity(*sales)
+
+
+def _refresh_in_thread():
+    global _refreshing
+    try:
+        refresh_popularity()
+    except Exception:
+        logger.exception("Dish popularity refresh failed")
+    finally:
+        _refreshing = False
+        # The refresh thread's own connection
+        connection.close()
+
+
+def _start_refresh():
+    threading.Thread(target=_refresh_in_thread, name="dish-popularity", daemon=True).start()
+
+
+def get_index():
+    global _index, _index_version, _refreshing
+    version = get_catalog_version()
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                dishes = Dish.objects.values_list('id', 'name', 'arabic_name', 'description')
+                _index = DishSearchIndex(dishes, *_sales)
+                _index_version = version
+
+    # Stale counts are still served; one thread at a time reloads them
+    stale = _sales_refreshed_at is None or time.monotonic() - _sales_refreshed_at >= POPULARITY_TTL
+    if stale and not _refreshing:
+        with _lock:
+            start, _refreshing = not _refreshing, True
+        if start:
+            try:
+                _start_refresh()
+            except Exception:
+                _refreshing = False
+                raise
+    return _index
+
+
+def search_dishes(query, limit=50):
+    """Ids of the dishes matching `query`, best match first."""
+    return get_index().search(query, limit)
@@ -0,0 +1,150 @@
+"""
+Resized derivatives of uploaded images.
+
+Dish, Category, OnlineOrder and LogoInfo images are uploaded straight from
+phones and can be several megabytes. After an upload is committed a
+background thread writes a thumbnail and a medium copy of it, each as JPEG
+(PNG when the image has transparency) and WebP. File names carry a hash
+of the source content, so a derivative never changes once written and can
+be cached forever by clients.
+
+The names are stored in a JSON field next to the image (`image_variants`
+for `image`, `<field>_variants` otherwise) so serializers build the URLs
+without touching the disk or the database.
+"""
+import hashlib
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = "derived"
+
+# name -> longest side in pixels
+DERIVATIVE_SIZES = {
+    "thumbnail": 240,
+    "medium": 800,
+}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-derivatives")
+
+
+def variants_field_name(field_name):
+    return "image_variants" if field_name == "image" else f"{field_name}_variants"
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == "JPEG":
+        image.convert("RGB").save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+    elif fmt == "PNG":
+        image.save(buffer, "PNG", optimize=True)
+    else:
+        image.save(buffer, "WEBP", quality=80, method=4)
+    return buffer.getvalue()
+
+
+def build_derivatives(source_name, storage=default_storage):
+    """
+    Write the derivatives of `source_name` and return the variants mapping.
+    Derivatives already on disk (same content hash) are reused.
+    """
+    with storage.open(source_name, "rb") as source:
+        content = source.read()
+    digest = hashlib.sha256(content).hexdigest()[:16]
+
+    image = Image.open(BytesIO(content))
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    fallback_format, fallback_ext = ("PNG", "png") if has_alpha else ("JPEG", "jpg")
+    stem = posixpath.splitext(posixpath.basename(source_name))[0][:40]
+
+    variants = {"source": source_name}
+    for size_name, longest_side in DERIVATIVE_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((longest_side, longest_side), Image.LANCZOS)
+        for key, fmt, ext in ((size_name, fallback_format, fallback_ext), (f"{size_name}_webp", "WEBP", "webp")):
+            name = posixpath.join(DERIVATIVES_DIR, f"{stem}.{digest}.{size_name}.{ext}")
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(_encode(resized, fmt)))
+            variants[key] = name
+    return variants
+
+
+def generate_for_instance(model, pk, field_name):
+    """
+    Build derivatives for one image field and store the mapping. Skips the
+    write if the image was replaced again while the derivatives were built.
+    """
+    from .models import LogoInfo, bump_catalog_version
+
+    source_name = model.objects.filter(pk=pk).values_list(field_name, flat=True).first()
+    if not source_name:
+        return None
+    variants = build_derivatives(source_name)
+    updated = model.objects.filter(pk=pk, **{field_name: source_name}).update(
+        **{variants_field_name(field_name): variants}
+    )
+    if updated and model is not LogoInfo:
+        # The catalog snapshot carries the derivative URLs
+        bump_catalog_version()
+    return variants
+
+
+def _generate_safely(model, pk, field_name):
+    try:
+        generate_for_instance(model, pk, field_name)
+    except Exception:
+        logger.exception("Could not build image derivatives for %s %s.%s", model.__name__, pk, field_name)
+    finally:
+        close_old_connections()
+
+
+def is_field_default(model, field_name, name):
+    """True for the placeholder a field falls back to (e.g. default_dish_image.jpg)."""
+    default = model._meta.get_field(field_name).default
+    return isinstance(default, str) and name == default
+
+
+def schedule_derivatives(instance, field_names):
+    """
+    Queue derivative generation for every image field whose file differs
+    from the one its variants were built from. Runs after commit, in a
+    background thread. Field defaults are placeholders and are skipped.
+    """
+    for field_name in field_names:
+        name = getattr(instance, field_name).name
+        variants = getattr(instance, variants_field_name(field_name)) or {}
+        if name and variants.get("source") != name and not is_field_default(type(instance), field_name, name):
+            transaction.on_commit(
+                lambda model=type(instance), pk=instance.pk, field_name=field_name:
+                    _executor.submit(_generate_safely, model, pk, field_name)
+            )
+
+
+def variant_urls(fieldfile, variants, request=None):
+    """
+    URLs of the original image and each derivative. Falls back to the
+    original for derivatives that are not built yet.
+    """
+    if not fieldfile:
+        return None
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if request else url
+
+    original = absolute(fieldfile.url)
+    current = variants if variants and variants.get("source") == fieldfile.name else {}
+    urls = {"original": original}
+    for size_name in DERIVATIVE_SIZES:
+        for key in (size_name, f"{size_name}_webp"):
+            urls[key] = absolute(default_storage.url(current[key])) if key in current else original
+    return urls
@@ -0,0 +1,158 @@
+"""
+PDF invoices.
+
+Orders are loaded as plain dicts (one query for the orders and one for
+all their items, however many orders) and drawn by pdf_render. Each
+order's PDF is cached under a fingerprint of its data and the company
+details, the same versioning the e-receipts use, so re-running a period
+only renders what changed.
+
+The print logo (its medium derivative when there is one) is read from
+storage once per process and handed to the renderer as bytes instead of
+being downloaded for every invoice.
+
+Web requests always render in their own process. The render_invoices
+command passes INVOICE_PDF["workers"], and then batches of more than
+INVOICE_PDF["inline_below"] uncached orders are rendered in a process
+pool, INVOICE_PDF["chunk_size"] orders per task.
+A period can be returned as a zip with a PDF per order or as one PDF
+with a page per order. There is no PDF merge library here, so the single
+document is drawn in one process from the bulk-loaded data (still cached
+as a whole); the zip is the fast path for big month-end runs.
+"""
+import io
+import logging
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from .models import LogoInfo, Order, OrderItem
+from .pdf_render import render_each, render_orders
+from .receipts import RECEIPT_COMPANY_FIELDS, RECEIPT_ORDER_FIELDS, fingerprint
+
+logger = logging.getLogger(__name__)
+
+INVOICE_ORDER_FIELDS = RECEIPT_ORDER_FIELDS + ("user__username",)
+INVOICE_ITEM_FIELDS = ("order_id", "dish_name", "size_name", "quantity", "price")
+
+_logo_lock = threading.Lock()
+_logo = (None, None)  # (storage name, bytes)
+
+
+def load_company():
+    company = LogoInfo.objects.values(*RECEIPT_COMPANY_FIELDS, "print_logo", "print_logo_variants").first() or {}
+    variants = company.pop("print_logo_variants", None) or {}
+    name = company.pop("print_logo", None) or None
+    if name and variants.get("source") == name:
+        name = variants.get("medium") or name
+    company["logo"] = name
+    return company
+
+
+def print_logo_bytes(name):
+    """Content of the print logo file, read once per process."""
+    global _logo
+    if not name:
+        return None
+    with _logo_lock:
+        if _logo[0] != name:
+            try:
+                with default_storage.open(name, "rb") as logo_file:
+                    _logo = (name, logo_file.read())
+            except OSError:
+                logger.warning("Print logo %s could not be read, invoices are rendered without it", name)
+                _logo = (name, None)
+        return _logo[1]
+
+
+def load_orders(queryset):
+    """Invoice dicts of the orders in `queryset`, each with its "items"."""
+    orders = list(queryset.order_by("created_at", "id").values(*INVOICE_ORDER_FIELDS))
+    by_id = {}
+    for order in orders:
+        order["items"] = []
+        by_id[order["id"]] = order
+    items = OrderItem.objects.filter(order__in=queryset.values("id")).order_by("order_id", "id")
+    for item in items.values(*INVOICE_ITEM_FIELDS):
+        order = by_id.get(item.pop("order_id"))
+        if order is not None:
+            order["items"].append(item)
+    return orders
+
+
+def period_orders(from_date, to_date):
+    return Order.objects.filter(created_at__date__range=(from_date, to_date)).exclude(status="cancelled")
+
+
+def cache_key(order, company):
+    return f"invoice_pdf:{order['id']}:{fingerprint([order, company])}"
+
+
+def _render(orders, company, workers):
+    config = settings.INVOICE_PDF
+    logo = print_logo_bytes(company["logo"])
+    if len(orders) <= config["inline_below"] or workers <= 1:
+        return render_each(orders, company, logo)
+
+    size = config["chunk_size"]
+    chunks = [orders[start:start + size] for start in range(0, len(orders), size)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        results = pool.map(render_each, chunks, repeat(company), repeat(logo))
+        return [rendered for chunk in results for rendered in chunk]
+
+
+def render_invoices(orders, company, workers=1):
+    """
+    {order id: PDF bytes} for invoice dicts, from the cache where possible.
+    More than one worker starts a process pool: management commands only.
+    """
+    keys = {order["id"]: cache_key(order, company) for order in orders}
+    cached = cache.get_many(list(keys.values()))
+    pdfs = {order_id: cached[key] for order_id, key in keys.items() if key in cached}
+
+    missing = [order for order in orders if order["id"] not in pdfs]
+    if missing:
+        rendered = dict(_render(missing, company, workers))
+        cache.set_many({keys[order_id]: pdf for order_id, pdf in rendered.items()}, settings.INVOICE_PDF["cache_timeout"])
+        pdfs.update(rendered)
+    return pdfs
+
+
+def order_invoice_pdf(order_id):
+    """PDF bytes of an order's invoice, or None if the order doesn't exist."""
+    orders = load_orders(Order.objects.filter(pk=order_id))
+    if not orders:
+        return None
+    return render_invoices(orders, load_company())[order_id]
+
+
+def invoice_filename(order):
+    return f"invoice-{order['invoice_number'] or order['id']}.pdf"
+
+
+def period_invoices_zip(from_date, to_date, workers=1):
+    """Zip with a PDF per order of the period."""
+    orders = load_orders(period_orders(from_date, to_date))
+    pdfs = render_invoices(orders, load_company(), workers)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for order in orders:
+            archive.writestr(invoice_filename(order), pdfs[order["id"]])
+    return buffer.getvalue()
+
+
+def period_invoices_pdf(from_date, to_date):
+    """One PDF with a page per order of the period."""
+    orders = load_orders(period_orders(from_date, to_date))
+    company = load_company()
+    key = f"invoice_pdf_period:{fingerprint([cache_key(order, company) for order in orders])}"
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = render_orders(orders, company, print_logo_bytes(company["logo"]))
+        cache.set(key, pdf, settings.INVOICE_PDF["cache_timeout"])
+    return pdf
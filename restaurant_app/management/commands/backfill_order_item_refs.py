@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from restaurant_app.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Link order items recorded before OrderItem had dish/size/category ids to the catalog "
+        "by name. Works in id order and only touches unlinked rows, so it can be stopped and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--start-id', type=int, default=0, help="Resume after this OrderItem id.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        catalog_maps = OrderItem.catalog_maps()
+        last_id = options['start_id']
+        linked = scanned = 0
+
+        while True:
+            batch = list(
+                OrderItem.objects.filter(id__gt=last_id, dish__isnull=True)
+                .order_by('id')
+                .only('id', 'dish_name', 'size_name', 'category_name', 'dish_id', 'size_id', 'category_id')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            changed = [item for item in batch if item.link_catalog(*catalog_maps)]
+            OrderItem.objects.bulk_update(changed, ['dish', 'size', 'category'])
+            linked += len(changed)
+            scanned += len(batch)
+            self.stdout.write(f"Up to id {last_id}: {linked} of {scanned} items linked")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {linked} items linked, {scanned - linked} without a matching dish."))
@@ -0,0 +1,68 @@
+import csv
+from itertools import islice
+
+import tablib
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant_app.resources import BULK_RESOURCES
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a CSV file into Category, Dish, CustomerDetails or SidebarItem with batched "
+        "bulk writes. The file is read in chunks, so large files never sit in memory whole."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(BULK_RESOURCES))
+        parser.add_argument('path', help="CSV file with a header row")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would change.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows read and imported at a time.")
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        resource = BULK_RESOURCES[options['model']](html_diff=False)
+        totals = {}
+        row_offset = 0
+        try:
+            csv_file = open(options['path'], newline='', encoding=options['encoding'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with csv_file:
+            reader = csv.reader(csv_file)
+            headers = next(reader, None)
+            if not headers:
+                raise CommandError("The file is empty.")
+            while True:
+                rows = list(islice(reader, options['chunk_size']))
+                if not rows:
+                    break
+                result = resource.import_data(
+                    tablib.Dataset(*rows, headers=headers), dry_run=options['dry_run'], raise_errors=False
+                )
+                self.report_errors(result, row_offset)
+                if result.has_errors():
+                    # import-export rolls the whole chunk back on row errors
+                    self.stderr.write(
+                        f"Rows {row_offset + 1}-{row_offset + len(rows)} were not imported because of the errors above."
+                    )
+                    totals['rolled back'] = totals.get('rolled back', 0) + len(rows)
+                else:
+                    for import_type, count in result.totals.items():
+                        totals[import_type] = totals.get(import_type, 0) + count
+                row_offset += len(rows)
+                self.stdout.write(f"{row_offset} rows processed")
+
+        summary = ", ".join(f"{count} {import_type}" for import_type, count in totals.items() if count)
+        prefix = "Dry run: " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{summary or 'nothing to import'}"))
+
+    def report_errors(self, result, row_offset):
+        for error in result.base_errors:
+            self.stderr.write(f"Error: {error.error}")
+        for row_number, errors in result.row_errors():
+            for error in errors:
+                self.stderr.write(f"Row {row_offset + row_number}: {error.error}")
+        for invalid in result.invalid_rows:
+            self.stderr.write(f"Row {row_offset + invalid.number}: {invalid.error_dict}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from restaurant_app.images import generate_for_instance, is_field_default, variants_field_name
+from restaurant_app.models import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Build thumbnail, medium and WebP derivatives for images that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild derivatives even when they are up to date.")
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        for model, field_names in IMAGE_FIELDS.items():
+            for field_name in field_names:
+                rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                for pk, name, variants in rows.values_list('pk', field_name, variants_field_name(field_name)).iterator():
+                    if is_field_default(model, field_name, name):
+                        continue
+                    if not options['all'] and (variants or {}).get('source') == name:
+                        continue
+                    try:
+                        generate_for_instance(model, pk, field_name)
+                        built += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"{model.__name__} {pk} {field_name}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {built} images, {failed} failed."))
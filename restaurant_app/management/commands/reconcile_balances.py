@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Round
+from django.db.models.lookups import GreaterThanOrEqual
+
+from restaurant_app.models import CreditOrder, CreditTransaction, CreditUser, Mess, MessTransaction
+
+ZERO = Value(Decimal("0.00"))
+CENT = Decimal("0.01")
+
+
+def money(value):
+    """Two decimal places for the report, whatever type the backend returned."""
+    return Decimal(str(value)).quantize(CENT)
+
+
+def history_sum(queryset, group_by, field):
+    """Per-row total of `field` over `queryset`, as a correlated subquery."""
+    totals = queryset.order_by().values(group_by).annotate(total=Sum(field)).values("total")
+    return Round(Coalesce(Subquery(totals), ZERO), 2)
+
+
+def mess_balances():
+    transactions = MessTransaction.objects.filter(mess=OuterRef("pk"))
+    paid = history_sum(transactions, "mess", "received_amount")
+    return {
+        "paid_amount": paid,
+        # pending + paid is what the customer owes in total; keep that
+        "pending_amount": F("pending_amount") + F("paid_amount") - paid,
+        "cash_amount": history_sum(transactions, "mess", "cash_amount"),
+        "bank_amount": history_sum(transactions, "mess", "bank_amount"),
+    }
+
+
+def credit_balances():
+    ordered = history_sum(
+        CreditOrder.objects.filter(credit_user=OuterRef("pk")), "credit_user", "order__total_amount"
+    )
+    received = history_sum(
+        CreditTransaction.objects.filter(credit_user=OuterRef("pk")), "credit_user", "received_amount"
+    )
+    total_due = ordered - received
+    return {
+        "total_due": total_due,
+        "is_active": Case(
+            When(GreaterThanOrEqual(total_due, F("limit_amount")), then=False),
+            default=F("is_active"),
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Mess paid/pending/cash/bank amounts from MessTransaction and CreditUser "
+        "total_due from credit orders minus CreditTransaction, and report the rows that drifted. "
+        "Nothing is written without --apply. "
+        "Only payments with a history row are counted: make_payment did not write a "
+        "CreditTransaction before balance changes became atomic, and older messes may lack "
+        "their initial MessTransaction, so on data from before that change --apply would put "
+        "those payments back on the balance. Review the report (credit users that would owe "
+        "more are counted separately) and backfill missing history rows before applying. "
+        "Messes without any transaction and credit users without any history are left alone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true', help="Write the recomputed balances (default: report only).")
+        parser.add_argument('--only', choices=['mess', 'credit'], help="Reconcile one kind of balance.")
+
+    def reconcile(self, label, queryset, balances, compared, apply):
+        # Compare the stored values with the recomputed ones in the database
+        annotated = queryset.annotate(**{f"expected_{field}": balances[field] for field in compared})
+        drift = Q()
+        for field in compared:
+            drift |= ~Q(**{field: F(f"expected_{field}")})
+        drifted = annotated.filter(drift)
+
+        for row in drifted.values("pk", *compared, *(f"expected_{field}" for field in compared))[:20]:
+            changes = ", ".join(
+                f"{field} {money(row[field])} -> {money(row[f'expected_{field}'])}"
+                for field in compared if row[field] != row[f"expected_{field}"]
+            )
+            self.stdout.write(f"{label} {row['pk']}: {changes}")
+
+        if apply:
+            # One UPDATE for every drifted row
+            with transaction.atomic():
+                count = queryset.model.objects.filter(pk__in=drifted.values("pk")).update(**balances)
+        else:
+            count = drifted.count()
+        verb = "updated" if apply else "would be updated"
+        self.stdout.write(self.style.SUCCESS(f"{label}: {count} {verb}."))
+        return annotated
+
+    def handle(self, *args, **options):
+        apply = options['apply']
+        if options['only'] in (None, 'mess'):
+            self.reconcile(
+                "Mess",
+                Mess.objects.filter(Exists(MessTransaction.objects.filter(mess=OuterRef("pk")))),
+                mess_balances(),
+                ["paid_amount", "cash_amount", "bank_amount"],
+                apply,
+            )
+        if options['only'] in (None, 'credit'):
+            credit_users = self.reconcile(
+                "Credit user",
+                CreditUser.objects.filter(
+                    Exists(CreditOrder.objects.filter(credit_user=OuterRef("pk")))
+                    | Exists(CreditTransaction.objects.filter(credit_user=OuterRef("pk")))
+                ),
+                credit_balances(),
+                ["total_due"],
+                apply,
+            )
+            if not apply:
+                # Usually a payment made before make_payment kept a history row
+                raised = credit_users.filter(expected_total_due__gt=F("total_due")).count()
+                if raised:
+                    self.stdout.write(self.style.WARNING(
+                        f"Credit user: {raised} would owe more than stored; check for payments "
+                        "without a CreditTransaction before using --apply."
+                    ))
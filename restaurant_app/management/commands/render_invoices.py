@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from restaurant_app.invoices import period_invoices_pdf, period_invoices_zip
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the invoices of a period to a file: a zip with a PDF per order (rendered by "
+        "INVOICE_PDF['workers'] processes) or, with --pdf, one PDF with a page per order."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('from_date', help="First day, YYYY-MM-DD.")
+        parser.add_argument('to_date', help="Last day, YYYY-MM-DD.")
+        parser.add_argument('--output', '-o', help="File to write (default: invoices-<from>-<to>.zip/.pdf).")
+        parser.add_argument('--pdf', action='store_true', help="Write one multi-page PDF instead of a zip.")
+
+    def handle(self, *args, **options):
+        try:
+            from_date = parse_date(options['from_date'])
+            to_date = parse_date(options['to_date'])
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        if not from_date or not to_date or from_date > to_date:
+            raise CommandError("Give the period as two dates, YYYY-MM-DD, first day first.")
+
+        extension = "pdf" if options['pdf'] else "zip"
+        path = options['output'] or f"invoices-{from_date}-{to_date}.{extension}"
+        if options['pdf']:
+            content = period_invoices_pdf(from_date, to_date)
+        else:
+            content = period_invoices_zip(from_date, to_date, workers=settings.INVOICE_PDF['workers'])
+        with open(path, 'wb') as output:
+            output.write(content)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path} ({len(content)} bytes)."))
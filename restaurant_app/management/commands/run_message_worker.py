@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from restaurant_app.messaging import MessageWorker
+
+
+class Command(BaseCommand):
+    help = "Send queued WhatsApp/SMS messages from the OutboundMessage outbox, with retries and rate limiting."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when no message is due instead of polling.")
+
+    def handle(self, *args, **options):
+        MessageWorker().run(once=options['once'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from restaurant_app.printing import PrintWorker
+
+
+class Command(BaseCommand):
+    help = "Print queued receipts and kitchen tickets from the PrintJob spool, in order per printer, with retries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when no job is due instead of polling.")
+
+    def handle(self, *args, **options):
+        PrintWorker().run(once=options['once'])
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from restaurant_app.reminders import send_overdue_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue reminders for credit customers past their due date who still owe money, "
+        "at most one per customer every CREDIT_REMINDERS['interval_days']. Meant to run from cron; "
+        "run_message_worker sends them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Customers per batch (default: CREDIT_REMINDERS['batch_size']).")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the customers that would be reminded.")
+
+    def handle(self, *args, **options):
+        def progress(last_id, queued):
+            self.stdout.write(f"Up to customer {last_id}: {queued} queued")
+
+        queued = send_overdue_reminders(
+            batch_size=options['batch_size'], dry_run=options['dry_run'], progress=progress
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{queued} customers would be reminded."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Done: {queued} reminders queued."))
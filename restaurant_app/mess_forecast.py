@@ -0,0 +1,93 @@
+"""
+Kitchen production forecast for mess subscribers.
+
+For every date, a subscriber gets the items of the menus assigned to their
+subscription whose `day_of_week` matches that date, limited to the meals
+of their MessType (e.g. "breakfast_lunch"). Counting those items gives the
+portions of each dish the kitchen has to prepare per meal.
+
+Each day is cached separately, keyed by the forecast version, which moves
+whenever a subscription, menu or menu item changes.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+
+from .models import Mess, MenuItem, get_catalog_version, get_mess_forecast_version
+
+MEALS = ("breakfast", "lunch", "dinner")
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def meals_for(mess_type_name):
+    return [meal for meal in (mess_type_name or "").split("_") if meal in MEALS]
+
+
+def compute_forecast(from_date, to_date):
+    """Forecast of every day between `from_date` and `to_date`, keyed by date."""
+    # Overlap test on (start_date, end_date), served by the Mess index
+    messes = list(
+        Mess.objects.filter(start_date__lte=to_date, end_date__gte=from_date)
+        .values_list("id", "start_date", "end_date", "mess_type__name")
+    )
+
+    # (mess, weekday) -> [(meal, dish id)], from one join over the menus
+    menu_items = defaultdict(list)
+    dish_names = {}
+    rows = MenuItem.objects.filter(menu__messes__id__in=[mess[0] for mess in messes]).values_list(
+        "menu__messes__id", "menu__day_of_week", "meal_type", "dish_id", "dish__name"
+    )
+    for mess_id, day_of_week, meal_type, dish_id, dish_name in rows:
+        menu_items[mess_id, day_of_week].append((meal_type, dish_id))
+        dish_names[dish_id] = dish_name
+
+    forecast = {}
+    day = from_date
+    while day <= to_date:
+        weekday = day.strftime("%A").lower()
+        subscribers = defaultdict(int)
+        portions = defaultdict(lambda: defaultdict(int))
+        for mess_id, start_date, end_date, mess_type_name in messes:
+            if not start_date <= day <= end_date:
+                continue
+            meals = meals_for(mess_type_name)
+            for meal in meals:
+                subscribers[meal] += 1
+            for meal_type, dish_id in menu_items.get((mess_id, weekday), ()):
+                if meal_type in meals:
+                    portions[meal_type][dish_id] += 1
+
+        forecast[day] = {
+            "date": day.isoformat(),
+            "meals": {
+                meal: {
+                    "subscribers": subscribers[meal],
+                    "dishes": sorted(
+                        (
+                            {"dish_id": dish_id, "dish_name": dish_names[dish_id], "portions": count}
+                            for dish_id, count in portions[meal].items()
+                        ),
+                        key=lambda dish: (-dish["portions"], dish["dish_name"]),
+                    ),
+                }
+                for meal in MEALS
+            },
+        }
+        day += timedelta(days=1)
+    return forecast
+
+
+def get_forecast(from_date, to_date):
+    """Cached per day; only the days missing from the cache are computed."""
+    version = f"{get_mess_forecast_version()}.{get_catalog_version()}"
+    dates = [from_date + timedelta(days=n) for n in range((to_date - from_date).days + 1)]
+    keys = {day: f"mess_forecast:{version}:{day.isoformat()}" for day in dates}
+
+    cached = cache.get_many(keys.values())
+    missing = [day for day in dates if keys[day] not in cached]
+    if missing:
+        computed = compute_forecast(missing[0], missing[-1])
+        cache.set_many({keys[day]: computed[day] for day in computed}, CACHE_TIMEOUT)
+        cached.update({keys[day]: computed[day] for day in computed})
+    return [cached[keys[day]] for day in dates]
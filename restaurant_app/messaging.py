@@ -0,0 +1,215 @@
+"""
+Outbound WhatsApp/SMS messaging.
+
+Callers queue messages with `enqueue` / `enqueue_many`, which only insert
+OutboundMessage rows, so a request never waits on the provider. The
+`run_message_worker` command sends them:
+
+- due messages are claimed in batches with a claim token, so several
+  workers can run side by side without SELECT ... SKIP LOCKED;
+- a thread pool sends each batch through the configured transport, paced
+  by a process-wide rate limiter; the threads never touch the database;
+- failures are retried with exponential backoff until
+  MESSAGING["max_attempts"], then marked failed; every attempt's outcome
+  (status, provider id, last error) is saved on the row.
+
+Transports are looked up from MESSAGING["transport"]. TwilioTransport keeps
+one Twilio client (and its HTTP connection pool) per worker thread;
+FakeTransport records messages in memory for offline runs and tests.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboundMessage
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentDeliveryError(Exception):
+    """The provider refused the message for good (bad number, blocked, ...)."""
+
+
+class BaseTransport:
+    def send(self, message):
+        """Deliver `message` (an OutboundMessage) and return the provider's message id."""
+        raise NotImplementedError
+
+
+class TwilioTransport(BaseTransport):
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        # Built once per thread and reused, so its HTTP session stays open
+        if not hasattr(self._local, "client"):
+            from twilio.rest import Client
+            self._local.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        return self._local.client
+
+    def send(self, message):
+        from twilio.base.exceptions import TwilioRestException
+
+        prefix = "whatsapp:" if message.channel == "whatsapp" else ""
+        try:
+            sent = self.client.messages.create(
+                body=message.body,
+                from_=f"{prefix}{settings.TWILIO_PHONE_NUMBER}",
+                to=f"{prefix}{message.recipient}",
+            )
+        except TwilioRestException as e:
+            # 4xx other than rate limiting won't succeed on a retry
+            if e.status and 400 <= e.status < 500 and e.status != 429:
+                raise PermanentDeliveryError(str(e)) from e
+            raise
+        return sent.sid
+
+
+class FakeTransport(BaseTransport):
+    """
+    Records messages in FakeTransport.outbox instead of sending them.
+    Recipients in FakeTransport.failures fail that many times first.
+    """
+    outbox = []
+    failures = {}
+    _lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            if self.failures.get(message.recipient):
+                self.failures[message.recipient] -= 1
+                raise ConnectionError(f"Fake failure for {message.recipient}")
+            self.outbox.append((message.channel, message.recipient, message.body))
+            return f"fake-{len(self.outbox)}"
+
+
+class RateLimiter:
+    """Token bucket shared by the sending threads."""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def split_recipient(to_number):
+    if to_number.startswith("whatsapp:"):
+        return "whatsapp", to_number[len("whatsapp:"):]
+    return "sms", to_number
+
+
+def enqueue(recipient, body, channel="whatsapp"):
+    return OutboundMessage.objects.create(channel=channel, recipient=recipient, body=body)
+
+
+def enqueue_many(messages):
+    """Queue (recipient, body, channel) tuples with one INSERT per batch."""
+    return OutboundMessage.objects.bulk_create(
+        [OutboundMessage(channel=channel, recipient=recipient, body=body) for recipient, body, channel in messages]
+    )
+
+
+def claim_batch(batch_size, now=None):
+    """
+    Claim up to `batch_size` due messages for this worker. Messages held by
+    a worker that stopped answering for MESSAGING["stale_claim_after"]
+    seconds are claimable again.
+    """
+    config = settings.MESSAGING
+    now = now or timezone.now()
+    claimable = Q(status="pending", next_attempt_at__lte=now) | Q(
+        status="sending", claimed_at__lt=now - timedelta(seconds=config["stale_claim_after"])
+    )
+    ids = list(
+        OutboundMessage.objects.filter(claimable).order_by("next_attempt_at", "id").values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Only rows still claimable get the token, so two workers never share one
+    OutboundMessage.objects.filter(claimable, id__in=ids).update(status="sending", claim_token=token, claimed_at=now)
+    return list(OutboundMessage.objects.filter(claim_token=token).order_by("next_attempt_at", "id"))
+
+
+def retry_delay(attempts):
+    config = settings.MESSAGING
+    delay = min(config["retry_backoff"] * 2 ** (attempts - 1), config["max_backoff"])
+    return delay + random.uniform(0, config["retry_backoff"] / 2)
+
+
+def get_transport():
+    return import_string(settings.MESSAGING["transport"])()
+
+
+class MessageWorker:
+    def __init__(self, transport=None):
+        config = settings.MESSAGING
+        self.transport = transport or get_transport()
+        self.limiter = RateLimiter(config["rate_per_second"])
+        self.executor = ThreadPoolExecutor(max_workers=config["workers"], thread_name_prefix="outbound-messages")
+
+    def deliver(self, message):
+        self.limiter.acquire()
+        try:
+            return self.transport.send(message), None
+        except Exception as e:
+            return None, e
+
+    def process_batch(self):
+        """Send one claimed batch; returns how many messages were handled."""
+        config = settings.MESSAGING
+        messages = claim_batch(config["batch_size"])
+        for message, (provider_message_id, error) in zip(messages, self.executor.map(self.deliver, messages)):
+            now = timezone.now()
+            message.attempts += 1
+            message.claim_token, message.claimed_at = "", None
+            if error is None:
+                message.status, message.sent_at = "sent", now
+                message.provider_message_id = provider_message_id or ""
+                message.last_error = ""
+            else:
+                message.last_error = f"{type(error).__name__}: {error}"
+                if isinstance(error, PermanentDeliveryError) or message.attempts >= config["max_attempts"]:
+                    message.status = "failed"
+                    logger.warning("Giving up on outbound message %s: %s", message.pk, message.last_error)
+                else:
+                    message.status = "pending"
+                    message.next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts))
+        OutboundMessage.objects.bulk_update(messages, [
+            "status", "attempts", "next_attempt_at", "claim_token", "claimed_at",
+            "provider_message_id", "last_error", "sent_at",
+        ])
+        return len(messages)
+
+    def run(self, once=False):
+        """Keep sending; with `once`, stop when nothing is due."""
+        try:
+            while True:
+                if not self.process_batch():
+                    if once:
+                        return
+                    close_old_connections()
+                    time.sleep(settings.MESSAGING["poll_interval"])
+        finally:
+            self.executor.shutdown()
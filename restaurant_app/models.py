@@ -1,14 +1,19 @@
 from datetime import timedelta
 from django.db import models,transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThanOrEqual
+from decimal import Decimal
 from django.contrib.auth.hashers import make_password
 from django.core.exceptions import ValidationError
 
-from transactions_app.models import MainGroup,Ledger
+from transactions_app.models import MainGroup,Ledger,NumberSequence
 from .utils import default_time_period
+from .images import schedule_derivatives
+from .signal_control import suppress, suppressible
 import logging
 
 logger = logging.getLogger(__name__)
@@ -61,6 +66,8 @@ class LogoInfo(models.Model):
     office_number = models.CharField(max_length=20,blank=True, null=True)
     main_logo = models.ImageField(upload_to='company_logos/',blank=True, null=True)
     print_logo = models.ImageField(upload_to='company_logos/',blank=True, null=True)
+    main_logo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    print_logo_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.company_name
@@ -79,6 +86,7 @@ class SidebarItem(models.Model):
 class Category(models.Model):
     name = models.CharField(max_length=200, unique=True)
     image = models.ImageField(upload_to="images/", null=True,blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
 
     class Meta:
@@ -98,6 +106,7 @@ class Dish(models.Model):
     arabic_name = models.CharField(max_length=200, blank=True, null=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to="images/", default="default_dish_image.jpg")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(
         max_digits=6, decimal_places=2, default=0, help_text="Base price if no variants are available"
     )
@@ -112,6 +121,13 @@ class Dish(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets propagate_dish_price skip saves that leave the price alone
+        instance._loaded_price = instance.__dict__.get("price")
+        return instance
+
 class DishSize(models.Model):
     dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name="size")
     size = models.CharField(max_length=20)
@@ -154,6 +170,7 @@ class OnlineOrder(models.Model):
     percentage = models.DecimalField(max_digits=5, decimal_places=2)  # e.g., 12.34%
     reference = models.CharField(max_length=255)
     logo = models.ImageField(upload_to='logos/', blank=True, null=True) 
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.name} - {self.reference}"
@@ -179,6 +196,57 @@ class FOCProduct(models.Model):
         return f"{self.name} - {self.quantity}"
 
 
+CATALOG_VERSION_SEQUENCE = "catalog"
+
+
+def get_catalog_version():
+    return NumberSequence.objects.filter(name=CATALOG_VERSION_SEQUENCE).values_list(
+        'last_number', flat=True
+    ).first() or 0
+
+
+def bump_catalog_version():
+    """
+    Move the menu catalog to a new version so POS terminals refetch it.
+    Bulk writes that skip model signals (queryset.update, bulk_create)
+    must call this themselves, once per batch.
+    """
+    transaction.on_commit(_advance_catalog_version)
+
+
+def _advance_catalog_version():
+    NumberSequence.next_number(CATALOG_VERSION_SEQUENCE)
+    # Let this process's price map see the change right away
+    from .price_map import invalidate
+    invalidate()
+
+
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+for catalog_model in (Category, Dish, DishSize, DishVariant, OnlineOrder, FOCProduct):
+    post_save.connect(catalog_changed, sender=catalog_model, dispatch_uid=f"catalog_save_{catalog_model.__name__}")
+    post_delete.connect(catalog_changed, sender=catalog_model, dispatch_uid=f"catalog_delete_{catalog_model.__name__}")
+
+
+# Image fields that get resized derivatives (see images.py)
+IMAGE_FIELDS = {
+    LogoInfo: ("main_logo", "print_logo"),
+    Category: ("image",),
+    Dish: ("image",),
+    OnlineOrder: ("logo",),
+}
+
+
+def image_saved(sender, instance, **kwargs):
+    schedule_derivatives(instance, IMAGE_FIELDS[sender])
+
+
+for image_model in IMAGE_FIELDS:
+    post_save.connect(image_saved, sender=image_model, dispatch_uid=f"image_derivatives_{image_model.__name__}")
+
+
 class CustomerDetails(models.Model):
     customer_name = models.CharField(max_length=255)
     address = models.TextField()
@@ -262,6 +330,10 @@ class Order(models.Model):
 
     class Meta:
         ordering = ("-created_at",)
+        indexes = [
+            # Sales reports filter delivered orders by date
+            models.Index(fields=["status", "created_at"]),
+        ]
 
 
     def __str__(self):
@@ -327,11 +399,78 @@ class OrderItem(models.Model):
     is_newly_added = models.BooleanField(default=False)
     variants = models.JSONField(default=list)
     category_name = models.CharField(max_length=200, blank=True, null=True)
+    # Catalog rows the item was sold from, recorded at order time. The name
+    # columns stay as the printed snapshot; reports group on these ids.
+    dish = models.ForeignKey("Dish", on_delete=models.SET_NULL, null=True, blank=True, related_name="order_items")
+    size = models.ForeignKey("DishSize", on_delete=models.SET_NULL, null=True, blank=True, related_name="order_items")
+    category = models.ForeignKey("Category", on_delete=models.SET_NULL, null=True, blank=True, related_name="order_items")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["dish", "order"]),
+            models.Index(fields=["category", "order"]),
+        ]
 
     def __str__(self):
         size_info = f" - {self.size_name}" if self.size_name else ""
         return f"{self.order.id} - {self.dish_name}{size_info} - {self.quantity}"
 
+    @staticmethod
+    def match_key(name):
+        return (name or "").strip().lower()
+
+    @classmethod
+    def catalog_maps(cls, dish_names=None):
+        """
+        Name lookups used to link items to the catalog: dish name -> (dish id,
+        category id), (dish id, size name) -> size id and category name -> id.
+        Duplicate dish names resolve to the oldest dish.
+        """
+        dishes = Dish.objects.order_by("-id")
+        sizes = DishSize.objects.all()
+        if dish_names is not None:
+            dishes = dishes.filter(name__in=dish_names)
+            sizes = sizes.filter(dish__name__in=dish_names)
+        dish_map = {
+            cls.match_key(name): (dish_id, category_id)
+            for dish_id, name, category_id in dishes.values_list("id", "name", "category_id")
+        }
+        size_map = {
+            (dish_id, cls.match_key(size)): size_id
+            for size_id, dish_id, size in sizes.order_by("-id").values_list("id", "dish_id", "size")
+        }
+        category_map = {
+            cls.match_key(name): category_id
+            for category_id, name in Category.objects.order_by("-id").values_list("id", "name")
+        }
+        return dish_map, size_map, category_map
+
+    def link_catalog(self, dish_map, size_map, category_map):
+        """Fill dish/size/category ids from the names; returns True if any changed."""
+        dish_id, dish_category_id = dish_map.get(self.match_key(self.dish_name), (None, None))
+        size_id = size_map.get((dish_id, self.match_key(self.size_name))) if self.size_name else None
+        category_id = category_map.get(self.match_key(self.category_name)) or dish_category_id
+        linked = (dish_id, size_id, category_id)
+        changed = linked != (self.dish_id, self.size_id, self.category_id)
+        self.dish_id, self.size_id, self.category_id = linked
+        return changed
+
+
+class ShortLink(models.Model):
+    """
+    Local short links served at /s/<token>/. A link either points at
+    `target_url` or, when `order` is set, at that order's e-receipt.
+    """
+    token = models.CharField(max_length=12, unique=True)
+    target_url = models.CharField(max_length=500, blank=True)
+    order = models.OneToOneField(
+        Order, related_name="receipt_link", on_delete=models.CASCADE, null=True, blank=True
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.token
+
 
 class Bill(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="bills")
@@ -504,10 +643,21 @@ class Menu(models.Model):
         return self.name
 
     def calculate_sub_total(self):
-        menu_items = self.menu_items.all()
-        total = sum(item.dish.price for item in menu_items) if menu_items else 0
-        self.sub_total = total
-        self.save()
+        Menu.refresh_sub_totals(Menu.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=["sub_total"])
+
+    @staticmethod
+    def refresh_sub_totals(menus):
+        """
+        Recompute sub_total of every menu in the `menus` queryset from its
+        items' dish prices, in a single UPDATE.
+        """
+        item_totals = MenuItem.objects.filter(menu=models.OuterRef('pk')).order_by().values('menu').annotate(
+            total=models.Sum('dish__price')
+        ).values('total')
+        return menus.update(
+            sub_total=Coalesce(models.Subquery(item_totals), models.Value(Decimal('0.00')))
+        )
 
 
 class MenuItem(models.Model):
@@ -527,11 +677,35 @@ class MenuItem(models.Model):
         return f"{self.dish.name}"
 
 
-# Signal handler to update Menu's sub_total
+# Signal handlers to keep Menu's sub_total in step with its items.
+# Adding or removing one item adjusts the total in place; bulk builds
+# (MenuBuilderSerializer) suppress them and refresh the total once.
 @receiver(post_save, sender=MenuItem)
-def update_menu_sub_total(sender, instance, **kwargs):
-    menu = instance.menu
-    menu.calculate_sub_total()
+def update_menu_sub_total(sender, instance, created, **kwargs):
+    if created:
+        Menu.objects.filter(pk=instance.menu_id).update(
+            sub_total=models.F('sub_total') + Dish.objects.filter(pk=instance.dish_id).values('price')[:1]
+        )
+    else:
+        Menu.refresh_sub_totals(Menu.objects.filter(pk=instance.menu_id))
+
+
+@receiver(post_delete, sender=MenuItem)
+@suppressible
+def reduce_menu_sub_total(sender, instance, **kwargs):
+    Menu.refresh_sub_totals(Menu.objects.filter(pk=instance.menu_id))
+
+
+@receiver(post_save, sender=Dish)
+def propagate_dish_price(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "price" not in update_fields):
+        return
+    # Price as loaded (see Dish.from_db); unknown means refresh to be safe
+    if getattr(instance, "_loaded_price", None) != instance.price:
+        Menu.refresh_sub_totals(
+            Menu.objects.filter(pk__in=MenuItem.objects.filter(dish_id=instance.pk).values('menu_id'))
+        )
+    instance._loaded_price = instance.price
 
 
 class Mess(models.Model):
@@ -565,6 +739,15 @@ class Mess(models.Model):
     grand_total = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     initial_transaction_created = models.BooleanField(default=False)
 
+    # Moved by MessTransaction saves, see update_mess_on_transaction_save
+    BALANCE_FIELDS = ("paid_amount", "pending_amount", "cash_amount", "bank_amount")
+
+    class Meta:
+        indexes = [
+            # Active subscriptions on a date range (production forecast)
+            models.Index(fields=["start_date", "end_date"]),
+        ]
+
     def calculate_total_amount(self, weeks):
         # Assuming the subtotal is the total for one week
         weekly_total = sum(menu.sub_total for menu in self.menus.all())
@@ -577,6 +760,33 @@ class Mess(models.Model):
     #     super().save(*args, **kwargs)
 
 
+MESS_FORECAST_SEQUENCE = "mess_forecast"
+
+
+def get_mess_forecast_version():
+    return NumberSequence.objects.filter(name=MESS_FORECAST_SEQUENCE).values_list(
+        'last_number', flat=True
+    ).first() or 0
+
+
+def bump_mess_forecast_version():
+    transaction.on_commit(lambda: NumberSequence.next_number(MESS_FORECAST_SEQUENCE))
+
+
+def mess_forecast_changed(sender, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if sender is Mess and update_fields and update_fields <= set(Mess.BALANCE_FIELDS):
+        return  # payments don't change what the kitchen cooks
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_mess_forecast_version()
+
+
+for forecast_model in (Mess, MessType, Menu, MenuItem):
+    post_save.connect(mess_forecast_changed, sender=forecast_model, dispatch_uid=f"forecast_save_{forecast_model.__name__}")
+    post_delete.connect(mess_forecast_changed, sender=forecast_model, dispatch_uid=f"forecast_delete_{forecast_model.__name__}")
+m2m_changed.connect(mess_forecast_changed, sender=Mess.menus.through, dispatch_uid="forecast_mess_menus")
+
+
 class MessTransaction(models.Model):
     STATUS_CHOICES = [
         ('due', 'Due'),
@@ -604,17 +814,15 @@ class MessTransaction(models.Model):
     def __str__(self):
         return f"Transaction on {self.date} - {self.status}"
 
-transaction_creation = False
-
 @receiver(post_save, sender=Mess)
 def create_initial_transaction(sender, instance, created, **kwargs):
-    global transaction_creation
     if created and not instance.initial_transaction_created:
-        transaction_creation = True
         status = 'completed' if instance.pending_amount == 0 else 'due'
         
         try:
-            with transaction.atomic():
+            # The Mess amounts already include the initial payment, so the
+            # transaction must not be added to them again
+            with transaction.atomic(), suppress(update_mess_on_transaction_save):
                 # Create the initial Transaction entry
                 MessTransaction.objects.create(
                     received_amount=instance.paid_amount,
@@ -626,32 +834,51 @@ def create_initial_transaction(sender, instance, created, **kwargs):
                 )
                 # Set the flag to True
                 instance.initial_transaction_created = True
-                instance.save()
+                instance.save(update_fields=["initial_transaction_created"])
         except Exception as e:
             print(f"Error creating initial transaction: {e}")
-        finally:
-            transaction_creation = False
+
+
+MESS_TRANSACTION_AMOUNTS = {
+    # transaction field -> Mess field it is added to
+    "received_amount": "paid_amount",
+    "cash_amount": "cash_amount",
+    "bank_amount": "bank_amount",
+}
+
+
+@receiver(pre_save, sender=MessTransaction)
+def remember_mess_transaction_amounts(sender, instance, **kwargs):
+    # An edit moves the Mess balances by the difference only
+    instance._previous_amounts = None if instance._state.adding else (
+        MessTransaction.objects.filter(pk=instance.pk).values(*MESS_TRANSACTION_AMOUNTS).first()
+    )
 
 
 @receiver(post_save, sender=MessTransaction)
+@suppressible
 def update_mess_on_transaction_save(sender, instance, **kwargs):
-    if transaction_creation:
-        return  # Skip updating Mess if a transaction is being created
+    if not instance.mess_id:
+        return
+    previous = getattr(instance, "_previous_amounts", None) or {}
+    changes = {
+        field: Decimal(str(getattr(instance, field) or 0)) - previous.get(field, 0)
+        for field in MESS_TRANSACTION_AMOUNTS
+    }
+    if not any(changes.values()):
+        return
 
     mess = instance.mess
-    if mess:
-        try:
-            with transaction.atomic():
-                # Update Mess fields based on the Transaction
-                mess.pending_amount -= instance.received_amount
-                mess.paid_amount += instance.received_amount
-                mess.cash_amount += instance.cash_amount
-                mess.bank_amount += instance.bank_amount
-                
-                # Ensure Mess is saved only if changes are actually made
-                mess.save()
-        except Exception as e:
-            print(f"Error updating mess on transaction save: {e}")
+    try:
+        with transaction.atomic():
+            # One UPDATE over the stored values, so concurrent payments add up
+            mess.pending_amount = models.F("pending_amount") - changes["received_amount"]
+            for field, mess_field in MESS_TRANSACTION_AMOUNTS.items():
+                setattr(mess, mess_field, models.F(mess_field) + changes[field])
+            mess.save(update_fields=Mess.BALANCE_FIELDS)
+            mess.refresh_from_db(fields=Mess.BALANCE_FIELDS)
+    except Exception as e:
+        print(f"Error updating mess on transaction save: {e}")
 
 class CreditUser(models.Model):
     username = models.CharField(max_length=100)
@@ -664,23 +891,71 @@ class CreditUser(models.Model):
 
     class Meta:
         ordering = ("bill_date",)
+        indexes = [
+            # Overdue customers: due_date passed and something still owed
+            models.Index(fields=["due_date", "total_due"]),
+        ]
 
     def __str__(self):
         return self.username
 
+    def change_total_due(self, amount, **fields):
+        """
+        Add `amount` (negative for payments) to the stored total_due in one
+        UPDATE, deactivating the account in the same statement once it
+        reaches limit_amount. Extra `fields` are written along with it.
+        """
+        self.total_due = models.F("total_due") + amount
+        self.is_active = models.Case(
+            models.When(GreaterThanOrEqual(models.F("total_due") + amount, models.F("limit_amount")), then=False),
+            default=models.F("is_active"),
+        )
+        for name, value in fields.items():
+            setattr(self, name, value)
+        update_fields = ["total_due", "is_active", *fields]
+        self.save(update_fields=update_fields)
+        self.refresh_from_db(fields=update_fields)
+
     def add_to_total_due(self, amount):
-        self.total_due += amount
-        self.save()
+        self.change_total_due(amount)
 
-    def make_payment(self, amount):
-        if amount > self.total_due:
-            amount = self.total_due
-        self.total_due -= amount
-        self.due_date = timezone.now()
-        self.save()
+    def make_payment(self, amount, payment_method="cash", cash_amount=None, bank_amount=None):
+        """
+        Record a payment of up to the amount due as a CreditTransaction,
+        which takes it off total_due, and restart the due date. A
+        "cash-bank" payment needs its cash_amount and bank_amount.
+        """
+        if payment_method not in dict(CreditTransaction.PAYMENT_METHOD_CHOICES):
+            raise ValidationError(f"Unknown payment method {payment_method!r}.")
+        if payment_method == "cash-bank" and (
+            cash_amount is None or bank_amount is None or min(cash_amount, bank_amount) < 0
+            or cash_amount + bank_amount != amount
+        ):
+            raise ValidationError("A cash-bank payment needs cash_amount and bank_amount adding up to the amount.")
+
+        with transaction.atomic():
+            total_due = CreditUser.objects.select_for_update().values_list("total_due", flat=True).get(pk=self.pk)
+            amount = min(amount, max(total_due, Decimal("0.00")))
+            if amount > 0:
+                if payment_method == "cash-bank":
+                    # Anything paid over the due is handed back out of the cash
+                    bank_amount = min(bank_amount, amount)
+                    cash_amount = amount - bank_amount
+                else:
+                    cash_amount = amount if payment_method == "cash" else Decimal("0.00")
+                    bank_amount = amount if payment_method == "bank" else Decimal("0.00")
+                CreditTransaction.objects.create(
+                    credit_user=self,
+                    received_amount=amount,
+                    cash_amount=cash_amount,
+                    bank_amount=bank_amount,
+                    payment_method=payment_method,
+                )
+            self.change_total_due(Decimal("0.00"), due_date=timezone.now())
 
     def save(self, *args, **kwargs):
-        if self.total_due >= self.limit_amount:
+        # Balance updates set total_due to an expression and derive is_active in SQL
+        if not hasattr(self.total_due, "resolve_expression") and self.total_due >= self.limit_amount:
             self.is_active = False
         return super().save(*args, **kwargs)
 
@@ -722,6 +997,12 @@ class CreditTransaction(models.Model):
         'CreditUser', related_name='credittransactions', on_delete=models.CASCADE, blank=True, null=True
     )
 
+    class Meta:
+        indexes = [
+            # Payments per customer up to a date (aging, statements)
+            models.Index(fields=["credit_user", "date"]),
+        ]
+
     def __str__(self):
         return f"Transaction on {self.date} - {self.status}"
 
@@ -731,11 +1012,122 @@ class CreditTransaction(models.Model):
         else:
             self.status = 'completed'
 
-        super().save(*args, **kwargs)
+        # An edit takes the difference off total_due, not the whole amount again
+        previous = Decimal("0.00") if self._state.adding else (
+            CreditTransaction.objects.filter(pk=self.pk).values_list("received_amount", flat=True).first() or 0
+        )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            change = Decimal(str(self.received_amount)) - previous
+            if self.credit_user and change:
+                self.credit_user.change_total_due(-change)
+
+class OutboundMessage(models.Model):
+    """
+    Outbox of WhatsApp/SMS messages. Requests only insert rows here; the
+    run_message_worker command sends them (see restaurant_app.messaging).
+    """
+    CHANNEL_CHOICES = [
+        ("whatsapp", "WhatsApp"),
+        ("sms", "SMS"),
+    ]
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, default="whatsapp")
+    recipient = models.CharField(max_length=30)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set while a worker holds the message
+    claim_token = models.CharField(max_length=32, blank=True, default="")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    provider_message_id = models.CharField(max_length=64, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = [
+            # Worker polling: due messages in order
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["claim_token"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} to {self.recipient} ({self.status})"
+
+
+class PrintJob(models.Model):
+    """
+    Spool of receipt/ticket prints. Requests only insert rows here; the
+    run_print_worker command prints them in order per printer (see
+    restaurant_app.printing).
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("printing", "Printing"),
+        ("printed", "Printed"),
+        ("failed", "Failed"),
+    ]
+
+    printer = models.CharField(max_length=50)
+    printer_type = models.CharField(max_length=20, blank=True, default="")
+    content = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set while a worker holds the job
+    claim_token = models.CharField(max_length=32, blank=True, default="")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    printed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = [
+            # Worker polling: each printer's queue in order
+            models.Index(fields=["status", "printer", "id"]),
+            models.Index(fields=["claim_token"]),
+        ]
+
+    def __str__(self):
+        return f"Print job {self.pk} on {self.printer} ({self.status})"
+
+
+class CreditReminder(models.Model):
+    """Sent-log of overdue reminders, also used to throttle them per customer."""
+    credit_user = models.ForeignKey(CreditUser, related_name="reminders", on_delete=models.CASCADE)
+    created_at = models.DateTimeField(default=timezone.now)
+    due_date = models.DateTimeField()
+    total_due = models.DecimalField(max_digits=10, decimal_places=2)
+    message = models.TextField()
+    outbound_message = models.ForeignKey(
+        OutboundMessage, related_name="credit_reminders", on_delete=models.SET_NULL, null=True, blank=True
+    )
+
+    @property
+    def status(self):
+        # Reminders from before the outbox went straight to Twilio; count them as sent
+        return self.outbound_message.status if self.outbound_message_id else "sent"
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = [
+            # Last reminder per customer (throttling)
+            models.Index(fields=["credit_user", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Reminder to {self.credit_user} on {self.created_at:%Y-%m-%d}"
 
-        if self.credit_user:
-            self.credit_user.total_due -= self.received_amount
-            self.credit_user.save()
 
 @receiver(post_save, sender=CreditUser)
 def create_ledger_for_credit_user(sender, instance, created, **kwargs):
@@ -0,0 +1,98 @@
+"""
+Invoice page drawing with reportlab.
+
+Works on plain dicts and logo bytes only, with no Django imports, so the
+functions can run in worker processes of a ProcessPoolExecutor (including
+spawned ones, which import this module fresh).
+
+An order dict has the Order fields used below plus "user__username" and
+"items", a list of dicts with dish_name, size_name, quantity and price.
+"""
+import io
+from decimal import Decimal
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+PAGE_SIZE = A4
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('ALIGN', (0, -1), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+
+def money(value):
+    return f"{Decimal(value or 0):.2f}"
+
+
+def draw_order(p, order, company, logo):
+    """Draw one order's invoice on the current page of canvas `p`."""
+    width, height = PAGE_SIZE
+    text_x = 50
+    if logo is not None:
+        p.drawImage(logo, 50, height - 100, width=100, height=80, preserveAspectRatio=True, mask='auto')
+        text_x = 180
+
+    p.setFont("Helvetica-Bold", 20)
+    p.drawString(text_x, height - 50, company.get("company_name") or "")
+    p.setFont("Helvetica", 10)
+    p.drawString(text_x, height - 65, company.get("location") or "")
+    if company.get("phone_number"):
+        p.drawString(text_x, height - 80, f"Phone: {company['phone_number']}")
+
+    p.line(50, height - 110, width - 50, height - 110)
+
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(50, height - 140, f"Invoice #{order['invoice_number'] or order['id']}")
+    p.setFont("Helvetica", 10)
+    p.drawString(50, height - 160, f"Date: {order['created_at']:%Y-%m-%d %H:%M:%S}")
+    p.drawString(50, height - 175, f"Billed by: {order['user__username']}")
+    p.drawString(50, height - 190, f"Status: {order['status'].title()}  |  Payment: {order['payment_method'].title()}")
+
+    data = [['Item', 'Quantity', 'Price', 'Total']]
+    for item in order["items"]:
+        name = f"{item['dish_name']} ({item['size_name']})" if item.get("size_name") else item["dish_name"]
+        data.append([name, str(item["quantity"]), money(item["price"]), money(item["price"] * item["quantity"])])
+    if order.get("delivery_charge"):
+        data.append(['Delivery charge', '', '', money(order["delivery_charge"])])
+    if order.get("chair_amount"):
+        data.append(['Chairs', '', '', money(order["chair_amount"])])
+    data.append(['', '', 'Total:', money(order["total_amount"])])
+
+    table = Table(data, colWidths=[3 * inch, 1 * inch, 1 * inch, 1 * inch], repeatRows=1)
+    table.setStyle(TABLE_STYLE)
+    _, table_height = table.wrapOn(p, width, height)
+    table.drawOn(p, 50, max(70, height - 210 - table_height))
+
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(50, 50, "Thank you for your order! We hope you enjoy your meal.")
+    p.showPage()
+
+
+def render_orders(orders, company, logo_bytes=None):
+    """One PDF with a page per order."""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=PAGE_SIZE)
+    logo = ImageReader(io.BytesIO(logo_bytes)) if logo_bytes else None
+    for order in orders:
+        draw_order(p, order, company, logo)
+    p.save()
+    return buffer.getvalue()
+
+
+def render_each(orders, company, logo_bytes=None):
+    """[(order id, PDF bytes)], a separate PDF per order. Process pool task."""
+    return [(order["id"], render_orders([order], company, logo_bytes)) for order in orders]
@@ -0,0 +1,105 @@
+"""
+Process-level map of catalog prices for order validation.
+
+Built from three queries and kept until the catalog version moves, so
+checking an order's items costs dictionary lookups only. The version is
+re-read at most every VERSION_CHECK_INTERVAL seconds, which is how long
+another process's catalog write can take to show up here.
+
+DishVariant has no price of its own, so variants are not priced.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from .models import Category, Dish, DishSize, OrderItem, get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+VERSION_CHECK_INTERVAL = 5
+
+# Process-wide counters, e.g. metrics["price_mismatch"]
+metrics = Counter()
+
+
+class PriceMap:
+    def __init__(self, version):
+        self.version = version
+        match_key = OrderItem.match_key
+
+        # Same shapes as OrderItem.catalog_maps(), so items link the same way
+        self.dish_map = {}
+        self.dish_prices = {}
+        for dish_id, name, price, category_id in Dish.objects.order_by("-id").values_list(
+            "id", "name", "price", "category_id"
+        ):
+            self.dish_map[match_key(name)] = (dish_id, category_id)
+            self.dish_prices[dish_id] = price
+
+        self.size_map = {}
+        self.size_prices = {}
+        for size_id, dish_id, size, price in DishSize.objects.order_by("-id").values_list(
+            "id", "dish_id", "size", "price"
+        ):
+            self.size_map[dish_id, match_key(size)] = size_id
+            self.size_prices[size_id] = price
+
+        self.category_map = {}
+        self.category_names = {}
+        for category_id, name in Category.objects.order_by("-id").values_list("id", "name"):
+            self.category_map[match_key(name)] = category_id
+            self.category_names[category_id] = name
+
+    def maps(self):
+        return self.dish_map, self.size_map, self.category_map
+
+    def lookup(self, dish_name, size_name=None):
+        """
+        (dish id, size id, catalog price, category id) for an item, with
+        None for parts that are not in the catalog.
+        """
+        dish_id, category_id = self.dish_map.get(OrderItem.match_key(dish_name), (None, None))
+        if dish_id is None:
+            return None, None, None, None
+        if size_name:
+            size_id = self.size_map.get((dish_id, OrderItem.match_key(size_name)))
+            price = self.size_prices.get(size_id)
+        else:
+            size_id, price = None, self.dish_prices[dish_id]
+        return dish_id, size_id, price, category_id
+
+
+_price_map = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_price_map():
+    global _price_map, _checked_at
+    if _price_map is not None and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+        return _price_map
+    with _lock:
+        if _price_map is None or time.monotonic() - _checked_at >= VERSION_CHECK_INTERVAL:
+            version = get_catalog_version()
+            if _price_map is None or _price_map.version != version:
+                _price_map = PriceMap(version)
+            _checked_at = time.monotonic()
+    return _price_map
+
+
+def invalidate():
+    """Force the next lookup to re-check the catalog version."""
+    global _checked_at
+    _checked_at = 0.0
+
+
+def record_mismatch(dish_name, size_name, sent_price, catalog_price):
+    metrics["price_mismatch"] += 1
+    logger.warning(
+        "Order item price mismatch for %r%s: sent %s, catalog %s",
+        dish_name,
+        f" ({size_name})" if size_name else "",
+        sent_price,
+        catalog_price,
+    )
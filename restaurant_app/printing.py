@@ -0,0 +1,307 @@
+"""
+Receipt and kitchen ticket printing.
+
+The print endpoint formats the ticket and queues a PrintJob, so a request
+never waits on a printer. The `run_print_worker` command prints them:
+
+- every printer has its own FIFO queue: the oldest unfinished jobs of a
+  printer (up to PRINTING["jobs_per_printer"]) are claimed with a claim
+  token, and a job waiting for a retry holds back the jobs queued after
+  it on that printer, so tickets never come out of order;
+- each printer with due jobs gets a thread from a pool that claims,
+  prints and saves that printer's jobs in a loop until its queue is empty
+  or waiting on a retry, so an unreachable printer only holds up its own
+  tickets;
+- failures are retried with exponential backoff until
+  PRINTING["max_attempts"], then the job is marked failed and the queue
+  moves on; every attempt's outcome is saved on the job, which is what the
+  job status endpoint returns.
+
+Backends are looked up per printer from PRINTING["printers"] (falling back
+to PRINTING["backend"]): raw TCP to port 9100, CUPS, the Windows spooler,
+or files on disk for tests and printer-less setups. CUPS and Windows
+modules are only imported when those backends print.
+"""
+import logging
+import os
+import socket
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import PrintJob
+
+logger = logging.getLogger(__name__)
+
+LINE_WIDTH = 32
+TITLES = {
+    "pizza": "PIZZA ORDER",
+    "shawarma": "SHAWARMA ORDER",
+    "kitchen": "KITCHEN ORDER",
+    "sales": "SALES RECEIPT",
+}
+
+
+class BaseBackend:
+    def __init__(self, printer, encoding="utf-8", **options):
+        self.printer = printer
+        self.encoding = encoding
+
+    def data(self, job):
+        return job.content.encode(self.encoding, errors="replace")
+
+    def send(self, job):
+        """Print `job` (a PrintJob); raise if the printer didn't take it."""
+        raise NotImplementedError
+
+
+class RawTcpBackend(BaseBackend):
+    """Network receipt printers that take raw ESC/POS on port 9100 (JetDirect)."""
+
+    def __init__(self, printer, host, port=9100, timeout=10, **options):
+        super().__init__(printer, **options)
+        self.address = (host, port)
+        self.timeout = timeout
+
+    def send(self, job):
+        with socket.create_connection(self.address, timeout=self.timeout) as connection:
+            connection.sendall(self.data(job))
+
+
+class CupsBackend(BaseBackend):
+    """A CUPS queue, sent raw. Needs pycups."""
+
+    def __init__(self, printer, name=None, **options):
+        super().__init__(printer, **options)
+        self.name = name or printer
+
+    def send(self, job):
+        import cups
+
+        with tempfile.NamedTemporaryFile(suffix=".txt") as spool_file:
+            spool_file.write(self.data(job))
+            spool_file.flush()
+            cups.Connection().printFile(self.name, spool_file.name, f"Print job {job.pk}", {"raw": "true"})
+
+
+class WindowsBackend(BaseBackend):
+    """A Windows printer, sent raw. Needs pywin32."""
+
+    def __init__(self, printer, name=None, **options):
+        super().__init__(printer, **options)
+        self.name = name or printer
+
+    def send(self, job):
+        import win32print
+
+        printer_handle = win32print.OpenPrinter(self.name)
+        try:
+            win32print.StartDocPrinter(printer_handle, 1, (f"Print job {job.pk}", None, "RAW"))
+            try:
+                win32print.StartPagePrinter(printer_handle)
+                win32print.WritePrinter(printer_handle, self.data(job))
+                win32print.EndPagePrinter(printer_handle)
+            finally:
+                win32print.EndDocPrinter(printer_handle)
+        finally:
+            win32print.ClosePrinter(printer_handle)
+
+
+class FileBackend(BaseBackend):
+    """Writes each job to <directory>/<printer>/<job id>.txt instead of printing it."""
+
+    def __init__(self, printer, directory=None, **options):
+        super().__init__(printer, **options)
+        self.directory = os.path.join(directory or os.path.join(tempfile.gettempdir(), "print-spool"), printer)
+
+    def send(self, job):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{job.pk}.txt"), "wb") as output:
+            output.write(self.data(job))
+
+
+def get_backend(printer):
+    config = settings.PRINTING
+    options = dict(config["printers"].get(printer, {}))
+    return import_string(options.pop("backend", config["backend"]))(printer, **options)
+
+
+def format_ticket(html_content, printer_type):
+    """Plain text ticket, LINE_WIDTH characters wide, from the POS's HTML."""
+    rule = "=" * LINE_WIDTH
+    formatted_content = ""
+    if printer_type in TITLES:
+        formatted_content += f"\n{rule}\n{TITLES[printer_type].center(LINE_WIDTH)}\n{rule}\n\n"
+
+    for element in BeautifulSoup(html_content, "html.parser").stripped_strings:
+        line = str(element).strip()
+        if line:
+            if "QAR" in line or any(c.isdigit() for c in line):
+                formatted_content += line.rjust(LINE_WIDTH) + "\n"
+            else:
+                formatted_content += line.ljust(LINE_WIDTH) + "\n"
+
+            if line.startswith("="):
+                formatted_content += "\n"
+
+    formatted_content += f"\n{rule}\n"
+    return formatted_content
+
+
+def queue_print(printer_type, html_content):
+    """Queue a ticket on the printer PRINTING["types"] maps `printer_type` to."""
+    return PrintJob.objects.create(
+        printer=settings.PRINTING["types"][printer_type],
+        printer_type=printer_type,
+        content=format_ticket(html_content, printer_type),
+    )
+
+
+def claimable_jobs(now):
+    """Jobs due now, including those held by a worker that stopped answering."""
+    stale = now - timedelta(seconds=settings.PRINTING["stale_claim_after"])
+    return PrintJob.objects.filter(Q(status="queued", next_attempt_at__lte=now) | Q(status="printing", claimed_at__lt=stale))
+
+
+def due_printers(now=None):
+    return set(claimable_jobs(now or timezone.now()).order_by().values_list("printer", flat=True).distinct())
+
+
+def claim_jobs(per_printer, now=None, printer=None):
+    """
+    Claim the head of every printer's queue (or only `printer`'s), at most
+    `per_printer` jobs each, and return them as {printer: [jobs in queue
+    order]}. A printer whose oldest unfinished job is held by another
+    worker or waiting for a retry gets nothing. Jobs held by a worker that
+    stopped answering for PRINTING["stale_claim_after"] seconds are
+    claimable again.
+    """
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=settings.PRINTING["stale_claim_after"])
+    unfinished = PrintJob.objects.filter(status__in=("queued", "printing"))
+    printers = [printer] if printer else unfinished.order_by().values_list("printer", flat=True).distinct()
+
+    ids = []
+    for printer in printers:
+        head = unfinished.filter(printer=printer).order_by("id").values_list("id", "status", "next_attempt_at", "claimed_at")
+        for job_id, status, next_attempt_at, claimed_at in head[:per_printer]:
+            if (status == "printing" and claimed_at >= stale) or (status == "queued" and next_attempt_at > now):
+                break
+            ids.append(job_id)
+    if not ids:
+        return {}
+
+    token = uuid.uuid4().hex
+    # Only rows still claimable get the token, so two workers never share one
+    claimable_jobs(now).filter(id__in=ids).update(status="printing", claim_token=token, claimed_at=now)
+    claimed = {}
+    for job in PrintJob.objects.filter(claim_token=token).order_by("id"):
+        claimed.setdefault(job.printer, []).append(job)
+    return claimed
+
+
+def retry_delay(attempts):
+    config = settings.PRINTING
+    return min(config["retry_backoff"] * 2 ** (attempts - 1), config["max_backoff"])
+
+
+class PrintWorker:
+    def __init__(self):
+        self.backends = {}
+        self.executor = ThreadPoolExecutor(max_workers=settings.PRINTING["workers"], thread_name_prefix="print-spooler")
+
+    def backend(self, printer):
+        if printer not in self.backends:
+            self.backends[printer] = get_backend(printer)
+        return self.backends[printer]
+
+    def print_queue(self, printer, jobs):
+        """Print `jobs` in order, stopping at the first failure. Returns {job id: error or None}."""
+        outcomes = {}
+        for job in jobs:
+            try:
+                self.backend(printer).send(job)
+            except Exception as e:
+                outcomes[job.pk] = e
+                break
+            outcomes[job.pk] = None
+        return outcomes
+
+    def save_outcomes(self, jobs, outcomes):
+        config = settings.PRINTING
+        now = timezone.now()
+        for job in jobs:
+            job.claim_token, job.claimed_at = "", None
+            if job.pk not in outcomes:
+                # Behind a failed job on the same printer; wait for it
+                job.status = "queued"
+                continue
+            error = outcomes[job.pk]
+            job.attempts += 1
+            if error is None:
+                job.status, job.printed_at = "printed", now
+                job.last_error = ""
+            else:
+                job.last_error = f"{type(error).__name__}: {error}"
+                if job.attempts >= config["max_attempts"]:
+                    job.status = "failed"
+                    logger.warning("Giving up on print job %s on %s: %s", job.pk, job.printer, job.last_error)
+                else:
+                    job.status = "queued"
+                    job.next_attempt_at = now + timedelta(seconds=retry_delay(job.attempts))
+        PrintJob.objects.bulk_update(jobs, [
+            "status", "attempts", "next_attempt_at", "claim_token", "claimed_at", "last_error", "printed_at",
+        ])
+
+    def drain(self, printer):
+        """
+        Print `printer`'s queue until it is empty or waiting on a retry;
+        returns how many jobs were handled.
+        """
+        handled = 0
+        while True:
+            jobs = claim_jobs(settings.PRINTING["jobs_per_printer"], printer=printer).get(printer)
+            if not jobs:
+                return handled
+            outcomes = self.print_queue(printer, jobs)
+            self.save_outcomes(jobs, outcomes)
+            handled += len(outcomes)
+
+    def drain_in_thread(self, printer):
+        try:
+            return self.drain(printer)
+        except Exception:
+            logger.exception("Print worker thread for %s failed", printer)
+            return 0
+        finally:
+            # The pool thread's own connection
+            connection.close()
+
+    def run(self, once=False):
+        """Keep printing; with `once`, stop when nothing is due."""
+        try:
+            if once:
+                while sum(self.executor.map(self.drain_in_thread, due_printers())):
+                    pass
+                return
+            running = {}
+            while True:
+                for printer, future in list(running.items()):
+                    if future.done():
+                        del running[printer]
+                # A printer still busy with its queue keeps its thread
+                for printer in due_printers() - running.keys():
+                    running[printer] = self.executor.submit(self.drain_in_thread, printer)
+                close_old_connections()
+                time.sleep(settings.PRINTING["poll_interval"])
+        finally:
+            self.executor.shutdown()
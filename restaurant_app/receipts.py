@@ -0,0 +1,110 @@
+"""
+Short links and e-receipts.
+
+Links are rows in ShortLink with a random 8 character base62 token, so
+making one is a single local INSERT instead of a call to a URL shortener.
+/s/<token>/ redirects to the link's target; for order links that is the
+order's receipt page.
+
+Receipt pages are rendered once per version of the order: the HTML is
+cached under a fingerprint of the order row, its items and the company
+details, so any change to those renders a new page and every process
+agrees on the version without invalidation signals. The fingerprint is
+also the page's ETag.
+"""
+import hashlib
+import json
+import secrets
+import string
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from .models import LogoInfo, Order, OrderItem, ShortLink
+
+TOKEN_ALPHABET = string.ascii_letters + string.digits
+TOKEN_LENGTH = 8
+LINK_CACHE_TIMEOUT = 60 * 60 * 24
+RECEIPT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+RECEIPT_ORDER_FIELDS = (
+    "id", "invoice_number", "created_at", "order_type", "status", "payment_method",
+    "customer_name", "customer_phone_number", "address", "delivery_charge", "chair_amount", "total_amount",
+)
+RECEIPT_ITEM_FIELDS = ("dish_name", "size_name", "quantity", "price", "variants")
+RECEIPT_COMPANY_FIELDS = ("company_name", "company_name_arabic", "phone_number", "location", "location_arabic")
+
+
+def new_token():
+    return "".join(secrets.choice(TOKEN_ALPHABET) for _ in range(TOKEN_LENGTH))
+
+
+def create_short_link(target_url="", order=None):
+    # 62**8 tokens make a clash unlikely; retry on the rare one
+    for _ in range(5):
+        try:
+            with transaction.atomic():
+                return ShortLink.objects.create(token=new_token(), target_url=target_url, order=order)
+        except IntegrityError:
+            if order is not None and ShortLink.objects.filter(order=order).exists():
+                return ShortLink.objects.get(order=order)
+    raise IntegrityError("Could not generate a unique short link token")
+
+
+def receipt_link(order):
+    """The order's receipt link, created on first use."""
+    return ShortLink.objects.filter(order=order).first() or create_short_link(order=order)
+
+
+def short_url(token, request=None):
+    path = reverse("short_link", args=[token])
+    if request is not None:
+        return request.build_absolute_uri(path)
+    return f"{settings.SHORT_LINK_BASE_URL.rstrip('/')}{path}"
+
+
+def resolve_short_link(token):
+    """(target URL, order id) of a token, or None. Cached, links never change."""
+    key = f"short_link:{token}"
+    resolved = cache.get(key)
+    if resolved is None:
+        link = ShortLink.objects.filter(token=token).values_list("target_url", "order_id").first()
+        if link is None:
+            return None
+        resolved = list(link)
+        cache.set(key, resolved, LINK_CACHE_TIMEOUT)
+    return resolved
+
+
+def receipt_data(order_id):
+    order = Order.objects.filter(pk=order_id).values(*RECEIPT_ORDER_FIELDS).first()
+    if order is None:
+        return None
+    return {
+        "order": order,
+        "items": list(OrderItem.objects.filter(order_id=order_id).order_by("id").values(*RECEIPT_ITEM_FIELDS)),
+        "company": LogoInfo.objects.values(*RECEIPT_COMPANY_FIELDS).first() or {},
+    }
+
+
+def fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+
+def render_receipt(order_id):
+    """(html, etag) of an order's receipt, or None if the order is gone."""
+    data = receipt_data(order_id)
+    if data is None:
+        return None
+    etag = fingerprint(data)
+    key = f"receipt:{order_id}:{etag}"
+    html = cache.get(key)
+    if html is None:
+        for item in data["items"]:
+            item["total"] = item["price"] * item["quantity"]
+        html = render_to_string("receipt.html", data)
+        cache.set(key, html, RECEIPT_CACHE_TIMEOUT)
+    return html, etag
@@ -0,0 +1,95 @@
+"""
+Overdue reminders for credit customers.
+
+Customers whose due_date has passed and who still owe money are selected
+through the CreditUser (due_date, total_due) index. Anyone reminded within
+CREDIT_REMINDERS["interval_days"] is skipped. The rest are worked through
+in id-ordered batches: each batch is queued in the outbound message outbox
+and logged to CreditReminder, with one INSERT each. Reminders whose message
+finally failed don't count towards the throttle, so the next run retries
+them; reminders logged without an outbound message (sent before the
+outbox existed) count as sent.
+
+Meant to run from cron through the send_credit_reminders command, away
+from the web workers.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .messaging import enqueue_many
+from .models import CreditReminder, CreditUser
+
+
+def overdue_credit_users(now=None):
+    config = settings.CREDIT_REMINDERS
+    now = now or timezone.now()
+    recently_reminded = CreditReminder.objects.filter(
+        Q(outbound_message__isnull=True) | Q(outbound_message__status__in=("pending", "sending", "sent")),
+        credit_user=OuterRef("pk"),
+        created_at__gt=now - timedelta(days=config["interval_days"]),
+    )
+    return (
+        CreditUser.objects.filter(due_date__lt=now, total_due__gt=0)
+        .exclude(Exists(recently_reminded))
+        .order_by("id")
+        .only("id", "username", "mobile_number", "due_date", "total_due")
+    )
+
+
+def render_reminder(credit_user):
+    return settings.CREDIT_REMINDERS["template"].format(
+        username=credit_user.username,
+        total_due=credit_user.total_due,
+        due_date=credit_user.due_date,
+    )
+
+
+def recipient(mobile_number):
+    number = mobile_number.strip()
+    if not number.startswith("+"):
+        number = settings.CREDIT_REMINDERS["country_code"] + number.lstrip("0")
+    return number
+
+
+def send_overdue_reminders(batch_size=None, dry_run=False, now=None, progress=None):
+    """
+    Queue a reminder for every overdue customer that is not throttled and
+    return how many were queued (or, on a dry run, would be).
+    """
+    batch_size = batch_size or settings.CREDIT_REMINDERS["batch_size"]
+    overdue = overdue_credit_users(now)
+    if dry_run:
+        return overdue.count()
+
+    queued = 0
+    last_id = 0
+    while True:
+        batch = list(overdue.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        messages = [render_reminder(credit_user) for credit_user in batch]
+        with transaction.atomic():
+            outbound = enqueue_many(
+                (recipient(credit_user.mobile_number), message, "whatsapp")
+                for credit_user, message in zip(batch, messages)
+            )
+            CreditReminder.objects.bulk_create([
+                CreditReminder(
+                    credit_user=credit_user,
+                    due_date=credit_user.due_date,
+                    total_due=credit_user.total_due,
+                    message=message,
+                    outbound_message=outbound_message,
+                )
+                for credit_user, message, outbound_message in zip(batch, messages, outbound)
+            ])
+        queued += len(batch)
+        if progress:
+            progress(last_id, queued)
+    return queued
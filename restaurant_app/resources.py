@@ -0,0 +1,157 @@
+"""
+django-import-export resources for the bulk importable admins.
+
+The default ModelResource saves row by row and looks every row (and every
+foreign key) up with its own query, so a 20k row customer list issues
+tens of thousands of queries. These resources:
+
+- load the existing instances of a whole dataset up front, in chunked
+  IN queries (BulkInstanceLoader), also for composite import keys;
+- resolve foreign keys from an in-memory map (CachedForeignKeyWidget);
+- write with bulk_create / bulk_update in batches of `batch_size`;
+- skip unchanged rows, so a dry run reports new / updated / unchanged
+  counts without writing anything.
+
+The admins use them for their Import page and the `bulk_import`
+management command streams CSV files through them in chunks.
+"""
+import copy
+
+from import_export import fields, resources
+from import_export.instance_loaders import ModelInstanceLoader
+from import_export.widgets import ForeignKeyWidget
+
+from .models import Category, CustomerDetails, Dish, Menu, SidebarItem, bump_catalog_version
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+class BulkInstanceLoader(ModelInstanceLoader):
+    """
+    Loads every existing instance matched by the dataset in a few queries and
+    indexes them by the values of all import id fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.id_fields = [self.resource.fields[name] for name in self.resource.get_import_id_fields()]
+        self.all_instances = {}
+        if not self.dataset.dict or any(field.column_name not in self.dataset.headers for field in self.id_fields):
+            return
+
+        # Narrow on the first id field, then match the full key in Python
+        first = self.id_fields[0]
+        values = list({first.clean(row) for row in self.dataset.dict})
+        for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+            chunk = values[start:start + LOOKUP_CHUNK_SIZE]
+            for instance in self.get_queryset().filter(**{f"{first.attribute}__in": chunk}):
+                self.all_instances[self.instance_key(instance)] = instance
+
+    def instance_key(self, instance):
+        return tuple(field.get_value(instance) for field in self.id_fields)
+
+    def get_instance(self, row):
+        return self.all_instances.get(tuple(field.clean(row) for field in self.id_fields))
+
+
+class CachedForeignKeyWidget(ForeignKeyWidget):
+    """ForeignKeyWidget resolving values from one query per import."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._instances = None
+
+    def get_instance_by_lookup_fields(self, value, row, **kwargs):
+        if self._instances is None:
+            self._instances = {getattr(obj, self.field): obj for obj in self.get_queryset(value, row, **kwargs)}
+        try:
+            return self._instances[value]
+        except KeyError:
+            raise self.model.DoesNotExist(f"{self.model.__name__} with {self.field}={value!r} does not exist")
+
+
+class BulkModelResource(resources.ModelResource):
+    def __init__(self, html_diff=True, **kwargs):
+        super().__init__(**kwargs)
+        if not html_diff:
+            # Command line dry runs only need the counts
+            self._meta = copy.copy(self._meta)
+            self._meta.skip_html_diff = True
+
+    class Meta:
+        use_bulk = True
+        batch_size = 1000
+        skip_unchanged = True
+        report_skipped = False
+        use_transactions = True
+        instance_loader_class = BulkInstanceLoader
+
+    def before_import(self, dataset, **kwargs):
+        # Foreign key maps are per import, so rows created since are seen
+        for field in self.get_import_fields():
+            if isinstance(field.widget, CachedForeignKeyWidget):
+                field.widget._instances = None
+        super().before_import(dataset, **kwargs)
+
+    @classmethod
+    def has_writes(cls, result, dry_run):
+        return not dry_run and (result.totals.get("new") or result.totals.get("update"))
+
+
+class CategoryResource(BulkModelResource):
+    class Meta(BulkModelResource.Meta):
+        model = Category
+        import_id_fields = ("name",)
+        fields = ("name",)
+
+    def after_import(self, dataset, result, **kwargs):
+        # bulk writes skip the model signals that move the catalog version
+        if self.has_writes(result, kwargs.get("dry_run")):
+            bump_catalog_version()
+
+
+class DishResource(BulkModelResource):
+    category = fields.Field(
+        column_name="category",
+        attribute="category",
+        widget=CachedForeignKeyWidget(Category, field="name"),
+    )
+
+    class Meta(BulkModelResource.Meta):
+        model = Dish
+        import_id_fields = ("name", "category")
+        fields = ("name", "arabic_name", "description", "price", "category")
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("category")
+
+    def after_import(self, dataset, result, **kwargs):
+        if self.has_writes(result, kwargs.get("dry_run")):
+            bump_catalog_version()
+            if result.totals.get("update"):
+                # Prices may have changed; one UPDATE over all menus
+                Menu.refresh_sub_totals(Menu.objects.all())
+
+
+class CustomerDetailsResource(BulkModelResource):
+    class Meta(BulkModelResource.Meta):
+        model = CustomerDetails
+        import_id_fields = ("phone_number",)
+        fields = ("customer_name", "phone_number", "address")
+
+
+class SidebarItemResource(BulkModelResource):
+    class Meta(BulkModelResource.Meta):
+        model = SidebarItem
+        import_id_fields = ("path",)
+        fields = ("path", "icon", "label", "active")
+
+
+# model label -> resource, used by the bulk_import command
+BULK_RESOURCES = {
+    "category": CategoryResource,
+    "dish": DishResource,
+    "customerdetails": CustomerDetailsResource,
+    "sidebaritem": SidebarItemResource,
+}
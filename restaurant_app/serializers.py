@@ -4,8 +4,14 @@ from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import update_last_login
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from decimal import Decimal
 from delivery_drivers.models import DeliveryDriver
 from restaurant_app.models import *
+from restaurant_app.images import variant_urls
+from restaurant_app.price_map import get_price_map, record_mismatch
+from restaurant_app.signal_control import suppress
+from django.conf import settings
 
 
 
@@ -90,15 +96,29 @@ class PasscodeLoginSerializer(serializers.Serializer):
 # serializer to change the logo for the company
 
 class LogoInfoSerializer(serializers.ModelSerializer):
+    main_logo_urls = serializers.SerializerMethodField()
+    print_logo_urls = serializers.SerializerMethodField()
+
     class Meta:
         model = LogoInfo
-        fields = '__all__'
+        exclude = ["main_logo_variants", "print_logo_variants"]
+
+    def get_main_logo_urls(self, obj):
+        return variant_urls(obj.main_logo, obj.main_logo_variants, self.context.get("request"))
+
+    def get_print_logo_urls(self, obj):
+        return variant_urls(obj.print_logo, obj.print_logo_variants, self.context.get("request"))
         
 
 class CategorySerializer(serializers.ModelSerializer):
+    image_urls = serializers.SerializerMethodField()
+
     class Meta:
         model = Category
-        fields = ["id", "name","image"]
+        fields = ["id", "name","image", "image_urls"]
+
+    def get_image_urls(self, obj):
+        return variant_urls(obj.image, obj.image_variants, self.context.get("request"))
 
 
 class DishSizeSerializer(serializers.ModelSerializer):
@@ -110,6 +130,8 @@ class DishSizeSerializer(serializers.ModelSerializer):
 class DishSerializer(serializers.ModelSerializer):
     sizes = DishSizeSerializer(many=True, read_only=True, source='size')  
     category_name = serializers.CharField(source='category.name', read_only=True)
+    image_urls = serializers.SerializerMethodField()
+
     class Meta:
         model = Dish
         fields = [
@@ -121,9 +143,13 @@ class DishSerializer(serializers.ModelSerializer):
             "category",
             "sizes",
             "arabic_name",
-            "category_name"
+            "category_name",
+            "image_urls",
         ]
 
+    def get_image_urls(self, obj):
+        return variant_urls(obj.image, obj.image_variants, self.context.get("request"))
+
 
 class DishVariantSerializer(serializers.ModelSerializer):
     class Meta:
@@ -131,13 +157,149 @@ class DishVariantSerializer(serializers.ModelSerializer):
         fields = ['id', 'name','dish']
 
 
+class BatchUpsertListSerializer(serializers.ListSerializer):
+    """
+    Creates items without an `id` and updates the others, in one transaction
+    with one bulk_create and one bulk_update. Foreign keys are plain ids,
+    checked with one query per related model instead of one per item.
+
+    Child serializers declare in Meta:
+    - batch_foreign_keys: {"<field>_id": related model}
+    - batch_required: fields every new item must have
+
+    and may define after_batch(created, updated, update_fields), called
+    inside the transaction once everything is written.
+    """
+
+    def validate(self, items):
+        meta = self.child.Meta
+        errors = [{} for _ in items]
+        for index, item in enumerate(items):
+            if "id" not in item:
+                missing = [field for field in meta.batch_required if field not in item]
+                for field in missing:
+                    errors[index][field.removesuffix("_id")] = ["This field is required."]
+
+        for field, related_model in meta.batch_foreign_keys.items():
+            ids = {item[field] for item in items if field in item}
+            found = set(related_model.objects.filter(id__in=ids).values_list("id", flat=True))
+            for index, item in enumerate(items):
+                if field in item and item[field] not in found:
+                    errors[index][field.removesuffix("_id")] = [f"Invalid pk \"{item[field]}\" - object does not exist."]
+
+        update_ids = {item["id"] for item in items if "id" in item}
+        found = set(meta.model.objects.filter(id__in=update_ids).values_list("id", flat=True))
+        for index, item in enumerate(items):
+            if "id" in item and item["id"] not in found:
+                errors[index]["id"] = [f"{meta.model.__name__} {item['id']} does not exist."]
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def save(self, **kwargs):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            new_items = [item for item in self.validated_data if "id" not in item]
+            updates = [item for item in self.validated_data if "id" in item]
+
+            created = model.objects.bulk_create([model(**item) for item in new_items])
+            existing = model.objects.in_bulk([item["id"] for item in updates])
+            update_fields = set()
+            for item in updates:
+                instance = existing[item["id"]]
+                for field, value in item.items():
+                    if field != "id":
+                        setattr(instance, field, value)
+                        update_fields.add(field)
+            if update_fields:
+                model.objects.bulk_update(existing.values(), sorted(update_fields), batch_size=500)
+
+            if hasattr(self.child, "after_batch"):
+                self.child.after_batch(created, list(existing.values()), update_fields)
+            # bulk writes skip model signals, so bump the catalog once here
+            bump_catalog_version()
+        self.instance = created + list(existing.values())
+        return self.instance
+
+
+class DishBatchSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(source="category_id", required=False)
+
+    class Meta:
+        model = Dish
+        fields = ["id", "name", "arabic_name", "description", "price", "category"]
+        extra_kwargs = {"name": {"required": False}}
+        list_serializer_class = BatchUpsertListSerializer
+        batch_foreign_keys = {"category_id": Category}
+        batch_required = ["name", "category_id"]
+
+    def after_batch(self, created, updated, update_fields):
+        if "price" in update_fields:
+            Menu.refresh_sub_totals(Menu.objects.filter(
+                pk__in=MenuItem.objects.filter(dish_id__in=[dish.id for dish in updated]).values("menu_id")
+            ))
+
+
+class DishSizeBatchSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    dish = serializers.IntegerField(source="dish_id", required=False)
+
+    class Meta:
+        model = DishSize
+        fields = ["id", "dish", "size", "price"]
+        extra_kwargs = {"size": {"required": False}, "price": {"required": False}}
+        list_serializer_class = BatchUpsertListSerializer
+        batch_foreign_keys = {"dish_id": Dish}
+        batch_required = ["dish_id", "size", "price"]
+
+
+class DishVariantBatchSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    dish = serializers.IntegerField(source="dish_id", required=False)
+
+    class Meta:
+        model = DishVariant
+        fields = ["id", "dish", "name"]
+        extra_kwargs = {"name": {"required": False}}
+        list_serializer_class = BatchUpsertListSerializer
+        batch_foreign_keys = {"dish_id": Dish}
+        batch_required = ["dish_id", "name"]
+
+
+class PriceAdjustmentSerializer(serializers.Serializer):
+    """
+    Percentage change of dish (and optionally size) prices, rounded to a
+    step, for one category, a list of dishes, or the whole menu.
+    """
+    # At most ten times the price; adjust_prices checks the resulting prices too
+    percent = serializers.DecimalField(max_digits=6, decimal_places=2, max_value=Decimal("900"))
+    round_to = serializers.DecimalField(max_digits=6, decimal_places=2, default=Decimal("0.01"), min_value=Decimal("0.01"))
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
+    dish_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    include_sizes = serializers.BooleanField(default=True)
+
+    def validate_percent(self, value):
+        if value <= -100:
+            raise serializers.ValidationError("A price cannot drop by 100% or more.")
+        return value
+
+
 class OnlineOrderSerializer(serializers.ModelSerializer):
+    logo_urls = serializers.SerializerMethodField()
+
     class Meta:
         model = OnlineOrder
-        fields = ['id', 'name', 'percentage', 'reference', 'logo']
+        fields = ['id', 'name', 'percentage', 'reference', 'logo', 'logo_urls']
+
+    def get_logo_urls(self, obj):
+        return variant_urls(obj.logo, obj.logo_variants, self.context.get("request"))
 
 class OrderItemSerializer(serializers.ModelSerializer):
     arabic_name = serializers.SerializerMethodField()
+    # Filled from the catalog when left out
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
     
     class Meta:
         model = OrderItem
@@ -150,8 +312,12 @@ class OrderItemSerializer(serializers.ModelSerializer):
             "quantity", 
             "is_newly_added", 
             "variants",
-            "category_name"
+            "category_name",
+            "dish_id",
+            "size_id",
+            "category_id",
         ]
+        read_only_fields = ["dish_id", "size_id", "category_id"]
     
     def get_arabic_name(self, obj):
         try:
@@ -216,6 +382,45 @@ class OrderSerializer(serializers.ModelSerializer):
             if foc_product.name is not None
         ]
 
+    def validate_items(self, items):
+        """
+        Check every item against the in-memory price map: fill a missing
+        price or category name, and log (and depending on
+        settings.ORDER_PRICE_MISMATCH correct or reject) a price that
+        differs from the catalog.
+        """
+        price_map = get_price_map()
+        policy = getattr(settings, "ORDER_PRICE_MISMATCH", "log")
+        errors = []
+        for item in items:
+            dish_id, size_id, catalog_price, category_id = price_map.lookup(item["dish_name"], item.get("size_name"))
+            error = {}
+            if not item.get("category_name") and category_id:
+                item["category_name"] = price_map.category_names[category_id]
+            if "price" not in item:
+                if catalog_price is None:
+                    error["price"] = ["This field is required for items not in the menu."]
+                else:
+                    item["price"] = catalog_price
+            elif catalog_price is not None and item["price"] != catalog_price:
+                record_mismatch(item["dish_name"], item.get("size_name"), item["price"], catalog_price)
+                if policy == "correct":
+                    item["price"] = catalog_price
+                elif policy == "reject":
+                    error["price"] = [f"Price of {item['dish_name']} is {catalog_price}."]
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def create_items(self, order, items_data):
+        # Link every item to the dish, size and category it was sold from
+        catalog_maps = get_price_map().maps()
+        items = [OrderItem(order=order, **item_data) for item_data in items_data]
+        for item in items:
+            item.link_catalog(*catalog_maps)
+        return OrderItem.objects.bulk_create(items)
+
     def create(self, validated_data):
         items_data = validated_data.pop("items")
         foc_products_data = validated_data.pop("foc_products", [])
@@ -223,8 +428,7 @@ class OrderSerializer(serializers.ModelSerializer):
         order = Order.objects.create(user=user, **validated_data)
         total_amount = 0
 
-        for item_data in items_data:
-            order_item = OrderItem.objects.create(order=order, **item_data)
+        for order_item in self.create_items(order, items_data):
             total_amount += order_item.quantity * order_item.price
         
         # Add delivery charge to total amount if it's not the default value
@@ -254,7 +458,7 @@ class OrderSerializer(serializers.ModelSerializer):
         if items_data:
             for item_data in items_data:
                 item_data['is_newly_added'] = True  # Marking as newly added
-                order_item = OrderItem.objects.create(order=instance, **item_data)
+            for order_item in self.create_items(instance, items_data):
                 total_amount += order_item.quantity * order_item.price
         
         # Add delivery charge to total amount if it's not the default value
@@ -488,6 +692,45 @@ class MenuSerializer(serializers.ModelSerializer):
         ]
 
 
+class MenuBuilderItemSerializer(serializers.Serializer):
+    dish_id = serializers.IntegerField()
+    meal_type = serializers.ChoiceField(
+        choices=MenuItem.MEAL_TYPE_CHOICES, required=False, allow_null=True
+    )
+
+
+class MenuBuilderSerializer(serializers.Serializer):
+    """
+    Adds many items to a menu in one transaction. With `replace` the
+    existing items are removed first. The sub total is refreshed once.
+    """
+    items = MenuBuilderItemSerializer(many=True, allow_empty=False)
+    replace = serializers.BooleanField(default=False)
+
+    def validate_items(self, items):
+        dish_ids = {item["dish_id"] for item in items}
+        found = set(Dish.objects.filter(id__in=dish_ids).values_list("id", flat=True))
+        missing = sorted(dish_ids - found)
+        if missing:
+            raise serializers.ValidationError(f"Dishes not found: {missing}")
+        return items
+
+    def save(self, menu):
+        with transaction.atomic():
+            if self.validated_data["replace"]:
+                # The total is refreshed once below, not per deleted item
+                with suppress(reduce_menu_sub_total):
+                    menu.menu_items.all().delete()
+            MenuItem.objects.bulk_create([
+                MenuItem(menu=menu, dish_id=item["dish_id"], meal_type=item.get("meal_type"))
+                for item in self.validated_data["items"]
+            ])
+            Menu.refresh_sub_totals(Menu.objects.filter(pk=menu.pk))
+            bump_mess_forecast_version()
+        menu.refresh_from_db(fields=["sub_total"])
+        return menu
+
+
 class MessSerializer(serializers.ModelSerializer):
     mess_type = MessTypeSerializer(read_only=True)
     mess_type_id = serializers.PrimaryKeyRelatedField(
@@ -552,6 +795,50 @@ class CreditOrderSerializer(serializers.ModelSerializer):
         fields = ["id", "order"]
 
 
+class CreditOrderDetailSerializer(serializers.ModelSerializer):
+    invoice_number = serializers.CharField(source="order.invoice_number", read_only=True)
+    created_at = serializers.DateTimeField(source="order.created_at", read_only=True)
+    total_amount = serializers.DecimalField(source="order.total_amount", max_digits=10, decimal_places=2, read_only=True)
+    status = serializers.CharField(source="order.status", read_only=True)
+    order_type = serializers.CharField(source="order.order_type", read_only=True)
+
+    class Meta:
+        model = CreditOrder
+        fields = ["id", "order", "invoice_number", "created_at", "total_amount", "status", "order_type"]
+
+
+class CreditUserListSerializer(serializers.ModelSerializer):
+    """
+    CreditUser without the nested credit orders, for ?compact=true lists.
+    The counters are annotated by credit_reports.annotate_credit_summary.
+    """
+    order_count = serializers.IntegerField(read_only=True)
+    last_order_date = serializers.DateTimeField(read_only=True)
+    last_payment_date = serializers.DateField(read_only=True)
+    ordered_amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    paid_amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    outstanding = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = CreditUser
+        fields = [
+            "id",
+            "username",
+            "mobile_number",
+            "bill_date",
+            "due_date",
+            "total_due",
+            "is_active",
+            "limit_amount",
+            "order_count",
+            "last_order_date",
+            "last_payment_date",
+            "ordered_amount",
+            "paid_amount",
+            "outstanding",
+        ]
+
+
 class CreditUserSerializer(serializers.ModelSerializer):
     credit_orders = CreditOrderSerializer(many=True, read_only=True)
 
@@ -568,6 +855,24 @@ class CreditUserSerializer(serializers.ModelSerializer):
             "credit_orders",
             "limit_amount"
         ]
+
+
+class CreditPaymentSerializer(serializers.Serializer):
+    """Body of a credit user's make_payment; "cash-bank" needs the split."""
+    payment_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal("0.01"))
+    payment_method = serializers.ChoiceField(choices=CreditTransaction.PAYMENT_METHOD_CHOICES, default="cash")
+    cash_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal("0.00"), required=False)
+    bank_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal("0.00"), required=False)
+
+    def validate(self, data):
+        if data['payment_method'] == 'cash-bank':
+            if 'cash_amount' not in data or 'bank_amount' not in data:
+                raise serializers.ValidationError("cash_amount and bank_amount are required for cash-bank payments.")
+            if data['cash_amount'] + data['bank_amount'] != data['payment_amount']:
+                raise serializers.ValidationError("cash_amount and bank_amount must add up to payment_amount.")
+        return data
+
+
 class MessTransactionSerializer(serializers.ModelSerializer):
     
     class Meta:
@@ -666,3 +971,9 @@ class ChairBookingSerializer(serializers.ModelSerializer):
             validated_data['booked_date'] = start_time.date()
         return super().create(validated_data)
 
+
+
+class PrintJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PrintJob
+        fields = ['id', 'printer', 'printer_type', 'status', 'attempts', 'last_error', 'created_at', 'printed_at']
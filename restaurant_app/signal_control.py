@@ -0,0 +1,38 @@
+"""
+Context-local suppression of signal handlers.
+
+A handler decorated with @suppressible does nothing while it is suppressed
+in the current context:
+
+    with suppress(update_mess_on_transaction_save):
+        MessTransaction.objects.create(...)
+
+The suppressed set lives in a ContextVar, so it is per thread (and per
+asyncio task under ASGI). Suppressing a handler in one request never
+affects requests running at the same time in other workers' threads,
+which a module-level flag did.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+_suppressed = ContextVar("suppressed_signal_handlers", default=frozenset())
+
+
+def suppressible(handler):
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if wrapper in _suppressed.get():
+            return None
+        return handler(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def suppress(*handlers):
+    """Suppress the given @suppressible handlers until the block exits."""
+    token = _suppressed.set(_suppressed.get() | frozenset(handlers))
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
@@ -1,3 +1,1012 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import catalog, dish_search, images, invoices, price_map
+from .printing import BaseBackend, PrintWorker, queue_print
+from .resources import CategoryResource, DishResource
+from .messaging import FakeTransport, MessageWorker, PermanentDeliveryError, claim_batch, enqueue
+from .images import generate_for_instance
+from .models import (
+    Category, CreditOrder, CreditReminder, CreditTransaction, CreditUser, Dish, DishSize, Menu, MenuItem, Mess,
+    MessTransaction, MessType, Order, OutboundMessage, PrintJob, update_mess_on_transaction_save,
+)
+from .reminders import overdue_credit_users, send_overdue_reminders
+from .utils import shorten_url
+from .signal_control import suppress, suppressible
+
+User = get_user_model()
+
+class MessSignalSuppressionTests(TransactionTestCase):
+    def setUp(self):
+        self.mess_type = MessType.objects.create(name="breakfast_lunch")
+
+    def create_mess(self, n, paid):
+        return Mess.objects.create(
+            customer_name=f"customer {n}",
+            mobile_number=f"5000{n:04d}",
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30),
+            mess_type=self.mess_type,
+            total_amount=Decimal("300.00"),
+            grand_total=Decimal("300.00"),
+            paid_amount=paid,
+            pending_amount=Decimal("300.00") - paid,
+            cash_amount=paid,
+            bank_amount=Decimal("0.00"),
+        )
+
+    def pay(self, mess, amount):
+        return MessTransaction.objects.create(
+            mess=mess, received_amount=amount, cash_amount=amount, bank_amount=Decimal("0.00"), status="due"
+        )
+
+    def test_suppression_is_local_to_the_thread(self):
+        mess = self.create_mess(1, Decimal("100.00"))
+        suppressed = threading.Event()
+        paid = threading.Event()
+
+        def suppressing_request():
+            with suppress(update_mess_on_transaction_save):
+                suppressed.set()
+                paid.wait(5)
+
+        def paying_request():
+            suppressed.wait(5)
+            try:
+                self.pay(Mess.objects.get(pk=mess.pk), Decimal("50.00"))
+            finally:
+                paid.set()
+                close_old_connections()
+
+        threads = [threading.Thread(target=suppressing_request), threading.Thread(target=paying_request)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        mess.refresh_from_db()
+        self.assertEqual(mess.paid_amount, Decimal("150.00"))
+        self.assertEqual(mess.pending_amount, Decimal("150.00"))
+
+    def test_concurrent_suppression_only_silences_its_own_thread(self):
+        calls = []
+
+        @suppressible
+        def handler(thread):
+            calls.append(thread)
+
+        # Every thread is inside (or outside) its suppress() block at once
+        barrier = threading.Barrier(16, timeout=5)
+
+        def request(n):
+            if n % 2:
+                with suppress(handler):
+                    barrier.wait()
+                    handler(n)
+                    barrier.wait()
+            else:
+                barrier.wait()
+                handler(n)
+                barrier.wait()
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(request, range(16)))
+
+        self.assertEqual(sorted(calls), list(range(0, 16, 2)))
+
+    def test_parallel_mess_creations_and_payments(self):
+        # Each creation suppresses the payment handler for its own initial
+        # transaction while other threads' payments go through it
+        def customer(n):
+            try:
+                mess = self.create_mess(n, Decimal("100.00"))
+                for _ in range(3):
+                    self.pay(Mess.objects.get(pk=mess.pk), Decimal("20.00"))
+                return mess.pk
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            pks = list(executor.map(customer, range(24)))
+
+        self.assertEqual(len(pks), 24)
+        for mess in Mess.objects.filter(pk__in=pks):
+            self.assertTrue(mess.initial_transaction_created)
+            self.assertEqual(mess.paid_amount, Decimal("160.00"))
+            self.assertEqual(mess.pending_amount, Decimal("140.00"))
+            self.assertEqual(mess.cash_amount, Decimal("160.00"))
+            self.assertEqual(mess.transactions.count(), 4)
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.category = Category.objects.create(name="Grill")
+
+    def upload(self, name="grill.png"):
+        image = BytesIO()
+        Image.new("RGB", (1200, 900), "red").save(image, "PNG")
+        return SimpleUploadedFile(name, image.getvalue(), content_type="image/png")
+
+    def scheduled(self):
+        return mock.patch.object(images._executor, "submit")
+
+    def test_field_default_is_not_scheduled(self):
+        with self.scheduled() as submit, self.captureOnCommitCallbacks(execute=True):
+            Dish.objects.create(name="Kebab", category=self.category, price=Decimal("12.00"))
+        submit.assert_not_called()
+
+    def test_upload_builds_derivatives(self):
+        with self.scheduled() as submit, self.captureOnCommitCallbacks(execute=True):
+            self.category.image = self.upload()
+            self.category.save()
+        submit.assert_called_once()
+
+        variants = generate_for_instance(Category, self.category.pk, "image")
+
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.image_variants, variants)
+        self.assertEqual(variants["source"], self.category.image.name)
+        for key in ("thumbnail", "thumbnail_webp", "medium", "medium_webp"):
+            with default_storage.open(variants[key]) as derivative:
+                self.assertLessEqual(max(Image.open(derivative).size), 800)
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="admin", email="admin@example.com", passcode="123456", role="admin")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class MenuSubTotalTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Mains")
+        self.rice = Dish.objects.create(name="Rice", category=category, price=Decimal("5.00"))
+        self.curry = Dish.objects.create(name="Curry", category=category, price=Decimal("8.00"))
+        self.menu = Menu.objects.create(name="Monday lunch")
+        MenuItem.objects.create(menu=self.menu, dish=self.rice)
+        MenuItem.objects.create(menu=self.menu, dish=self.rice)
+
+    def test_build_with_replace_totals_only_the_new_items(self):
+        response = self.client.post(
+            f"/api/menus/{self.menu.pk}/build/",
+            {"items": [{"dish_id": self.curry.pk, "meal_type": "lunch"}], "replace": True},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.menu.menu_items.values_list("dish", flat=True)), [self.curry.pk])
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.sub_total, Decimal("8.00"))
+
+    def test_price_change_reaches_the_menus(self):
+        dish = Dish.objects.get(pk=self.rice.pk)
+        dish.price = Decimal("6.50")
+        dish.save()
+
+        self.menu.refresh_from_db()
+        self.assertEqual(self.menu.sub_total, Decimal("13.00"))
+
+    def test_saving_without_a_price_change_leaves_the_menus_alone(self):
+        dish = Dish.objects.get(pk=self.rice.pk)
+        dish.name = "Basmati rice"
+        with CaptureQueriesContext(connection) as queries:
+            dish.save()
+            dish.save(update_fields=["name"])
+        self.assertFalse([query for query in queries if "restaurant_app_menu" in query["sql"]])
+
+
+class MessForecastTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        category = Category.objects.create(name="Mains")
+        rice = Dish.objects.create(name="Rice", category=category, price=Decimal("5.00"))
+        menu = Menu.objects.create(name="Monday", day_of_week="monday")
+        MenuItem.objects.create(menu=menu, dish=rice, meal_type="lunch")
+        MenuItem.objects.create(menu=menu, dish=rice, meal_type="dinner")
+        mess_type = MessType.objects.create(name="breakfast_lunch")
+        for n in range(2):
+            mess = Mess.objects.create(
+                customer_name=f"customer {n}", mobile_number=f"5000{n:04d}", mess_type=mess_type,
+                start_date=date(2024, 3, 1), end_date=date(2024, 3, 31),
+            )
+            mess.menus.add(menu)
+        self.rice = rice
+
+    def test_portions_per_meal(self):
+        response = self.client.get("/api/messes/forecast/", {"from_date": "2024-03-04", "to_date": "2024-03-05"})
+
+        self.assertEqual(response.status_code, 200)
+        monday, tuesday = response.data["days"]
+        self.assertEqual(monday["meals"]["lunch"]["subscribers"], 2)
+        self.assertEqual(monday["meals"]["lunch"]["dishes"], [{"dish_id": self.rice.pk, "dish_name": "Rice", "portions": 2}])
+        # Not in a breakfast_lunch subscription
+        self.assertEqual(monday["meals"]["dinner"]["dishes"], [])
+        self.assertEqual(tuesday["meals"]["lunch"]["dishes"], [])
+
+    def test_invalid_dates_are_rejected(self):
+        for params in ({"from_date": "2024-13-45"}, {"to_date": "2024-02-30"}, {"from_date": "tomorrow"}):
+            response = self.client.get("/api/messes/forecast/", params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class PriceAdjustmentTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Mains")
+        self.rice = Dish.objects.create(name="Rice", category=category, price=Decimal("10.00"))
+        self.platter = Dish.objects.create(name="Platter", category=category, price=Decimal("5000.00"))
+        self.large = DishSize.objects.create(dish=self.rice, size="large", price=Decimal("14.00"))
+        self.menu = Menu.objects.create(name="Monday lunch")
+        MenuItem.objects.create(menu=self.menu, dish=self.rice)
+
+    def adjust(self, **data):
+        return self.client.post("/api/dishes/adjust-prices/", data, format="json")
+
+    def test_prices_sizes_and_menus_move_together(self):
+        response = self.adjust(percent="5", round_to="0.25", dish_ids=[self.rice.pk])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"updated": 1})
+        self.rice.refresh_from_db()
+        self.large.refresh_from_db()
+        self.menu.refresh_from_db()
+        self.assertEqual(self.rice.price, Decimal("10.50"))
+        self.assertEqual(self.large.price, Decimal("14.75"))
+        self.assertEqual(self.menu.sub_total, Decimal("10.50"))
+
+    def test_adjustment_that_overflows_a_price_changes_nothing(self):
+        response = self.adjust(percent="100")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("9999.99", response.data["error"])
+        self.assertEqual(
+            sorted(Dish.objects.values_list("price", flat=True)), [Decimal("10.00"), Decimal("5000.00")]
+        )
+
+    def test_percent_is_capped(self):
+        response = self.adjust(percent="950", dish_ids=[self.rice.pk])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("percent", response.data)
+
+    def test_batch_without_after_batch_hook(self):
+        response = self.client.post(
+            "/api/dish-sizes/batch/",
+            [{"id": self.large.pk, "price": "15.00"}, {"dish": self.rice.pk, "size": "small", "price": "8.00"}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(sorted(self.rice.size.values_list("price", flat=True)), [Decimal("8.00"), Decimal("15.00")])
+
+
+class ReconcileBalancesTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = CreditUser.objects.create(username="customer", mobile_number="5551234", limit_amount=1000)
+        order = Order.objects.create(
+            user=self.user, total_amount=Decimal("100.00"), status="delivered", payment_method="credit",
+            credit_user_id=self.customer.pk,
+        )
+        CreditOrder.objects.create(order=order, credit_user=self.customer)
+        CreditUser.objects.filter(pk=self.customer.pk).update(total_due=Decimal("100.00"))
+        self.customer.refresh_from_db()
+
+    def reconcile(self, *args):
+        output = StringIO()
+        call_command("reconcile_balances", "--only", "credit", *args, stdout=output)
+        self.customer.refresh_from_db()
+        return output.getvalue()
+
+    def test_reports_without_writing_by_default(self):
+        CreditTransaction.objects.create(credit_user=self.customer, received_amount=Decimal("30.00"))
+        CreditUser.objects.filter(pk=self.customer.pk).update(total_due=Decimal("90.00"))
+
+        output = self.reconcile()
+
+        self.assertIn("total_due 90.00 -> 70.00", output)
+        self.assertIn("1 would be updated", output)
+        self.assertEqual(self.customer.total_due, Decimal("90.00"))
+
+        self.assertIn("1 updated", self.reconcile("--apply"))
+        self.assertEqual(self.customer.total_due, Decimal("70.00"))
+
+    def test_payment_without_history_row_is_flagged(self):
+        # What make_payment did before it recorded a CreditTransaction
+        CreditUser.objects.filter(pk=self.customer.pk).update(total_due=Decimal("60.00"))
+
+        output = self.reconcile()
+
+        self.assertIn("1 would owe more than stored", output)
+        self.assertEqual(self.customer.total_due, Decimal("60.00"))
+
+
+class CreditBalanceTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = CreditUser.objects.create(username="customer", mobile_number="5551234", limit_amount=100)
+
+    def test_stale_instances_do_not_lose_updates(self):
+        first, second = CreditUser.objects.get(pk=self.customer.pk), CreditUser.objects.get(pk=self.customer.pk)
+        first.add_to_total_due(Decimal("30.00"))
+        second.add_to_total_due(Decimal("20.00"))
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal("50.00"))
+        self.assertEqual(second.total_due, Decimal("50.00"))
+
+    def test_is_active_is_derived_in_the_same_update(self):
+        self.customer.add_to_total_due(Decimal("60.00"))
+        with CaptureQueriesContext(connection) as queries:
+            self.customer.add_to_total_due(Decimal("40.00"))
+
+        updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"is_active"', updates[0])
+        self.assertFalse(self.customer.is_active)
+        self.assertFalse(CreditUser.objects.get(pk=self.customer.pk).is_active)
+
+    def test_transaction_edit_moves_the_balance_by_the_difference(self):
+        self.customer.add_to_total_due(Decimal("80.00"))
+        payment = CreditTransaction.objects.create(credit_user=self.customer, received_amount=Decimal("30.00"))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal("50.00"))
+
+        payment.received_amount = Decimal("45.00")
+        payment.save()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal("35.00"))
+
+    def test_mess_transaction_edit_moves_the_mess_by_the_difference(self):
+        mess_type = MessType.objects.create(name="lunch")
+        mess = Mess.objects.create(
+            customer_name="customer", mobile_number="50000001", start_date=date.today(),
+            end_date=date.today() + timedelta(days=30), mess_type=mess_type, total_amount=Decimal("300.00"),
+            grand_total=Decimal("300.00"), paid_amount=Decimal("0.00"), pending_amount=Decimal("300.00"),
+        )
+        payment = MessTransaction.objects.create(
+            mess=mess, received_amount=Decimal("20.00"), cash_amount=Decimal("20.00"), status="due"
+        )
+        payment.received_amount = payment.cash_amount = Decimal("50.00")
+        payment.save()
+
+        mess.refresh_from_db()
+        self.assertEqual(mess.paid_amount, Decimal("50.00"))
+        self.assertEqual(mess.pending_amount, Decimal("250.00"))
+        self.assertEqual(mess.cash_amount, Decimal("50.00"))
+
+    def pay(self, **body):
+        return self.client.post(f"/api/credit-users/{self.customer.pk}/make_payment/", body, format="json")
+
+    def test_make_payment_records_a_history_row(self):
+        self.customer.add_to_total_due(Decimal("80.00"))
+
+        response = self.pay(payment_amount="100.00", payment_method="cash-bank", cash_amount="70.00", bank_amount="30.00")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data["total_due"]), Decimal("0.00"))
+        payment = CreditTransaction.objects.get(credit_user=self.customer)
+        # Only the amount due is taken, the change comes out of the cash
+        self.assertEqual(
+            (payment.received_amount, payment.cash_amount, payment.bank_amount, payment.payment_method),
+            (Decimal("80.00"), Decimal("50.00"), Decimal("30.00"), "cash-bank"),
+        )
+
+    def test_make_payment_rejects_unknown_methods_and_missing_splits(self):
+        self.customer.add_to_total_due(Decimal("80.00"))
+
+        for body in (
+            {"payment_amount": "10.00", "payment_method": "cheque"},
+            {"payment_amount": "10.00", "payment_method": "cash-bank"},
+            {"payment_amount": "10.00", "payment_method": "cash-bank", "cash_amount": "4.00", "bank_amount": "5.00"},
+            {"payment_amount": "abc"},
+            {"payment_amount": "0"},
+        ):
+            self.assertEqual(self.pay(**body).status_code, 400, body)
+        with self.assertRaises(DjangoValidationError):
+            self.customer.make_payment(Decimal("10.00"), "credit")
+
+        self.assertFalse(CreditTransaction.objects.exists())
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal("80.00"))
+
+    def test_credit_order_is_charged_once(self):
+        order = Order.objects.create(user=self.user, total_amount=Decimal("40.00"))
+        body = {"status": "delivered", "payment_method": "credit", "credit_user_id": self.customer.pk}
+
+        for _ in range(2):
+            response = self.client.patch(f"/api/order-status/{order.pk}/", body, format="json")
+            self.assertEqual(response.status_code, 200)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal("40.00"))
+        self.assertEqual(CreditOrder.objects.filter(order=order).count(), 1)
+
+
+class RefusingTransport(FakeTransport):
+    def send(self, message):
+        raise PermanentDeliveryError("Invalid 'To' number")
+
+
+class MessageWorkerTests(TestCase):
+    def setUp(self):
+        FakeTransport.outbox.clear()
+        FakeTransport.failures.clear()
+        self.addCleanup(FakeTransport.failures.clear)
+
+    def work(self, transport=None):
+        worker = MessageWorker(transport or FakeTransport())
+        try:
+            return worker.process_batch()
+        finally:
+            worker.executor.shutdown()
+
+    def test_failed_send_is_retried_later(self):
+        message = enqueue("+97455512345", "Your order is ready")
+        FakeTransport.failures["+97455512345"] = 1
+
+        self.assertEqual(self.work(), 1)
+        message.refresh_from_db()
+        self.assertEqual(message.status, "pending")
+        self.assertEqual(message.attempts, 1)
+        self.assertIn("ConnectionError", message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(self.work(), 0)
+
+        OutboundMessage.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(self.work(), 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.last_error), ("sent", 2, ""))
+        self.assertEqual(FakeTransport.outbox, [("whatsapp", "+97455512345", "Your order is ready")])
+
+    def test_permanent_failure_is_not_retried(self):
+        message = enqueue("+97400000000", "Your order is ready")
+
+        self.work(RefusingTransport())
+
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("failed", 1))
+        self.assertIn("Invalid 'To' number", message.last_error)
+
+    def test_stale_claims_are_reclaimed(self):
+        now = timezone.now()
+        stale = enqueue("+97455500001", "stale")
+        held = enqueue("+97455500002", "held")
+        OutboundMessage.objects.filter(pk=stale.pk).update(
+            status="sending", claim_token="dead-worker", claimed_at=now - timedelta(minutes=10)
+        )
+        OutboundMessage.objects.filter(pk=held.pk).update(
+            status="sending", claim_token="live-worker", claimed_at=now - timedelta(seconds=10)
+        )
+
+        self.assertEqual([message.pk for message in claim_batch(10, now)], [stale.pk])
+
+
+class CreditReminderThrottleTests(TestCase):
+    def setUp(self):
+        self.customer = CreditUser.objects.create(
+            username="customer", mobile_number="5551234", total_due=Decimal("50.00"),
+            due_date=timezone.now() - timedelta(days=3),
+        )
+
+    def remind(self, outbound_message=None):
+        return CreditReminder.objects.create(
+            credit_user=self.customer, due_date=self.customer.due_date, total_due=self.customer.total_due,
+            message="Please pay", outbound_message=outbound_message,
+        )
+
+    def test_reminder_from_before_the_outbox_counts_as_sent(self):
+        reminder = self.remind()
+
+        self.assertEqual(reminder.status, "sent")
+        self.assertFalse(overdue_credit_users().exists())
+
+    def test_overdue_customers_are_reminded_once_per_interval(self):
+        CreditUser.objects.create(username="paid up", mobile_number="5550000", due_date=timezone.now() - timedelta(days=3))
+        CreditUser.objects.create(
+            username="not due", mobile_number="5550001", total_due=Decimal("10.00"),
+            due_date=timezone.now() + timedelta(days=3),
+        )
+
+        self.assertEqual(send_overdue_reminders(dry_run=True), 1)
+        self.assertFalse(OutboundMessage.objects.exists())
+
+        self.assertEqual(send_overdue_reminders(batch_size=1), 1)
+        message = OutboundMessage.objects.get()
+        self.assertEqual((message.channel, message.recipient), ("whatsapp", "+9745551234"))
+        self.assertIn("50.00", message.body)
+        self.assertEqual(self.customer.reminders.get().outbound_message, message)
+
+        self.assertEqual(send_overdue_reminders(), 0)
+
+    def test_failed_reminder_does_not_throttle(self):
+        self.remind(OutboundMessage.objects.create(recipient="+9745551234", body="Please pay", status="failed"))
+
+        self.assertEqual(list(overdue_credit_users()), [self.customer])
+
+
+class InvoiceTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for n in range(2):
+            order = Order.objects.create(
+                user=self.user, total_amount=Decimal("12.00"), status="delivered", payment_method="cash",
+                invoice_number=f"INV-{n}",
+            )
+            order.items.create(dish_name="Rice", price=Decimal("6.00"), quantity=2)
+        self.today = timezone.now().date().isoformat()
+
+    def test_period_zip_is_rendered_in_the_request_process(self):
+        with override_settings(INVOICE_PDF={**settings.INVOICE_PDF, "inline_below": 0}), \
+                mock.patch.object(invoices, "ProcessPoolExecutor") as pool:
+            response = self.client.get(
+                "/api/orders/invoices/", {"from_date": self.today, "to_date": self.today, "output": "zip"}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        pool.assert_not_called()
+        with zipfile.ZipFile(BytesIO(response.content)) as archive:
+            self.assertEqual(sorted(archive.namelist()), ["invoice-INV-0.pdf", "invoice-INV-1.pdf"])
+
+    def test_invalid_or_too_large_periods_are_rejected(self):
+        for params in ({"from_date": "2024-13-45", "to_date": "2024-12-31"}, {"from_date": "2024-01-01"}):
+            self.assertEqual(self.client.get("/api/orders/invoices/", params).status_code, 400, params)
+
+        with override_settings(INVOICE_PDF={**settings.INVOICE_PDF, "api_max_orders": 1}):
+            response = self.client.get("/api/orders/invoices/", {"from_date": self.today, "to_date": self.today})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("render_invoices", response.data["detail"])
+
+    def test_command_writes_the_period(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "invoices.pdf")
+
+        call_command("render_invoices", self.today, self.today, "--pdf", "-o", path, stdout=StringIO())
+
+        with open(path, "rb") as output:
+            self.assertTrue(output.read().startswith(b"%PDF"))
+        with self.assertRaisesMessage(CommandError, "Invalid date"):
+            call_command("render_invoices", "2024-13-45", "2024-12-31", stdout=StringIO())
+
+
+class RecordingBackend(BaseBackend):
+    """kitchenprint waits for `release`, then fails; other printers record what they print."""
+    printed = []
+    sending = threading.Event()
+    release = threading.Event()
+
+    def send(self, job):
+        if self.printer == "kitchenprint":
+            self.sending.set()
+            self.release.wait(5)
+            raise ConnectionError("Printer offline")
+        self.printed.append(job.content)
+
+
+@override_settings(PRINTING={**settings.PRINTING, "backend": "restaurant_app.tests.RecordingBackend"})
+class PrintWorkerTests(TransactionTestCase):
+    def setUp(self):
+        RecordingBackend.printed = []
+        RecordingBackend.sending.clear()
+        RecordingBackend.release.clear()
+        self.worker = PrintWorker()
+        self.addCleanup(self.worker.executor.shutdown)
+        self.addCleanup(RecordingBackend.release.set)
+
+    def test_unreachable_printer_does_not_hold_up_the_others(self):
+        stuck = queue_print("kitchen", "<p>Shawarma</p>")
+        queued_behind = queue_print("pizza", "<p>Margherita</p>")
+        receipts = [queue_print("sales", f"<p>Receipt {n}</p>") for n in range(3)]
+
+        kitchen = self.worker.executor.submit(self.worker.drain_in_thread, "kitchenprint")
+        # SQLite's shared-cache test database takes one writer at a time, so
+        # only start once the kitchen thread has claimed its jobs
+        self.assertTrue(RecordingBackend.sending.wait(5))
+        self.assertEqual(self.worker.drain("salesprint"), 3)
+        self.assertFalse(kitchen.done())
+        self.assertEqual(
+            [content.split()[-3:-1] for content in RecordingBackend.printed],
+            [["Receipt", "0"], ["Receipt", "1"], ["Receipt", "2"]],
+        )
+        self.assertEqual({job.status for job in PrintJob.objects.filter(pk__in=[r.pk for r in receipts])}, {"printed"})
+
+        RecordingBackend.release.set()
+        self.assertEqual(kitchen.result(5), 1)
+        stuck.refresh_from_db()
+        queued_behind.refresh_from_db()
+        self.assertEqual((stuck.status, stuck.attempts), ("queued", 1))
+        self.assertIn("Printer offline", stuck.last_error)
+        # Held back behind the failed ticket, never attempted
+        self.assertEqual((queued_behind.status, queued_behind.attempts), ("queued", 0))
+
+    def test_run_once_stops_when_only_retries_are_left(self):
+        RecordingBackend.release.set()
+        queue_print("kitchen", "<p>Shawarma</p>")
+        queue_print("sales", "<p>Receipt</p>")
+
+        # One thread, for the same reason
+        with override_settings(PRINTING={**settings.PRINTING, "workers": 1}):
+            worker = PrintWorker()
+        worker.run(once=True)
+
+        self.assertEqual(dict(PrintJob.objects.values_list("printer", "status")), {
+            "kitchenprint": "queued", "salesprint": "printed",
+        })
+
+
+class PrintEndpointTests(ApiTestCase):
+    def test_job_is_queued(self):
+        response = self.client.post("/api/print/print_receipt/", {"type": "sales", "content": "<p>Total QAR 12</p>"}, format="json")
+
+        self.assertEqual(response.status_code, 202)
+        job = PrintJob.objects.get(pk=response.json()["job_id"])
+        self.assertEqual((job.printer, job.status), ("salesprint", "queued"))
+        self.assertIn("SALES RECEIPT", job.content)
+
+    def test_unknown_or_malformed_type_is_rejected(self):
+        for printer_type in ("bar", ["sales"], {"type": "sales"}, None):
+            response = self.client.post("/api/print/print_receipt/", {"type": printer_type}, format="json")
+            self.assertEqual(response.status_code, 400, printer_type)
+        self.assertFalse(PrintJob.objects.exists())
+
+
+class CatalogSnapshotTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        catalog._snapshots.clear()
+        self.category = Category.objects.create(name="Mains")
+        self.dish = Dish.objects.create(name="Rice", category=self.category, price=Decimal("5.00"))
+
+    def test_unchanged_catalog_answers_304(self):
+        first = self.client.get("/api/catalog/")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual([dish["name"] for dish in first.json()["dishes"]], ["Rice"])
+
+        again = self.client.get("/api/catalog/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], first["ETag"])
+
+    def test_change_moves_the_version(self):
+        first = self.client.get("/api/catalog/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.name = "Biryani"
+            self.dish.save()
+
+        response = self.client.get("/api/catalog/", HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()["version"], first.json()["version"])
+        self.assertEqual([dish["name"] for dish in response.json()["dishes"]], ["Biryani"])
+
+
+class DishSearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for name, value in (("_index", None), ("_sales", ({}, {})), ("_sales_refreshed_at", None), ("_refreshing", False)):
+            self.enterContext(mock.patch.object(dish_search, name, value))
+        # Popularity refreshes are run by hand instead of on a thread
+        self.start_refresh = self.enterContext(mock.patch.object(dish_search, "_start_refresh"))
+        category = Category.objects.create(name="Mains")
+        self.chicken = Dish.objects.create(name="Chicken Shawarma", arabic_name="شاورما دجاج", category=category)
+        self.beef = Dish.objects.create(name="Beef Shawarma", arabic_name="شاورما لحم", category=category)
+        self.salad = Dish.objects.create(name="Fattoush", description="Salad with fried bread", category=category)
+
+    def search(self, query):
+        response = self.client.get("/api/search-dishes/", {"search": query})
+        self.assertEqual(response.status_code, 200)
+        return [dish["id"] for dish in response.data["results"]]
+
+    def test_typos_and_prefixes_match(self):
+        self.assertEqual(self.search("chiken")[0], self.chicken.pk)
+        self.assertEqual(self.search("fatt"), [self.salad.pk])
+
+    def test_arabic_and_description_match(self):
+        self.assertEqual(self.search("لحم"), [self.beef.pk])
+        self.assertEqual(self.search("bread"), [self.salad.pk])
+
+    def test_popular_dish_ranks_first_on_equal_matches(self):
+        order = Order.objects.create(user=self.user, total_amount=Decimal("20.00"))
+        # Counted by dish id even though the printed name has since changed
+        order.items.create(dish=self.beef, dish_name="Beef Shawarma Wrap", price=Decimal("10.00"), quantity=2)
+        dish_search.refresh_popularity()
+
+        self.assertEqual(self.search("shawarma"), [self.beef.pk, self.chicken.pk])
+
+    def test_unlinked_items_count_by_name(self):
+        order = Order.objects.create(user=self.user, total_amount=Decimal("50.00"))
+        order.items.create(dish=self.beef, dish_name="Beef Shawarma", price=Decimal("10.00"), quantity=2)
+        order.items.create(dish_name="chicken shawarma", price=Decimal("10.00"), quantity=3)
+        dish_search.refresh_popularity()
+
+        self.assertEqual(self.search("shawarma"), [self.chicken.pk, self.beef.pk])
+
+    def test_popularity_is_not_loaded_in_the_request(self):
+        order = Order.objects.create(user=self.user, total_amount=Decimal("20.00"))
+        order.items.create(dish=self.beef, dish_name="Beef Shawarma", price=Decimal("10.00"), quantity=2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.search("shawarma")
+        self.assertFalse([query for query in queries if "orderitem" in query["sql"]])
+        self.start_refresh.assert_called_once()
+
+        # The refresh re-ranks the index already in use, then isn't due again for a while
+        index = dish_search._index
+        dish_search.refresh_popularity()
+        dish_search._refreshing = False
+        self.assertIs(dish_search._index, index)
+        self.assertEqual(self.search("shawarma"), [self.beef.pk, self.chicken.pk])
+        self.start_refresh.assert_called_once()
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "dishes.csv")
+        self.mains = Category.objects.create(name="Mains")
+        Category.objects.create(name="Drinks")
+        self.rice = Dish.objects.create(name="Rice", category=self.mains, price=Decimal("5.00"))
+        Dish.objects.create(name="Curry", arabic_name="", category=self.mains, price=Decimal("8.00"))
+
+    def import_dishes(self, rows, *args):
+        with open(self.path, "w", encoding="utf-8") as csv_file:
+            csv_file.write("name,arabic_name,description,price,category\n")
+            csv_file.writelines(f"{row}\n" for row in rows)
+        output, errors = StringIO(), StringIO()
+        call_command("bulk_import", "dish", self.path, *args, stdout=output, stderr=errors)
+        return output.getvalue(), errors.getvalue()
+
+    def rows(self):
+        return [
+            "Rice,,,6.00,Mains",
+            "Curry,,,8.00,Mains",
+            *(f"Juice {n},,,3.00,Drinks" for n in range(50)),
+        ]
+
+    def test_new_updated_and_unchanged_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            output, errors = self.import_dishes(self.rows())
+
+        self.assertEqual(errors, "")
+        self.assertIn("50 new, 1 update", output)
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.price, Decimal("6.00"))
+        self.assertEqual(Dish.objects.filter(category__name="Drinks").count(), 50)
+        # Not a query (or two) per row
+        self.assertLess(len(queries), 30)
+
+    def test_dry_run_writes_nothing(self):
+        output, _ = self.import_dishes(self.rows(), "--dry-run")
+
+        self.assertIn("Dry run: 50 new, 1 update", output)
+        self.assertEqual(Dish.objects.count(), 2)
+
+    def test_chunk_with_an_unknown_category_is_rolled_back(self):
+        output, errors = self.import_dishes(["Tea,,,2.00,Drinks", "Soup,,,4.00,Starters"])
+
+        self.assertIn("Starters", errors)
+        self.assertIn("2 rolled back", output)
+        self.assertFalse(Dish.objects.filter(name="Tea").exists())
+
+    def test_admin_export_keeps_every_column(self):
+        request = RequestFactory().get("/")
+        for model, bulk_resource in ((Category, CategoryResource), (Dish, DishResource)):
+            model_admin = admin.site._registry[model]
+            self.assertEqual(list(model_admin.get_import_resource_classes(request)), [bulk_resource])
+
+            resource_class, = model_admin.get_export_resource_classes(request)
+            dataset = resource_class().export()
+            self.assertEqual(dataset.headers, [field.name for field in model._meta.fields])
+            self.assertIn(str(self.rice.pk if model is Dish else self.mains.pk), dataset["id"])
+
+
+class OrderItemBackfillTests(ApiTestCase):
+    def test_unlinked_items_are_linked_by_name(self):
+        mains = Category.objects.create(name="Mains")
+        rice = Dish.objects.create(name="Rice", category=mains, price=Decimal("5.00"))
+        large = DishSize.objects.create(dish=rice, size="Large", price=Decimal("7.00"))
+        order = Order.objects.create(user=self.user, total_amount=Decimal("20.00"))
+        linked = order.items.create(dish_name=" rice ", size_name="large", category_name="Mains", price=Decimal("7.00"))
+        unknown = order.items.create(dish_name="Pasta", price=Decimal("9.00"))
+
+        output = StringIO()
+        call_command("backfill_order_item_refs", "--batch-size", "1", stdout=output)
+
+        linked.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertEqual((linked.dish_id, linked.size_id, linked.category_id), (rice.pk, large.pk, mains.pk))
+        self.assertIsNone(unknown.dish_id)
+        self.assertIn("Done: 1 items linked, 1 without a matching dish.", output.getvalue())
+
+        # Re-running only looks at what is still unlinked
+        output = StringIO()
+        call_command("backfill_order_item_refs", stdout=output)
+        self.assertIn("Done: 0 items linked, 1 without a matching dish.", output.getvalue())
+
+
+class OrderPriceCheckTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(price_map, "_price_map", None))
+        price_map.invalidate()
+        mains = Category.objects.create(name="Mains")
+        self.rice = Dish.objects.create(name="Rice", category=mains, price=Decimal("5.00"))
+        DishSize.objects.create(dish=self.rice, size="Large", price=Decimal("7.00"))
+
+    def order(self, *items):
+        return self.client.post(
+            "/api/orders/", {"order_type": "dining", "status": "pending", "total_amount": "0.00", "items": list(items)},
+            format="json",
+        )
+
+    def test_missing_price_and_category_come_from_the_catalog(self):
+        response = self.order({"dish_name": "Rice", "size_name": "Large", "quantity": 2})
+
+        self.assertEqual(response.status_code, 201, response.data)
+        item = Order.objects.get(pk=response.data["id"]).items.get()
+        self.assertEqual((item.price, item.category_name, item.dish_id), (Decimal("7.00"), "Mains", self.rice.pk))
+        self.assertEqual(Decimal(str(response.data["total_amount"])), Decimal("14.00"))
+
+    def test_mismatch_policy(self):
+        sent = {"dish_name": "Rice", "quantity": 1, "price": "4.00"}
+        before = price_map.metrics["price_mismatch"]
+
+        with self.settings(ORDER_PRICE_MISMATCH="log"):
+            self.assertEqual(self.order(sent).status_code, 201)
+        self.assertEqual(price_map.metrics["price_mismatch"], before + 1)
+
+        with self.settings(ORDER_PRICE_MISMATCH="correct"):
+            response = self.order(sent)
+        self.assertEqual(Order.objects.get(pk=response.data["id"]).items.get().price, Decimal("5.00"))
+
+        with self.settings(ORDER_PRICE_MISMATCH="reject"):
+            response = self.order(sent)
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_dish_needs_a_price(self):
+        self.assertEqual(self.order({"dish_name": "Pasta", "quantity": 1}).status_code, 400)
+        self.assertEqual(self.order({"dish_name": "Pasta", "quantity": 1, "price": "9.00"}).status_code, 201)
+
+
+class CreditReportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = CreditUser.objects.create(username="customer", mobile_number="5551234", limit_amount=1000)
+        for day, amount in ((date(2024, 3, 1), "100.00"), (date(2024, 5, 15), "50.00"), (date(2024, 6, 20), "20.00")):
+            order = Order.objects.create(
+                user=self.user, total_amount=Decimal(amount), status="delivered", payment_method="credit",
+                credit_user_id=self.customer.pk, created_at=datetime.combine(day, datetime.min.time()),
+            )
+            CreditOrder.objects.create(order=order, credit_user=self.customer)
+        payment = CreditTransaction.objects.create(credit_user=self.customer, received_amount=Decimal("120.00"))
+        CreditTransaction.objects.filter(pk=payment.pk).update(date=date(2024, 6, 1))
+
+    def test_payments_settle_the_oldest_bucket_first(self):
+        response = self.client.get("/api/credit-users/aging/", {"as_of": "2024-06-30"})
+
+        self.assertEqual(response.status_code, 200)
+        row = response.data["results"][0]
+        self.assertEqual(
+            [row[bucket] for bucket in ("days_90_plus", "days_60", "days_30", "current", "outstanding")],
+            [Decimal("0.00"), Decimal("0.00"), Decimal("30.00"), Decimal("20.00"), Decimal("50.00")],
+        )
+        self.assertEqual(self.client.get("/api/credit-users/aging/", {"as_of": "2024-02-30"}).status_code, 400)
+
+    def test_statement_balance_runs_across_pages(self):
+        url = f"/api/credit-users/{self.customer.pk}/statement/"
+        first = self.client.get(url, {"page_size": 2})
+        second = self.client.get(url, {"page_size": 2, "page": 2})
+
+        rows = first.data["results"] + second.data["results"]
+        self.assertEqual([row["type"] for row in rows], ["order", "order", "payment", "order"])
+        self.assertEqual(
+            [row["balance"] for row in rows],
+            [Decimal("100.00"), Decimal("150.00"), Decimal("30.00"), Decimal("50.00")],
+        )
+
+
+class CreditUserListingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customers = []
+        for n in range(3):
+            customer = CreditUser.objects.create(username=f"customer {n}", mobile_number=f"555000{n}", limit_amount=1000)
+            for amount in ("10.00", "15.00"):
+                order = Order.objects.create(
+                    user=self.user, total_amount=Decimal(amount), payment_method="credit", credit_user_id=customer.pk
+                )
+                CreditOrder.objects.create(order=order, credit_user=customer)
+            self.customers.append(customer)
+        CreditTransaction.objects.create(credit_user=self.customers[0], received_amount=Decimal("5.00"))
+
+    def test_compact_list_has_counters_instead_of_orders(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/credit-users/", {"compact": "true"})
+
+        self.assertEqual(response.status_code, 200)
+        rows = {row["id"]: row for row in response.data["results"]}
+        first = rows[self.customers[0].pk]
+        self.assertNotIn("credit_orders", first)
+        self.assertEqual(first["order_count"], 2)
+        self.assertEqual(Decimal(first["ordered_amount"]), Decimal("25.00"))
+        self.assertEqual(Decimal(first["outstanding"]), Decimal("20.00"))
+        # Page count and the page itself, whatever the number of customers
+        self.assertLessEqual(len([query for query in queries if "creditorder" in query["sql"].lower()]), 1)
+
+    def test_credit_orders_are_paginated_newest_first(self):
+        customer = self.customers[1]
+        response = self.client.get(f"/api/credit-users/{customer.pk}/credit-orders/", {"page_size": 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(
+            response.data["results"][0]["id"], customer.credit_orders.order_by("-order__created_at", "-id").first().pk
+        )
+
+
+class ReceiptLinkTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.order = Order.objects.create(user=self.user, total_amount=Decimal("12.00"), invoice_number="INV-7")
+        self.item = self.order.items.create(dish_name="Chicken Biryani", price=Decimal("12.00"))
+
+    def test_link_redirects_to_the_receipt(self):
+        response = self.client.post(f"/api/orders/{self.order.pk}/receipt-link/")
+        self.assertEqual(response.status_code, 200)
+        token = response.data["token"]
+        self.assertTrue(response.data["url"].endswith(f"/s/{token}/"))
+        # One link per order
+        self.assertEqual(self.client.post(f"/api/orders/{self.order.pk}/receipt-link/").data["token"], token)
+
+        redirect = self.client.get(f"/s/{token}/")
+        self.assertRedirects(redirect, f"/receipts/{token}/", fetch_redirect_response=False)
+        receipt = self.client.get(f"/receipts/{token}/")
+        self.assertContains(receipt, "Chicken Biryani")
+
+        self.assertEqual(self.client.get(f"/receipts/{token}/", HTTP_IF_NONE_MATCH=receipt["ETag"]).status_code, 304)
+        self.item.quantity = 2
+        self.item.save()
+        changed = self.client.get(f"/receipts/{token}/", HTTP_IF_NONE_MATCH=receipt["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], receipt["ETag"])
+
+    def test_plain_links_and_unknown_tokens(self):
+        url = shorten_url("https://example.com/menu")
+        token = url.rstrip("/").rsplit("/", 1)[-1]
+
+        self.assertRedirects(self.client.get(f"/s/{token}/"), "https://example.com/menu", fetch_redirect_response=False)
+        self.assertEqual(self.client.get("/s/missing1/").status_code, 404)
+        self.assertEqual(self.client.get("/receipts/missing1/").status_code, 404)
@@ -11,11 +11,13 @@ from rest_framework_simplejwt.tokens import TokenError, RefreshToken
 from rest_framework_simplejwt.exceptions import InvalidToken
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from django.db.models import Sum, Count, Avg, F, Value,DecimalField, IntegerField
+from django.db import models
+from django.db.models import Sum, Count, Avg, F, Value,DecimalField, IntegerField, Max
 from django.utils.dateparse import parse_date
-from django.db.models import Q, Case, When
+from django.db.models import Q, Case, When, Prefetch
 from django.db.models.functions import TruncDate, TruncHour, ExtractHour
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect, JsonResponse
+from django.utils.cache import patch_cache_control
 from django.contrib.admin.views.decorators import staff_member_required
 from delivery_drivers.models import DeliveryOrder
 from delivery_drivers.serializers import DeliveryOrderSerializer
@@ -24,12 +26,19 @@ from restaurant_app.serializers import *
 from rest_framework.decorators import api_view
 from django.db.models.functions import Coalesce,Cast
 from django.shortcuts import render
+from django.urls import reverse
+from django.conf import settings
+from django.views.static import serve
 from rest_framework.pagination import PageNumberPagination
-import win32print  # For Windows
-# For Linux you would use: from cups import Connection
-import tempfile
 import os
-from bs4 import BeautifulSoup
+from .catalog import PriceAdjustmentError, adjust_prices, get_catalog_snapshot
+from .credit_reports import AGING_BUCKETS, aging_report, annotate_credit_summary, statement_queryset, statement_rows
+from .dish_search import search_dishes
+from .images import DERIVATIVES_DIR
+from .invoices import order_invoice_pdf, period_invoices_pdf, period_invoices_zip, period_orders
+from .mess_forecast import get_forecast as get_mess_forecast
+from .printing import queue_print
+from .receipts import receipt_link, render_receipt, resolve_short_link, short_url
 
     
 User = get_user_model()
@@ -38,6 +47,42 @@ User = get_user_model()
 def landing_page(request):
     return render(request, 'home.html')
 
+
+def image_derivative(request, path):
+    # Development server only (DEBUG); production serves media from the web server.
+    # Derivative names carry a hash of their content, so they never change
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, DERIVATIVES_DIR))
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+def short_link(request, token):
+    resolved = resolve_short_link(token)
+    if resolved is None:
+        raise Http404("Unknown link")
+    target_url, order_id = resolved
+    response = HttpResponseRedirect(reverse("order_receipt", args=[token]) if order_id else target_url)
+    # A token always points at the same place
+    response["Cache-Control"] = "public, max-age=86400"
+    return response
+
+
+def order_receipt(request, token):
+    resolved = resolve_short_link(token)
+    receipt = render_receipt(resolved[1]) if resolved and resolved[1] else None
+    if receipt is None:
+        raise Http404("Unknown receipt")
+    html, etag = receipt
+    etag = f'"{etag}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(html)
+    response["ETag"] = etag
+    # The order can still change, so clients revalidate (a cheap 304)
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
 class NoPagination(PageNumberPagination):
     page_size = 100  # Set a high number or limit
 
@@ -136,6 +181,19 @@ class CategoryViewSet(viewsets.ModelViewSet):
     pagination_class=None
 
 
+def batch_upsert(request, serializer_class):
+    serializer = serializer_class(data=request.data, many=True, partial=True)
+    if not serializer.is_valid():
+        return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    instances = serializer.save()
+    created = sum(1 for item in serializer.validated_data if "id" not in item)
+    return Response({
+        "created": created,
+        "updated": len(instances) - created,
+        "ids": [instance.id for instance in instances],
+    })
+
+
 class DishViewSet(viewsets.ModelViewSet):
     queryset = Dish.objects.all()
     serializer_class = DishSerializer
@@ -149,11 +207,43 @@ class DishViewSet(viewsets.ModelViewSet):
     search_fields = ["name", "description"]
     ordering_fields = ["name", "price"]
 
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        Upsert a list of dishes in one transaction. Items with an `id` are
+        updated with the given fields, the others are created.
+        """
+        return batch_upsert(request, DishBatchSerializer)
+
+    @action(detail=False, methods=["post"], url_path="adjust-prices")
+    def adjust_prices(self, request):
+        """
+        {"percent": 5, "round_to": 0.25, "category": 3, "include_sizes": true}
+        """
+        serializer = PriceAdjustmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            changed = adjust_prices(
+                data["percent"],
+                data["round_to"],
+                category=data.get("category"),
+                dish_ids=data.get("dish_ids"),
+                include_sizes=data["include_sizes"],
+            )
+        except PriceAdjustmentError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"updated": changed})
+
 
 class DishSizeViewSet(viewsets.ModelViewSet):
     queryset = DishSize.objects.all()
     serializer_class = DishSizeSerializer
 
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        return batch_upsert(request, DishSizeBatchSerializer)
+
 
 class DishVariantViewSet(viewsets.ModelViewSet):
     queryset = DishVariant.objects.all()
@@ -168,6 +258,10 @@ class DishVariantViewSet(viewsets.ModelViewSet):
         
         return queryset
 
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        return batch_upsert(request, DishVariantBatchSerializer)
+
 
 class OnlineOrderViewSet(viewsets.ModelViewSet):
     """
@@ -183,12 +277,43 @@ class OnlineOrderViewSet(viewsets.ModelViewSet):
     pagination_class = None
 
 
+class CatalogView(APIView):
+    """
+    Whole menu in one versioned document for POS start-up. Clients send the
+    ETag back in If-None-Match and get 304 while the catalog is unchanged.
+    """
+
+    def get(self, request):
+        snapshot = get_catalog_snapshot(request)
+        if_none_match = request.headers.get('If-None-Match', '')
+        if snapshot.etag in [tag.strip() for tag in if_none_match.split(',')]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(snapshot.body, content_type='application/json')
+        response['ETag'] = snapshot.etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
 class CustomerDetailsViewSet(viewsets.ModelViewSet):
     queryset = CustomerDetails.objects.all()
     serializer_class = CustomerDetailsSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = None
 
+def unlinked_name(fk, name_field):
+    """
+    Grouping key that is empty for order items linked to the catalog through
+    `fk` and the recorded name for older, unlinked ones, so reports group on
+    the integer key without lumping every unlinked item together.
+    """
+    return Case(
+        When(**{f"{fk}__isnull": True}, then=F(name_field)),
+        default=Value(""),
+        output_field=models.CharField(),
+    )
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
@@ -216,6 +341,52 @@ class OrderViewSet(viewsets.ModelViewSet):
         order.save()
         return Response({"detail": "Order has been cancelled."}, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['post'], url_path='receipt-link')
+    def receipt_link(self, request, pk=None):
+        """Short link to the order's e-receipt page, created on first use."""
+        link = receipt_link(self.get_object())
+        return Response({"token": link.token, "url": short_url(link.token, request)})
+
+    @action(detail=True, methods=['get'])
+    def invoice(self, request, pk=None):
+        order = self.get_object()
+        response = HttpResponse(order_invoice_pdf(order.pk), content_type="application/pdf")
+        response["Content-Disposition"] = f'inline; filename="invoice-{order.invoice_number or order.pk}.pdf"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def invoices(self, request):
+        """Invoices of a period (from_date..to_date) as one PDF, or a zip of PDFs with output=zip."""
+        try:
+            from_date = parse_date(request.query_params.get("from_date") or "")
+            to_date = parse_date(request.query_params.get("to_date") or "")
+        except ValueError:
+            # Well formed but impossible, e.g. 2024-13-45
+            from_date = to_date = None
+        output = request.query_params.get("output", "pdf")
+        if not from_date or not to_date or from_date > to_date:
+            return Response({"detail": "from_date and to_date (YYYY-MM-DD) are required."}, status=status.HTTP_400_BAD_REQUEST)
+        if output not in ("pdf", "zip"):
+            return Response({"detail": "output must be pdf or zip."}, status=status.HTTP_400_BAD_REQUEST)
+        config = settings.INVOICE_PDF
+        if (to_date - from_date).days >= config["max_days"] or (
+            period_orders(from_date, to_date).count() > config["api_max_orders"]
+        ):
+            return Response(
+                {"detail": (
+                    f"At most {config['max_days']} days and {config['api_max_orders']} orders at a time; "
+                    "use the render_invoices command for longer runs."
+                )},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if output == "zip":
+            response = HttpResponse(period_invoices_zip(from_date, to_date), content_type="application/zip")
+        else:
+            response = HttpResponse(period_invoices_pdf(from_date, to_date), content_type="application/pdf")
+        response["Content-Disposition"] = f'attachment; filename="invoices-{from_date}-{to_date}.{output}"'
+        return response
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -364,27 +535,29 @@ class OrderViewSet(viewsets.ModelViewSet):
         total_orders = orders.count()
         avg_order_value = total_income / total_orders if total_orders > 0 else 0
 
-        # Top dishes from delivered orders
+        # Top dishes from delivered orders, grouped on the dish id
         top_dishes = (
             order_items
-            .values('dish_name')
+            .values('dish_id', unlinked=unlinked_name('dish', 'dish_name'))
             .annotate(
                 orders=Count('id'),
-                total_sales=Sum(F('price') * F('quantity'))
+                total_sales=Sum(F('price') * F('quantity')),
+                name=Coalesce(Max('dish__name'), Max('dish_name')),
+                dish_name=Coalesce(Max('dish__name'), Max('dish_name')),
             )
-            .annotate(
-                name=F('dish_name')
-            )   
+            .values('dish_id', 'name', 'dish_name', 'orders', 'total_sales')
             .order_by('-orders')[:5]
         )
 
-        # Category sales from delivered orders
+        # Category sales from delivered orders, grouped on the category id
         category_sales = (
             order_items
-            .values('dish_name')
+            .values('category_id', unlinked=unlinked_name('category', 'category_name'))
             .annotate(
-                value=Sum(F('price') * F('quantity'))
+                value=Sum(F('price') * F('quantity')),
+                name=Coalesce(Max('category__name'), Max('category_name')),
             )
+            .values('category_id', 'name', 'value')
             .order_by('-value')[:5]
         )
 
@@ -557,40 +730,46 @@ class OrderViewSet(viewsets.ModelViewSet):
                     order__created_at__date__range=[from_date, to_date]
                 )
             
-            # Filter by dish_name if provided
+            # Filter by dish (id or name) if provided
+            dish_id = request.query_params.get('dish_id')
+            if dish_id:
+                query = query.filter(dish_id=dish_id)
             if dish_name:
-                query = query.filter(dish_name=dish_name)
+                query = query.filter(Q(dish__name=dish_name) | Q(dish__isnull=True, dish_name=dish_name))
 
-            # Rest of the aggregation logic remains the same
+            # Group on the dish id; names only for items not linked to a dish
             product_report = query.values(
-                'dish_name',
+                'dish_id',
                 'order__invoice_number',
                 'order__created_at',
                 'order__order_type',
-                'order__payment_method'
+                'order__payment_method',
+                unlinked=unlinked_name('dish', 'dish_name'),
             ).annotate(
+                report_dish_name=Coalesce(Max('dish__name'), Max('dish_name')),
                 total_quantity=Sum('quantity'),
                 total_amount=Sum(F('price') * F('quantity')),
-                cash_amount=Case(
+                cash_amount=Sum(Case(
                     When(order__payment_method='cash', then=F('price') * F('quantity')),
                     default=Value(0),
                     output_field=DecimalField()
-                ),
-                bank_amount=Case(
+                )),
+                bank_amount=Sum(Case(
                     When(order__payment_method='bank', then=F('price') * F('quantity')),
                     default=Value(0),
                     output_field=DecimalField()
-                ),
-                credit_amount=Case(
+                )),
+                credit_amount=Sum(Case(
                     When(order__payment_method='credit', then=F('price') * F('quantity')),
                     default=Value(0),
                     output_field=DecimalField()
-                )
-            ).order_by('dish_name')
+                ))
+            ).order_by('report_dish_name')
 
             # Format the response
             formatted_report = [{
-                'dish_name': item['dish_name'],
+                'dish_id': item['dish_id'],
+                'dish_name': item['report_dish_name'],
                 'total_quantity': item['total_quantity'],
                 'total_amount': str(item['total_amount']),
                 'invoice_number': item['order__invoice_number'],
@@ -811,8 +990,10 @@ class OrderStatusUpdateViewSet(viewsets.GenericViewSet):
                         status=status.HTTP_400_BAD_REQUEST,
                     )
 
-                CreditOrder.objects.get_or_create(order=updated_order, credit_user=credit_user)
-                credit_user.add_to_total_due(updated_order.total_amount)
+                _, created = CreditOrder.objects.get_or_create(order=updated_order, credit_user=credit_user)
+                if created:
+                    # Saving a credit order again must not charge it twice
+                    credit_user.add_to_total_due(updated_order.total_amount)
 
             return Response({"detail": "Order updated successfully."}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -1060,6 +1241,21 @@ class MenuViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
 
+    @action(detail=True, methods=["post"], url_path="build")
+    def build(self, request, pk=None):
+        """
+        Add many items at once: {"items": [{"dish_id": 1, "meal_type": "lunch"}, ...], "replace": false}
+        """
+        menu = self.get_object()
+        serializer = MenuBuilderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(menu)
+        menu = Menu.objects.prefetch_related(
+            Prefetch("menu_items", queryset=MenuItem.objects.select_related("dish__category").prefetch_related("dish__size"))
+        ).get(pk=menu.pk)
+        return Response(MenuSerializer(menu, context={"request": request}).data)
+
+
 class MenuItemViewSet(viewsets.ModelViewSet):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
@@ -1119,39 +1315,153 @@ class MessViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=["get"])
+    def forecast(self, request):
+        """
+        Portions per date, meal and dish for active subscriptions.
+        Defaults to the coming week; at most 62 days per request.
+        """
+        dates = {}
+        for name in ("from_date", "to_date"):
+            value = request.query_params.get(name)
+            try:
+                dates[name] = parse_date(value) if value else None
+            except ValueError:
+                # Well formed but impossible, e.g. 2024-13-45
+                dates[name] = None
+            if value and dates[name] is None:
+                return Response({"error": f"Invalid {name}, use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        from_date = dates["from_date"] or timezone.now().date()
+        to_date = dates["to_date"] or from_date + timedelta(days=6)
+        if from_date > to_date:
+            return Response({"error": "from_date must not be after to_date"}, status=status.HTTP_400_BAD_REQUEST)
+        if (to_date - from_date).days >= 62:
+            return Response({"error": "The range can be at most 62 days"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "from_date": from_date,
+            "to_date": to_date,
+            "days": get_mess_forecast(from_date, to_date),
+        })
+
 
 class SearchDishesAPIView(APIView):
+    """
+    Ranked dish search over English name, Arabic name and description.
+    Tolerates typos; `limit` caps the number of results (default 50).
+    """
     def get(self, request):
         query = request.GET.get("search", "")
         if query:
-            dishes = Dish.objects.filter(name__icontains=query)
-            serializer = DishSerializer(dishes, many=True)
+            try:
+                limit = min(max(int(request.GET.get("limit", 50)), 1), 200)
+            except ValueError:
+                limit = 50
+            dish_ids = search_dishes(query, limit)
+            dishes = Dish.objects.filter(id__in=dish_ids).select_related("category").prefetch_related("size")
+            dishes_by_id = {dish.id: dish for dish in dishes}
+            ranked = [dishes_by_id[dish_id] for dish_id in dish_ids if dish_id in dishes_by_id]
+            serializer = DishSerializer(ranked, many=True)
             return Response({"results": serializer.data}, status=status.HTTP_200_OK)
         return Response({"results": []}, status=status.HTTP_200_OK)
 
 
+class CreditHistoryPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
 class CreditUserViewSet(viewsets.ModelViewSet):
     queryset = CreditUser.objects.all()
     serializer_class = CreditUserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def is_compact_request(self):
+        return str(self.request.query_params.get('compact', '')).lower() in ('1', 'true')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "get_active_users"):
+            if self.is_compact_request():
+                # Counters instead of every credit order the customer ever had
+                return annotate_credit_summary(queryset)
+            return queryset.prefetch_related("credit_orders")
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in ("list", "get_active_users") and self.is_compact_request():
+            return CreditUserListSerializer
+        return super().get_serializer_class()
+
+    @action(detail=True, methods=["get"], url_path="credit-orders")
+    def credit_orders(self, request, pk=None):
+        """The customer's credit orders, newest first, paginated."""
+        credit_user = self.get_object()
+        orders = credit_user.credit_orders.select_related("order").order_by("-order__created_at", "-id")
+        paginator = CreditHistoryPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        return paginator.get_paginated_response(CreditOrderDetailSerializer(page, many=True).data)
+
+    @action(detail=False, methods=["get"])
+    def aging(self, request):
+        """
+        Outstanding credit per customer in current/30/60/90+ day buckets.
+        `as_of` (YYYY-MM-DD) defaults to today; `all=true` also lists
+        customers who owe nothing.
+        """
+        as_of = request.query_params.get("as_of")
+        if as_of:
+            try:
+                as_of = parse_date(as_of)
+            except ValueError:
+                as_of = None
+            if not as_of:
+                return Response({"error": "Invalid as_of date"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = aging_report(as_of)
+        if str(request.query_params.get("all", "")).lower() not in ("1", "true"):
+            rows = [row for row in rows if row["outstanding"] > 0]
+        totals = {
+            field: sum((row[field] for row in rows), Decimal("0.00"))
+            for field in (*AGING_BUCKETS, "outstanding", "advance")
+        }
+        return Response({"as_of": as_of or timezone.now().date(), "totals": totals, "results": rows})
+
+    @action(detail=True, methods=["get"])
+    def statement(self, request, pk=None):
+        """Orders and payments, oldest first, with the balance after each."""
+        credit_user = self.get_object()
+        paginator = CreditHistoryPagination()
+        page = paginator.paginate_queryset(statement_queryset(credit_user), request, view=self)
+        response = paginator.get_paginated_response(statement_rows(page))
+        response.data["credit_user"] = {
+            "id": credit_user.id,
+            "username": credit_user.username,
+            "mobile_number": credit_user.mobile_number,
+            "total_due": credit_user.total_due,
+        }
+        return response
+
     @action(detail=False, methods=["get"])
     def get_active_users(self, request, pk=None):
-        active_users = CreditUser.objects.filter(is_active=True)
+        active_users = self.get_queryset().filter(is_active=True)
         serializer = self.get_serializer(active_users, many=True)
         return Response({"data": serializer.data}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["post"])
     def make_payment(self, request, pk=None):
         credit_user = self.get_object()
-        amount = Decimal(request.data.get("payment_amount", 0))
-
-        if amount <= 0:
-            return Response(
-                {"error": "Invalid payment amount"}, status=status.HTTP_400_BAD_REQUEST
-            )
+        serializer = CreditPaymentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payment = serializer.validated_data
 
-        credit_user.make_payment(amount)
+        credit_user.make_payment(
+            payment["payment_amount"],
+            payment["payment_method"],
+            cash_amount=payment.get("cash_amount"),
+            bank_amount=payment.get("bank_amount"),
+        )
         return Response(CreditUserSerializer(credit_user).data)
 
     @action(detail=False, methods=["get"], url_path='find-user')
@@ -1404,106 +1714,29 @@ class ChairBookingViewSet(viewsets.ModelViewSet):
 class PrintViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['POST'])
     def print_receipt(self, request):
-        try:
-            printer_type = request.data.get('type')
-            html_content = request.data.get('content', '')
-            
-            # Map printer types to printer names
-            printer_mapping = {
-                'pizza': 'kitchenprint',
-                'shawarma': 'kitchenprint',
-                'kitchen': 'kitchenprint',
-                'sales': 'salesprint'
-            }
-            # printer_mapping = {
-            #     'pizza': 'pizzaprint',
-            #     'shawarma': 'shawarmaprint',
-            #     'kitchen': 'kitchenprint',
-            #     'sales': 'salesprint'
-            # }
-            
-            # Get the correct printer name based on type
-            printer_name = printer_mapping.get(printer_type)
-            if not printer_name:
-                return JsonResponse({
-                    'success': False,
-                    'error': f"Invalid printer type: '{printer_type}'"
-                }, status=400)
-
-            # Convert HTML to plain text and format
-            soup = BeautifulSoup(html_content, 'html.parser')
-            formatted_content = self.format_content(soup, printer_type)
-
-            # Print the content
-            self.print_to_printer(printer_name, formatted_content)
-
-            return JsonResponse({'success': True})
-            
-        except Exception as e:
-            logger.exception("Error in print_receipt")
+        """Queue the ticket for the print worker and return its job right away."""
+        printer_type = request.data.get('type')
+        # A list or dict isn't hashable, so check the type before the lookup
+        if not isinstance(printer_type, str) or printer_type not in settings.PRINTING["types"]:
             return JsonResponse({
                 'success': False,
-                'error': str(e)
-            }, status=500)
-
-    def format_content(self, soup, printer_type):
-        formatted_content = ""
-        
-        # Add headers based on printer type
-        if printer_type == 'pizza':
-            formatted_content += "\n" + "="*32 + "\n"
-            formatted_content += "PIZZA ORDER".center(32) + "\n"
-            formatted_content += "="*32 + "\n\n"
-        elif printer_type == 'shawarma':
-            formatted_content += "\n" + "="*32 + "\n"
-            formatted_content += "SHAWARMA ORDER".center(32) + "\n"
-            formatted_content += "="*32 + "\n\n"
-        elif printer_type == 'kitchen':
-            formatted_content += "\n" + "="*32 + "\n"
-            formatted_content += "KITCHEN ORDER".center(32) + "\n"
-            formatted_content += "="*32 + "\n\n"
-        elif printer_type == 'sales':
-            formatted_content += "\n" + "="*32 + "\n"
-            formatted_content += "SALES RECEIPT".center(32) + "\n"
-            formatted_content += "="*32 + "\n\n"
-
-        # Process each line with proper formatting
-        for element in soup.stripped_strings:
-            line = str(element).strip()
-            if line:
-                if 'QAR' in line or any(c.isdigit() for c in line):
-                    formatted_content += line.rjust(32) + "\n"
-                else:
-                    formatted_content += line.ljust(32) + "\n"
-                
-                if line.startswith('='):
-                    formatted_content += "\n"
-
-        # Add footer
-        formatted_content += "\n" + "="*32 + "\n"
-        
-        return formatted_content
-
-    def print_to_printer(self, printer_name, content):
-        # Create temporary file with content
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.txt', mode='w', encoding='utf-8') as f:
-            f.write(content)
-            temp_path = f.name
-
-        try:
-            # Windows printing
-            printer_handle = win32print.OpenPrinter(printer_name)
-            try:
-                job = win32print.StartDocPrinter(printer_handle, 1, ("Receipt", None, "RAW"))
-                try:
-                    win32print.StartPagePrinter(printer_handle)
-                    with open(temp_path, 'rb') as f:
-                        win32print.WritePrinter(printer_handle, f.read())
-                    win32print.EndPagePrinter(printer_handle)
-                finally:
-                    win32print.EndDocPrinter(printer_handle)
-            finally:
-                win32print.ClosePrinter(printer_handle)
-        finally:
-            # Clean up temp file
-            os.unlink(temp_path)
+                'error': f"Invalid printer type: '{printer_type}'"
+            }, status=400)
+
+        job = queue_print(printer_type, request.data.get('content', ''))
+        return JsonResponse({'success': True, 'job_id': job.pk, 'status': job.status}, status=202)
+
+    def list(self, request):
+        """Latest jobs, optionally filtered by status and printer."""
+        jobs = PrintJob.objects.all()
+        if request.query_params.get('status'):
+            jobs = jobs.filter(status=request.query_params['status'])
+        if request.query_params.get('printer'):
+            jobs = jobs.filter(printer=request.query_params['printer'])
+        return Response(PrintJobSerializer(jobs[:100], many=True).data)
+
+    def retrieve(self, request, pk=None):
+        job = PrintJob.objects.filter(pk=pk).first()
+        if job is None:
+            raise Http404("Unknown print job")
+        return Response(PrintJobSerializer(job).data)
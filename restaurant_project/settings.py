@@ -61,6 +61,7 @@ CORS_ALLOW_CREDENTIALS = True
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -68,6 +69,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "transactions_app.middleware.FiscalLockMiddleware",
 ]
 
 ROOT_URLCONF = "restaurant_project.urls"
@@ -94,6 +96,20 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # SQLite has one writer at a time: concurrent requests wait for the
+        # write lock (up to `timeout` seconds) instead of failing with
+        # "database is locked", and transactions take it up front so a
+        # read-then-write block can't deadlock against another writer.
+        "OPTIONS": {
+            "timeout": 20,
+            "transaction_mode": "IMMEDIATE",
+        },
+        # The default in-memory test database is shared cache, where a
+        # second writer fails at once instead of waiting; a file honours
+        # the timeout, so concurrency tests really run in parallel.
+        "TEST": {
+            "NAME": BASE_DIR / "test_db.sqlite3",
+        },
     }
 }
 
@@ -130,6 +146,29 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Outside DEBUG, static files are compressed and given hashed names by
+# collectstatic, and whitenoise serves hashed files with a far-future
+# immutable Cache-Control. The manifest only exists after
+# `manage.py collectstatic` has run, so that is a required deploy step;
+# until then every {% static %} tag fails.
+#
+# Media is not served by Django in production. The web server serves
+# MEDIA_ROOT at MEDIA_URL; derivative names carry a content hash, so give
+# MEDIA_ROOT/derived/ "Cache-Control: public, max-age=31536000, immutable",
+# e.g. in nginx:
+#     location /media/derived/ { alias <MEDIA_ROOT>/derived/; expires max; add_header Cache-Control "public, immutable"; }
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+            else "whitenoise.storage.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "restaurant_app.User"
@@ -159,6 +198,101 @@ TWILIO_ACCOUNT_SID = env.str("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = env.str("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = env.str("TWILIO_PHONE_NUMBER")
 
+# Ledger names used by the end-of-day posting (transactions_app.posting).
+# Credit customers post to their own Sundry Debtors ledger and online
+# platforms to a ledger named after the platform.
+DAILY_POSTING_LEDGERS = {
+    "cash": "Cash",
+    "bank": "Bank",
+    "sales": "Sales",
+    "mess": "Mess Income",
+}
+
+# Overdue credit reminders (send_credit_reminders command). A customer gets
+# at most one reminder every `interval_days`; numbers without a leading +
+# get `country_code`. The template is formatted with the customer's
+# username, total_due and due_date.
+CREDIT_REMINDERS = {
+    "interval_days": 7,
+    "batch_size": 200,
+    "country_code": "+974",
+    "template": (
+        "Dear {username}, your credit balance of {total_due} was due on {due_date:%d-%m-%Y}. "
+        "Please settle it at your earliest convenience."
+    ),
+}
+
+# Outbound WhatsApp/SMS (restaurant_app.messaging). Messages are queued in
+# OutboundMessage and sent by `manage.py run_message_worker`. A failed send
+# is retried after retry_backoff * 2**(attempts - 1) seconds (capped at
+# max_backoff) until max_attempts. Use
+# "restaurant_app.messaging.FakeTransport" to run without Twilio.
+MESSAGING = {
+    "transport": env.str("MESSAGING_TRANSPORT", default="restaurant_app.messaging.TwilioTransport"),
+    "workers": 4,
+    "batch_size": 50,
+    "rate_per_second": 10,
+    "max_attempts": 5,
+    "retry_backoff": 30,
+    "max_backoff": 60 * 60,
+    # A claim older than this is assumed to belong to a dead worker
+    "stale_claim_after": 5 * 60,
+    "poll_interval": 2,
+}
+
+# Receipt printing (restaurant_app.printing). "types" maps the type the
+# POS sends to a printer. "printers" gives a printer its own backend and
+# options, e.g. {"kitchenprint": {"backend":
+# "restaurant_app.printing.RawTcpBackend", "host": "192.168.1.50"}}
+# (RawTcpBackend: host, port; CupsBackend / WindowsBackend: name;
+# FileBackend: directory; all: encoding); other printers use "backend".
+# A failed print is retried after retry_backoff * 2**(attempts - 1) seconds
+# (capped at max_backoff) until max_attempts, holding back the jobs queued
+# after it on the same printer. `workers` is how many printers are printed
+# to at the same time, each by its own thread.
+PRINTING = {
+    "backend": env.str("PRINT_BACKEND", default="restaurant_app.printing.WindowsBackend"),
+    "types": {
+        "pizza": "kitchenprint",
+        "shawarma": "kitchenprint",
+        "kitchen": "kitchenprint",
+        "sales": "salesprint",
+    },
+    "printers": {},
+    "workers": 4,
+    "jobs_per_printer": 10,
+    "max_attempts": 5,
+    "retry_backoff": 5,
+    "max_backoff": 60,
+    # A claim older than this is assumed to belong to a dead worker
+    "stale_claim_after": 2 * 60,
+    "poll_interval": 1,
+}
+
+# Scheme and host put in front of short links made outside a request
+# (e.g. "https://pos.example.com"). Left empty, such links are relative.
+SHORT_LINK_BASE_URL = env.str("SHORT_LINK_BASE_URL", default="")
+
+# PDF invoices (restaurant_app.invoices). The render_invoices command
+# renders batches of more than inline_below uncached orders with `workers`
+# processes, chunk_size orders per task. Rendered PDFs are cached for
+# cache_timeout seconds. The API renders in the web worker only, so it
+# serves periods of at most max_days days and api_max_orders orders; longer
+# runs go through the command.
+INVOICE_PDF = {
+    "workers": 4,
+    "chunk_size": 50,
+    "inline_below": 100,
+    "cache_timeout": 60 * 60 * 24 * 7,
+    "max_days": 31,
+    "api_max_orders": 500,
+}
+
+# What order creation does when an item's price differs from the catalog:
+# "log" keeps the sent price, "correct" uses the catalog price, "reject"
+# refuses the order. Mismatches are always logged and counted.
+ORDER_PRICE_MISMATCH = "log"
+
 UNFOLD = {
     "SITE_TITLE": "Nasscript",
     "SITE_HEADER": "Nasscript",
@@ -2,7 +2,7 @@ from rest_framework.routers import DefaultRouter
 from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
-from django.urls import path, include
+from django.urls import path, include, re_path
 
 from rest_framework_simplejwt.views import TokenRefreshView
 from restaurant_app.views import (
@@ -40,8 +40,12 @@ from restaurant_app.views import (
     OrderTypeChangeViewSet,
     DishVariantViewSet,
     CancelOrderByBillView,
+    CatalogView,
     CreditTransactionViewSet,
     landing_page,
+    image_derivative,
+    order_receipt,
+    short_link,
     SidebarItemViewSet
 )
 from delivery_drivers.views import (
@@ -54,6 +58,8 @@ from transactions_app.views import (CashCountSheetViewSet, NatureGroupViewSet,
  TransactionViewSet, 
  ShareUserManagementViewSet,
  ProfitLossShareTransactionViewSet,
+ VoucherViewSet,
+ FiscalYearCloseViewSet,
  )
 
 router = DefaultRouter()
@@ -111,6 +117,8 @@ router.register(r'nature-groups', NatureGroupViewSet)
 router.register(r'main-groups', MainGroupViewSet)
 router.register(r'ledgers', LedgerViewSet)
 router.register(r'transactions', TransactionViewSet, basename="transactions")
+router.register(r'vouchers', VoucherViewSet, basename="vouchers")
+router.register(r'fiscal-year-closes', FiscalYearCloseViewSet, basename="fiscal-year-closes")
 router.register(r'share-user-management', ShareUserManagementViewSet, basename="share-user-management")
 router.register(r'profit-loss-share-transactions',ProfitLossShareTransactionViewSet,basename='profit-loss-share-transactions')
 router.register(r'cashcount-sheet', CashCountSheetViewSet,basename="cashcount-sheet")
@@ -124,14 +132,19 @@ urlpatterns = [
     path("api/login-passcode/", PasscodeLoginView.as_view(), name="login-passcode"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/logout/", LogoutView.as_view({"post": "logout"}), name="logout"),
+    path("api/catalog/", CatalogView.as_view(), name="catalog"),
     path("api/search-dishes/", SearchDishesAPIView.as_view(), name="search_dishes"),  # Include the search API endpoint
 
     # Register the new Cancel Order API
     path("api/bills/<int:bill_id>/cancel_order/", CancelOrderByBillView.as_view(), name="cancel-order-by-bill"),
     path('admin/restaurant_app/sidebaritem/<int:item_id>/toggle-active/', toggle_sidebar_item_active, name='toggle_sidebar_item_active'),
+    path("s/<str:token>/", short_link, name="short_link"),
+    path("receipts/<str:token>/", order_receipt, name="order_receipt"),
 
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 if settings.DEBUG:
     static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+    # Development only; in production the web server serves media (see settings.STORAGES)
+    urlpatterns.insert(0, re_path(r'^media/derived/(?P<path>.+)$', image_derivative, name='image_derivative'))
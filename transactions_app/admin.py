@@ -10,4 +10,9 @@ admin.site.register(Transaction,UnflodModelAdmin)
 admin.site.register(ShareUsers,UnflodModelAdmin)
 admin.site.register(ProfitLossShareTransaction,UnflodModelAdmin)
 admin.site.register(ShareUserTransaction,UnflodModelAdmin)
-admin.site.register(CashCountSheet,UnflodModelAdmin)
\ No newline at end of file
+admin.site.register(CashCountSheet,UnflodModelAdmin)
+admin.site.register(DailyPosting,UnflodModelAdmin)
+admin.site.register(NumberSequence,UnflodModelAdmin)
+admin.site.register(Voucher,UnflodModelAdmin)
+admin.site.register(FiscalYearClose,UnflodModelAdmin)
+admin.site.register(LedgerClosingBalance,UnflodModelAdmin)
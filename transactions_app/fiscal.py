@@ -0,0 +1,95 @@
+"""
+Fiscal year close.
+
+Closing a year freezes every ledger's closing balance so balance and report
+queries can start from the latest close instead of the first transaction,
+and locks the closed period against further postings and edits.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Min, Q, Sum
+
+from .models import FiscalYearClose, Ledger, LedgerClosingBalance, Transaction
+from .reports import signed_opening_balance
+
+
+class FiscalCloseError(Exception):
+    pass
+
+
+def close_fiscal_year(end_date, start_date=None):
+    """
+    Close the fiscal year ending on `end_date`. The year starts the day after
+    the previous close, or at the first transaction if there is none.
+    """
+    with transaction.atomic():
+        # Serialise concurrent closes on the existing close rows
+        previous = FiscalYearClose.objects.select_for_update().order_by('-end_date').first()
+        if previous and end_date <= previous.end_date:
+            raise FiscalCloseError(f"Fiscal year up to {previous.end_date} is already closed.")
+
+        default_start = previous.end_date + timedelta(days=1) if previous else (
+            Transaction.objects.aggregate(first=Min('date'))['first'] or end_date
+        )
+        start_date = start_date or default_start
+        if start_date != default_start and previous:
+            raise FiscalCloseError(f"The next fiscal year must start on {default_start}.")
+        if start_date > end_date:
+            raise FiscalCloseError("start_date must not be after end_date.")
+
+        opening = {}
+        if previous:
+            opening = dict(previous.balances.values_list('ledger_id', 'closing_balance'))
+
+        # The first close starts from the ledgers' own opening balances, so
+        # its closing balances take in every movement up to end_date, also
+        # those before an explicit start_date; later closes start from the
+        # previous one. total_debit/total_credit only cover the period.
+        in_period = Q(date__gte=start_date)
+        history = Transaction.objects.filter(date__lte=end_date)
+        if previous:
+            history = history.filter(in_period)
+        movements = {
+            row['ledger_id']: row
+            for row in history.values('ledger_id')
+            .annotate(
+                total_debit=Sum('debit_amount', filter=in_period),
+                total_credit=Sum('credit_amount', filter=in_period),
+                all_debit=Sum('debit_amount'),
+                all_credit=Sum('credit_amount'),
+            )
+            .order_by()
+        }
+
+        fiscal_close = FiscalYearClose.objects.create(start_date=start_date, end_date=end_date)
+        balances = []
+        for ledger in Ledger.objects.only('id', 'opening_balance', 'debit_credit').iterator():
+            moved = movements.get(ledger.id, {})
+            start_balance = opening.get(ledger.id)
+            if start_balance is None:
+                start_balance = signed_opening_balance(ledger)
+            balances.append(LedgerClosingBalance(
+                fiscal_close=fiscal_close,
+                ledger_id=ledger.id,
+                total_debit=moved.get('total_debit') or Decimal('0.00'),
+                total_credit=moved.get('total_credit') or Decimal('0.00'),
+                closing_balance=start_balance + (moved.get('all_debit') or 0) - (moved.get('all_credit') or 0),
+            ))
+        LedgerClosingBalance.objects.bulk_create(balances, batch_size=1000)
+    FiscalYearClose.forget_lock()
+    return fiscal_close
+
+
+def reopen_latest_fiscal_year():
+    """
+    Undo the most recent close, unlocking its period. Returns the reopened
+    close (already deleted) or None if no year was closed.
+    """
+    with transaction.atomic():
+        latest = FiscalYearClose.objects.select_for_update().order_by('-end_date').first()
+        if latest:
+            latest.delete()
+    FiscalYearClose.forget_lock()
+    return latest
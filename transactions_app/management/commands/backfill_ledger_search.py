@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from transactions_app.models import Ledger
+
+
+class Command(BaseCommand):
+    help = "Fill Ledger.search_name for ledgers created before the search index existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(Ledger.objects.filter(id__gt=last_id).order_by('id').only('id', 'name', 'search_name')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            stale = []
+            for ledger in batch:
+                search_name = Ledger.normalize_search(ledger.name)
+                if ledger.search_name != search_name:
+                    ledger.search_name = search_name
+                    stale.append(ledger)
+            Ledger.objects.bulk_update(stale, ['search_name'])
+            updated += len(stale)
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} ledgers."))
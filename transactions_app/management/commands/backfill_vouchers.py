@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min, OuterRef, Subquery, Sum
+
+from transactions_app.models import NumberSequence, Transaction, Voucher
+
+
+class Command(BaseCommand):
+    help = "Create Voucher headers for transactions posted before vouchers existed, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Voucher numbers per batch.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = Transaction.objects.filter(voucher__isnull=True)
+        created = 0
+        last_voucher_no = -1
+
+        # Only legs without a header are touched, so the command can be
+        # interrupted and re-run safely.
+        while True:
+            voucher_nos = list(
+                pending.filter(voucher_no__gt=last_voucher_no)
+                .order_by('voucher_no')
+                .values_list('voucher_no', flat=True)
+                .distinct()[:batch_size]
+            )
+            if not voucher_nos:
+                break
+            last_voucher_no = voucher_nos[-1]
+
+            with transaction.atomic():
+                headers = list(
+                    pending.filter(voucher_no__in=voucher_nos)
+                    .values('voucher_no')
+                    .annotate(
+                        date=Min('date'),
+                        first_leg=Min('id'),
+                        debit=Sum('debit_amount'),
+                        credit=Sum('credit_amount'),
+                    )
+                    .order_by()
+                )
+                first_legs = {
+                    leg_id: (transaction_type, remarks)
+                    for leg_id, transaction_type, remarks in Transaction.objects.filter(
+                        id__in=[header['first_leg'] for header in headers]
+                    ).values_list('id', 'transaction_type', 'remarks')
+                }
+                Voucher.objects.bulk_create([
+                    Voucher(
+                        voucher_no=header['voucher_no'],
+                        date=header['date'],
+                        transaction_type=first_legs[header['first_leg']][0] or '',
+                        total_amount=max(header['debit'] or 0, header['credit'] or 0),
+                        narration=first_legs[header['first_leg']][1] or '',
+                    )
+                    for header in headers
+                ], ignore_conflicts=True)
+
+                pending.filter(voucher_no__in=voucher_nos).update(
+                    voucher=Subquery(
+                        Voucher.objects.filter(voucher_no=OuterRef('voucher_no')).values('id')[:1]
+                    )
+                )
+            created += len(voucher_nos)
+            self.stdout.write(f"Linked vouchers up to No {last_voucher_no} ({created} so far)")
+
+        # Make sure newly issued numbers continue after the migrated ones
+        highest = Voucher.objects.aggregate(last=Max('voucher_no'))['last'] or 0
+        NumberSequence.objects.filter(name='voucher', last_number__lt=highest).update(last_number=highest)
+        self.stdout.write(self.style.SUCCESS(f"Done: {created} vouchers linked."))
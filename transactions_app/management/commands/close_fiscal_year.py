@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from transactions_app.fiscal import FiscalCloseError, close_fiscal_year, reopen_latest_fiscal_year
+
+
+class Command(BaseCommand):
+    help = "Close a fiscal year, carrying every ledger balance forward as the next year's opening."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--end-date', help="Last day of the fiscal year (YYYY-MM-DD).")
+        parser.add_argument('--start-date', help="First day of the fiscal year. Only needed for the first close.")
+        parser.add_argument('--reopen', action='store_true', help="Reopen the most recently closed year.")
+
+    def handle(self, *args, **options):
+        if options['reopen']:
+            reopened = reopen_latest_fiscal_year()
+            if not reopened:
+                raise CommandError("No closed fiscal year to reopen.")
+            self.stdout.write(self.style.SUCCESS(f"Reopened fiscal year ending {reopened.end_date}"))
+            return
+
+        if not options['end_date']:
+            raise CommandError("--end-date is required")
+        end_date = self.parse(options['end_date'])
+        start_date = self.parse(options['start_date']) if options['start_date'] else None
+        try:
+            fiscal_close = close_fiscal_year(end_date, start_date)
+        except FiscalCloseError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Closed {fiscal_close.start_date} to {fiscal_close.end_date}: "
+            f"{fiscal_close.balances.count()} ledger balances carried forward"
+        ))
+
+    def parse(self, value):
+        parsed = parse_date(value)
+        if not parsed:
+            raise CommandError(f"Invalid date: {value}")
+        return parsed
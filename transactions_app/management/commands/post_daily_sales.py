@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from transactions_app.posting import PostingError, post_business_day, rollback_business_day
+
+
+class Command(BaseCommand):
+    help = "Post delivered sales, mess receipts and credit receipts of a business day into the ledgers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Business date (YYYY-MM-DD). Defaults to yesterday.")
+        parser.add_argument('--from-date', help="First business date of a range (YYYY-MM-DD).")
+        parser.add_argument('--to-date', help="Last business date of a range (YYYY-MM-DD).")
+        parser.add_argument('--repost', action='store_true', help="Roll back and post again days already posted.")
+        parser.add_argument('--rollback', action='store_true', help="Only roll back the given days.")
+
+    def handle(self, *args, **options):
+        for business_date in self.get_dates(options):
+            try:
+                if options['rollback']:
+                    self.rollback(business_date)
+                else:
+                    self.post(business_date, options['repost'])
+            except PostingError as e:
+                raise CommandError(f"{business_date}: {e}")
+
+    def post(self, business_date, repost):
+        posting = post_business_day(business_date, repost=repost)
+        self.stdout.write(self.style.SUCCESS(
+            f"{business_date}: {posting.voucher_count} vouchers, total {posting.total_amount}"
+        ))
+        if posting.skipped_orders:
+            self.stdout.write(self.style.WARNING(
+                f"{business_date}: {posting.skipped_orders} credit orders without a credit user "
+                f"({posting.skipped_amount}) were not posted; assign them and run with --repost"
+            ))
+
+    def rollback(self, business_date):
+        if rollback_business_day(business_date):
+            self.stdout.write(self.style.SUCCESS(f"{business_date}: rolled back"))
+        else:
+            self.stdout.write(f"{business_date}: not posted, nothing to roll back")
+
+    def get_dates(self, options):
+        if options['from_date'] or options['to_date']:
+            from_date = self.parse(options['from_date'] or options['to_date'])
+            to_date = self.parse(options['to_date'] or options['from_date'])
+            if from_date > to_date:
+                raise CommandError("--from-date must not be after --to-date")
+            return [from_date + timedelta(days=n) for n in range((to_date - from_date).days + 1)]
+        if options['date']:
+            return [self.parse(options['date'])]
+        return [timezone.now().date() - timedelta(days=1)]
+
+    def parse(self, value):
+        parsed = parse_date(value)
+        if not parsed:
+            raise CommandError(f"Invalid date: {value}")
+        return parsed
@@ -0,0 +1,15 @@
+from .models import fiscal_lock_scope
+
+
+class FiscalLockMiddleware:
+    """
+    Read the fiscal lock date at most once per request, however many
+    transactions the request saves or deletes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with fiscal_lock_scope():
+            return self.get_response(request)
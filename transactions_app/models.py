@@ -1,9 +1,42 @@
-from django.db import models
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 import datetime
 from decimal import Decimal
 
 
+class NumberSequence(models.Model):
+    """
+    Named counter for document numbers. Incremented with a single UPDATE so
+    concurrent requests never receive the same number.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_number = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_number}"
+
+    @classmethod
+    def next_number(cls, name, initial=None, count=1):
+        """
+        Allocate the next number of sequence `name` (or a block of `count`
+        numbers, returning the last one). `initial` is an optional callable
+        returning the last number already in use; it is only called the first
+        time the sequence is created.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).exists():
+                cls.objects.get_or_create(
+                    name=name, defaults={'last_number': initial() if initial else 0}
+                )
+            cls.objects.filter(name=name).update(last_number=F('last_number') + count)
+            return cls.objects.values_list('last_number', flat=True).get(name=name)
+
+
 class NatureGroup(models.Model): # This gorup as main group
     name = models.CharField(max_length=100, unique=True)
 
@@ -24,10 +57,164 @@ class Ledger(models.Model):
     date = models.DateField(default=datetime.date.today)     
     group = models.ForeignKey(MainGroup, on_delete=models.CASCADE, related_name='ledgers')
     debit_credit = models.CharField(max_length=6, choices=[('DEBIT', 'Debit'), ('CREDIT', 'Credit')], blank=True)
+    # Lower-cased copy of name kept for indexed prefix lookups
+    search_name = models.CharField(max_length=100, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['search_name']),
+            models.Index(fields=['mobile_no']),
+            models.Index(fields=['group', 'search_name']),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.search_name = self.normalize_search(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_name'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def normalize_search(value):
+        return (value or '').strip().lower()
+
+
+# While a fiscal_lock_scope() is active (a request, see
+# FiscalLockMiddleware), the lock date is read from the database once.
+_lock_scope = ContextVar("fiscal_lock_scope", default=None)
+
+
+@contextmanager
+def fiscal_lock_scope():
+    token = _lock_scope.set({})
+    try:
+        yield
+    finally:
+        _lock_scope.reset(token)
+
+
+class FiscalYearClose(models.Model):
+    """
+    A closed fiscal year. Transactions dated on or before `end_date` are
+    locked, and the closing balance of every ledger is frozen in
+    LedgerClosingBalance as the opening balance of the following year.
+    """
+    start_date = models.DateField()
+    end_date = models.DateField(unique=True)
+    closed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('-end_date',)
+
+    def __str__(self):
+        return f"Fiscal year {self.start_date} - {self.end_date}"
+
+    @classmethod
+    def locked_until(cls):
+        scope = _lock_scope.get()
+        if scope is not None and 'locked_until' in scope:
+            return scope['locked_until']
+        locked_until = cls.objects.aggregate(last=models.Max('end_date'))['last']
+        if scope is not None:
+            scope['locked_until'] = locked_until
+        return locked_until
+
+    @classmethod
+    def forget_lock(cls):
+        """Drop the lock date cached in the current scope, after a close or reopen."""
+        scope = _lock_scope.get()
+        if scope is not None:
+            scope.pop('locked_until', None)
+
+    @classmethod
+    def latest_before(cls, date):
+        """Latest close whose period ends strictly before `date`."""
+        return cls.objects.filter(end_date__lt=date).order_by('-end_date').first()
+
+
+class LedgerClosingBalance(models.Model):
+    fiscal_close = models.ForeignKey(FiscalYearClose, on_delete=models.CASCADE, related_name='balances')
+    ledger = models.ForeignKey(Ledger, on_delete=models.CASCADE, related_name='closing_balances')
+    total_debit = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    total_credit = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    # Signed: positive is a debit balance, negative a credit balance
+    closing_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fiscal_close', 'ledger'], name='unique_ledger_closing_balance'),
+        ]
+
+    def __str__(self):
+        return f"{self.ledger.name} - {self.fiscal_close.end_date}: {self.closing_balance}"
+
+
+class DailyPosting(models.Model):
+    """
+    One end-of-day posting of sales, mess receipts and credit receipts into
+    the ledgers. A business date can only be posted once; deleting the
+    posting rolls back every transaction it created.
+    """
+    business_date = models.DateField(unique=True)
+    posted_at = models.DateTimeField(auto_now_add=True)
+    voucher_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    # Delivered credit orders without a credit user, left out of the posting
+    skipped_orders = models.PositiveIntegerField(default=0)
+    skipped_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        ordering = ('-business_date',)
+
+    def __str__(self):
+        return f"Daily posting {self.business_date} ({self.voucher_count} vouchers)"
+
+
+class Voucher(models.Model):
+    """
+    Header of a voucher; its debit and credit legs are Transaction rows.
+    Listings and lookups by number, type or date read this table instead of
+    grouping the whole Transaction table by voucher_no.
+    """
+    TRANSACTION_CHOICES = [
+        ('payin', 'Payin'),
+        ('payout', 'Payout'),
+    ]
+    voucher_no = models.PositiveIntegerField(unique=True)
+    date = models.DateField()
+    transaction_type = models.CharField(max_length=10, choices=TRANSACTION_CHOICES, blank=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    narration = models.TextField(blank=True)
+    daily_posting = models.ForeignKey(
+        DailyPosting, on_delete=models.CASCADE, related_name='vouchers', blank=True, null=True
+    )
+
+    class Meta:
+        ordering = ('-date', '-voucher_no')
+        indexes = [
+            models.Index(fields=['transaction_type', '-date']),
+            models.Index(fields=['-date', '-voucher_no']),
+        ]
+
+    def __str__(self):
+        return f"Voucher No: {self.voucher_no} - {self.date}"
+
+    @classmethod
+    def next_voucher_no(cls, count=1):
+        """
+        Allocate voucher numbers; with `count` > 1 returns the last of a block.
+        """
+        def last_issued():
+            return max(
+                cls.objects.aggregate(last=models.Max('voucher_no'))['last'] or 0,
+                Transaction.objects.aggregate(last=models.Max('voucher_no'))['last'] or 0,
+            )
+
+        return NumberSequence.next_number('voucher', initial=last_issued, count=count)
+
 
 class Transaction(models.Model):
     DEBIT = 'debit'
@@ -55,11 +242,28 @@ class Transaction(models.Model):
         max_length=10,
         choices=DEBIT_CREDIT_CHOICES
     )
+    voucher = models.ForeignKey(
+        Voucher, on_delete=models.CASCADE, related_name='legs', blank=True, null=True
+    )
 
     def __str__(self):
         return f"{self.ledger.name} - {self.date} - Voucher No: {self.voucher_no}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['ledger', '-date', '-id']),
+            models.Index(fields=['date']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored date, so check_period_open needn't query it again
+        instance._stored_date = instance.__dict__.get('date')
+        return instance
+
     def save(self, *args, **kwargs):
+        self.check_period_open()
         latest_transaction = Transaction.objects.filter(ledger=self.ledger).order_by('-date', '-id').first()
         
         if latest_transaction:
@@ -67,6 +271,29 @@ class Transaction(models.Model):
         else:
             previous_balance = Decimal('0.00')  
         
+        self.apply_balance(previous_balance)
+        super().save(*args, **kwargs)
+        self._stored_date = self.date
+
+    def delete(self, *args, **kwargs):
+        self.check_period_open()
+        return super().delete(*args, **kwargs)
+
+    def check_period_open(self):
+        locked_until = FiscalYearClose.locked_until()
+        if not locked_until:
+            return
+        stored_date = getattr(self, '_stored_date', None)
+        if stored_date is None and self.pk:
+            stored_date = Transaction.objects.filter(pk=self.pk).values_list('date', flat=True).first()
+        if self.date <= locked_until or (stored_date and stored_date <= locked_until):
+            raise ValidationError(f"The fiscal year up to {locked_until} is closed.")
+
+    def apply_balance(self, previous_balance):
+        """
+        Set balance_amount from the ledger's previous running balance.
+        Shared by save() and bulk posting, which bypasses save().
+        """
         was_negative = previous_balance < 0
         previous_balance = abs(previous_balance)  
         
@@ -77,8 +304,7 @@ class Transaction(models.Model):
         
         if was_negative:
             self.balance_amount = -abs(self.balance_amount)
-        
-        super().save(*args, **kwargs)
+        return self.balance_amount
 
 
 
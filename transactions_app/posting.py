@@ -0,0 +1,280 @@
+"""
+End-of-day posting of restaurant sales into the accounting ledgers.
+
+A business day is summarised into a handful of vouchers (cash sales, bank
+sales, sales per online platform, credit sales per customer, mess receipts
+and credit receipts per customer) and written with a single bulk insert.
+Each day is recorded as a DailyPosting so it is only ever posted once;
+rolling back deletes the posting together with its vouchers and their legs.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+
+from restaurant_app.models import CreditTransaction, CreditUser, MessTransaction, Order
+from .models import DailyPosting, FiscalYearClose, Ledger, Transaction, Voucher
+
+
+class PostingError(Exception):
+    pass
+
+
+def check_period_open(business_date):
+    locked_until = FiscalYearClose.locked_until()
+    if locked_until and business_date <= locked_until:
+        raise PostingError(f"The fiscal year up to {locked_until} is closed.")
+
+
+def receipt_cash_amount():
+    """
+    Cash in a payment received (MessTransaction, CreditTransaction): the
+    whole received_amount for "cash", whatever cash_amount says, and the
+    recorded split for "cash-bank". Shared by the daily posting and the
+    cash drawer reconciliation.
+    """
+    return Case(
+        When(payment_method='cash', then=F('received_amount')),
+        When(payment_method='cash-bank', then=F('cash_amount')),
+        default=Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def receipt_bank_amount():
+    """Bank counterpart of receipt_cash_amount()."""
+    return Case(
+        When(payment_method='bank', then=F('received_amount')),
+        When(payment_method='cash-bank', then=F('bank_amount')),
+        default=Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def order_cash_amount():
+    """
+    Cash taken for an order. Cash orders closed without a cash_amount (it
+    defaults to 0) count their total_amount. Shared by the daily posting and
+    the cash drawer reconciliation so both agree on a day's cash.
+    """
+    return Case(
+        When(Q(payment_method='cash', cash_amount=0), then=F('total_amount')),
+        When(payment_method__in=('cash', 'cash-bank'), then=F('cash_amount')),
+        default=Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def order_bank_amount():
+    """Bank counterpart of order_cash_amount()."""
+    return Case(
+        When(Q(payment_method='bank', bank_amount=0), then=F('total_amount')),
+        When(payment_method__in=('bank', 'cash-bank'), then=F('bank_amount')),
+        default=Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def collect_day_totals(business_date):
+    """
+    Aggregate a business day into posting buckets with three grouped queries.
+    """
+    totals = {
+        'cash_sales': Decimal('0.00'),
+        'bank_sales': Decimal('0.00'),
+        'platform_sales': defaultdict(Decimal),
+        'credit_sales': defaultdict(Decimal),
+        'mess_cash': Decimal('0.00'),
+        'mess_bank': Decimal('0.00'),
+        'credit_receipts': defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')]),
+        # Credit orders without a credit user can't be posted to a customer
+        'skipped_orders': 0,
+        'skipped_amount': Decimal('0.00'),
+    }
+    payment_labels = dict(Order.PAYMENT_METHOD_CHOICES)
+
+    orders = (
+        Order.objects.filter(status='delivered', created_at__date=business_date)
+        .values('payment_method', 'online_order__name', 'credit_user_id')
+        .annotate(
+            total=Sum('total_amount'), cash=Sum(order_cash_amount()), bank=Sum(order_bank_amount()), count=Count('id')
+        )
+        .order_by()
+    )
+    for row in orders:
+        method = row['payment_method']
+        if method in ('cash', 'bank', 'cash-bank'):
+            totals['cash_sales'] += row['cash'] or 0
+            totals['bank_sales'] += row['bank'] or 0
+        elif method == 'credit' and row['credit_user_id'] is None:
+            totals['skipped_orders'] += row['count']
+            totals['skipped_amount'] += row['total'] or 0
+        elif method == 'credit':
+            totals['credit_sales'][row['credit_user_id']] += row['total'] or 0
+        else:
+            platform = row['online_order__name'] or payment_labels.get(method, method)
+            totals['platform_sales'][platform] += row['total'] or 0
+
+    cash, bank = Sum(receipt_cash_amount()), Sum(receipt_bank_amount())
+    mess = MessTransaction.objects.filter(date=business_date).aggregate(cash=cash, bank=bank)
+    totals['mess_cash'] = mess['cash'] or Decimal('0.00')
+    totals['mess_bank'] = mess['bank'] or Decimal('0.00')
+
+    receipts = (
+        CreditTransaction.objects.filter(date=business_date, credit_user__isnull=False)
+        .values('credit_user_id')
+        .annotate(cash=cash, bank=bank)
+        .order_by()
+    )
+    for row in receipts:
+        totals['credit_receipts'][row['credit_user_id']] = [row['cash'] or 0, row['bank'] or 0]
+
+    return totals
+
+
+def _resolve_ledgers(totals):
+    """
+    Fetch every ledger the day touches in at most three queries, failing
+    before anything is written if one is missing.
+    """
+    names = settings.DAILY_POSTING_LEDGERS
+    wanted = set(names.values()) | set(totals['platform_sales'])
+    by_name = {}
+    for ledger in Ledger.objects.filter(name__in=wanted).order_by('id'):
+        by_name.setdefault(ledger.name, ledger)
+
+    credit_user_ids = set(totals['credit_sales']) | set(totals['credit_receipts'])
+    mobiles = dict(
+        CreditUser.objects.filter(id__in=credit_user_ids).values_list('id', 'mobile_number')
+    )
+    by_mobile = {}
+    for ledger in Ledger.objects.filter(group__name="Sundry Debtors", mobile_no__in=mobiles.values()):
+        by_mobile.setdefault(ledger.mobile_no, ledger)
+
+    missing = sorted(name for name in wanted if name not in by_name)
+    missing += [
+        f"credit user #{user_id}" for user_id in sorted(credit_user_ids)
+        if mobiles.get(user_id) not in by_mobile
+    ]
+    if missing:
+        raise PostingError(f"Missing ledgers for daily posting: {', '.join(missing)}")
+
+    ledgers = {key: by_name[name] for key, name in names.items()}
+    ledgers['platforms'] = {name: by_name[name] for name in totals['platform_sales']}
+    ledgers['customers'] = {user_id: by_mobile[mobiles[user_id]] for user_id in credit_user_ids}
+    return ledgers
+
+
+def build_entries(totals, ledgers):
+    """
+    Turn day totals into (debit ledger, credit ledger, amount, remark) entries.
+    """
+    cash, bank, sales, mess = ledgers['cash'], ledgers['bank'], ledgers['sales'], ledgers['mess']
+    entries = [
+        (cash, sales, totals['cash_sales'], "Cash sales"),
+        (bank, sales, totals['bank_sales'], "Bank sales"),
+        (cash, mess, totals['mess_cash'], "Mess receipts (cash)"),
+        (bank, mess, totals['mess_bank'], "Mess receipts (bank)"),
+    ]
+    for platform, amount in sorted(totals['platform_sales'].items()):
+        entries.append((ledgers['platforms'][platform], sales, amount, f"{platform} sales"))
+    for user_id, amount in sorted(totals['credit_sales'].items()):
+        entries.append((ledgers['customers'][user_id], sales, amount, "Credit sales"))
+    for user_id, (cash_amount, bank_amount) in sorted(totals['credit_receipts'].items()):
+        customer = ledgers['customers'][user_id]
+        entries.append((cash, customer, cash_amount, "Credit receipt (cash)"))
+        entries.append((bank, customer, bank_amount, "Credit receipt (bank)"))
+    return [entry for entry in entries if entry[2] > 0]
+
+
+def _latest_balances(ledger_ids):
+    latest = Transaction.objects.filter(ledger=OuterRef('pk')).order_by('-date', '-id')
+    return dict(
+        Ledger.objects.filter(id__in=ledger_ids)
+        .annotate(last_balance=Subquery(latest.values('balance_amount')[:1]))
+        .values_list('id', 'last_balance')
+    )
+
+
+def post_business_day(business_date, repost=False):
+    """
+    Post one business day. Returns the existing DailyPosting untouched if the
+    day was already posted, unless `repost` is set, in which case the old
+    posting is rolled back and the day is posted again.
+    """
+    check_period_open(business_date)
+    with transaction.atomic():
+        existing = DailyPosting.objects.select_for_update().filter(business_date=business_date).first()
+        if existing and not repost:
+            return existing
+        if existing:
+            existing.delete()
+
+        totals = collect_day_totals(business_date)
+        ledgers = _resolve_ledgers(totals)
+        entries = build_entries(totals, ledgers)
+
+        try:
+            with transaction.atomic():
+                posting = DailyPosting.objects.create(business_date=business_date)
+        except IntegrityError:
+            # Another worker posted the same day concurrently
+            return DailyPosting.objects.get(business_date=business_date)
+
+        balances = _latest_balances({ledger.id for entry in entries for ledger in entry[:2]})
+        ref_no = f"EOD-{business_date:%Y%m%d}"
+        first_voucher_no = Voucher.next_voucher_no(count=len(entries)) - len(entries) + 1 if entries else 0
+        vouchers = Voucher.objects.bulk_create([
+            Voucher(
+                voucher_no=first_voucher_no + n,
+                date=business_date,
+                transaction_type='payin' if debit_ledger in (ledgers['cash'], ledgers['bank']) else '',
+                total_amount=amount,
+                narration=f"{remark} for {business_date}",
+                daily_posting=posting,
+            )
+            for n, (debit_ledger, credit_ledger, amount, remark) in enumerate(entries)
+        ])
+        rows = []
+        for voucher, (debit_ledger, credit_ledger, amount, remark) in zip(vouchers, entries):
+            legs = (
+                (debit_ledger, credit_ledger, Transaction.DEBIT, amount, Decimal('0.00')),
+                (credit_ledger, debit_ledger, Transaction.CREDIT, Decimal('0.00'), amount),
+            )
+            for ledger, particulars, debit_credit, debit_amount, credit_amount in legs:
+                row = Transaction(
+                    transaction_type=voucher.transaction_type,
+                    ledger=ledger,
+                    particulars=particulars,
+                    date=business_date,
+                    debit_amount=debit_amount,
+                    credit_amount=credit_amount,
+                    remarks=voucher.narration,
+                    voucher_no=voucher.voucher_no,
+                    ref_no=ref_no,
+                    debit_credit=debit_credit,
+                    voucher=voucher,
+                )
+                balances[ledger.id] = row.apply_balance(balances.get(ledger.id) or Decimal('0.00'))
+                rows.append(row)
+
+        Transaction.objects.bulk_create(rows)
+        posting.voucher_count = len(entries)
+        posting.total_amount = sum(entry[2] for entry in entries)
+        posting.skipped_orders = totals['skipped_orders']
+        posting.skipped_amount = totals['skipped_amount']
+        posting.save(update_fields=['voucher_count', 'total_amount', 'skipped_orders', 'skipped_amount'])
+        return posting
+
+
+def rollback_business_day(business_date):
+    """
+    Delete the posting for a business day and every voucher it created.
+    Returns False if the day was never posted.
+    """
+    check_period_open(business_date)
+    with transaction.atomic():
+        deleted, _ = DailyPosting.objects.filter(business_date=business_date).delete()
+    return bool(deleted)
@@ -0,0 +1,85 @@
+"""
+Profit/loss distribution across share users.
+
+The net result of a period is taken from the ledgers, split by each share
+user's `profitlose_share` percentage and written with one bulk insert. Amounts
+are rounded to cents with the largest-remainder method so the rows always add
+up exactly to the distributed total.
+"""
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+
+from .models import ProfitLossShareTransaction, ShareUsers, ShareUserTransaction
+from .reports import compute_profit_and_loss
+from .serializers import get_next_transaction_no
+
+CENT = Decimal('0.01')
+
+
+class DistributionError(Exception):
+    pass
+
+
+def split_amount(amount, percentages):
+    """
+    Split `amount` proportionally to `percentages` (a list of Decimals out of
+    100). Returns one Decimal per percentage; their sum equals `amount` times
+    the total percentage, rounded to cents.
+    """
+    total = (amount * sum(percentages) / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+    exact = [amount * pct / 100 for pct in percentages]
+    shares = [value.quantize(CENT, rounding=ROUND_DOWN) for value in exact]
+
+    # Hand the leftover cents to the largest rounding remainders first
+    leftover = int((total - sum(shares)) / CENT)
+    by_remainder = sorted(range(len(exact)), key=lambda i: exact[i] - shares[i], reverse=True)
+    for i in by_remainder[:leftover]:
+        shares[i] += CENT
+    return shares
+
+
+def distribute_profit_loss(period_from, period_to, share_user_ids=None):
+    """
+    Compute the net profit or loss of a period and record its distribution
+    as a ProfitLossShareTransaction with one ShareUserTransaction per user.
+    """
+    share_users = ShareUsers.objects.order_by('id')
+    if share_user_ids:
+        share_users = share_users.filter(id__in=share_user_ids)
+    share_users = list(share_users)
+    if not share_users:
+        raise DistributionError("No share users to distribute to.")
+
+    percentages = [user.profitlose_share for user in share_users]
+    if sum(percentages) > 100:
+        raise DistributionError("Share percentages add up to more than 100.")
+
+    result = compute_profit_and_loss(period_from, period_to)
+    net_profit = Decimal(result['net_profit'])
+    net_loss = Decimal(result['net_loss'])
+    profit_lose = 'lose' if net_loss else 'profit'
+    amounts = split_amount(net_loss or net_profit, percentages)
+
+    with transaction.atomic():
+        share_transaction = ProfitLossShareTransaction.objects.create(
+            transaction_no=get_next_transaction_no(),
+            period_from=period_from,
+            period_to=period_to,
+            status=profit_lose,
+            profit_amount=net_profit,
+            loss_amount=net_loss,
+            total_amount=sum(amounts),
+            total_percentage=sum(percentages),
+        )
+        ShareUserTransaction.objects.bulk_create([
+            ShareUserTransaction(
+                transaction=share_transaction,
+                share_user=user,
+                percentage=user.profitlose_share,
+                profit_lose=profit_lose,
+                amount=amount,
+            )
+            for user, amount in zip(share_users, amounts)
+        ])
+    return share_transaction
@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+from .models import FiscalYearClose, LedgerClosingBalance, Transaction
+
+
+def compute_profit_and_loss(from_date, to_date):
+    """
+    Income (credits on Income ledgers) against expenses (debits on Expense
+    ledgers) for a period, computed in one aggregate query.
+    """
+    totals = Transaction.objects.filter(date__range=(from_date, to_date)).aggregate(
+        total_expense=Sum(
+            'debit_amount', filter=Q(ledger__group__nature_group__name__iexact='Expense')
+        ),
+        total_income=Sum(
+            'credit_amount', filter=Q(ledger__group__nature_group__name__iexact='Income')
+        ),
+    )
+    total_expense = totals['total_expense'] or Decimal('0.00')
+    total_income = totals['total_income'] or Decimal('0.00')
+
+    return {
+        'total_expense': total_expense,
+        'total_income': total_income,
+        'net_profit': total_income - total_expense if total_income > total_expense else 0,
+        'net_loss': total_expense - total_income if total_expense > total_income else 0,
+    }
+
+
+def signed_opening_balance(ledger):
+    opening = ledger.opening_balance or Decimal('0.00')
+    return -opening if ledger.debit_credit == 'CREDIT' else opening
+
+
+def ledger_balance_before(ledger, date):
+    """
+    Signed balance (debit positive) of a ledger at the start of `date`.
+
+    Starts from the latest fiscal year close before `date` so only movements
+    since that close are summed; without a close it falls back to the
+    ledger's own opening balance and its full history.
+    """
+    close = FiscalYearClose.latest_before(date)
+    movements = Transaction.objects.filter(ledger_id=ledger.id, date__lt=date)
+    if close:
+        balance = LedgerClosingBalance.objects.filter(
+            fiscal_close=close, ledger_id=ledger.id
+        ).values_list('closing_balance', flat=True).first()
+        balance = signed_opening_balance(ledger) if balance is None else balance
+        movements = movements.filter(date__gt=close.end_date)
+    else:
+        balance = signed_opening_balance(ledger)
+
+    totals = movements.aggregate(total_debit=Sum('debit_amount'), total_credit=Sum('credit_amount'))
+    return balance + (totals['total_debit'] or 0) - (totals['total_credit'] or 0)
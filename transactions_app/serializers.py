@@ -1,5 +1,9 @@
+from django.db import transaction
+from django.db.models import IntegerField, Max
+from django.db.models.functions import Cast
 from rest_framework import serializers
 from .models import (
+    NumberSequence,
     NatureGroup,
     MainGroup,
     Ledger, 
@@ -8,7 +12,8 @@ from .models import (
     ShareUserTransaction,
     ProfitLossShareTransaction,
     CashCountSheet,
-
+    Voucher,
+    FiscalYearClose,
     )
 
 class NatureGroupSerializer(serializers.ModelSerializer):
@@ -40,6 +45,78 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
+        # Assigned from the voucher header when legs are created together
+        extra_kwargs = {'voucher_no': {'required': False}}
+
+    def validate(self, attrs):
+        locked_until = FiscalYearClose.locked_until()
+        if locked_until:
+            date = attrs.get('date', getattr(self.instance, 'date', None))
+            if (date and date <= locked_until) or (self.instance and self.instance.date <= locked_until):
+                raise serializers.ValidationError(f"The fiscal year up to {locked_until} is closed.")
+        return attrs
+
+
+class VoucherSerializer(serializers.ModelSerializer):
+    legs = TransactionSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Voucher
+        fields = ['id', 'voucher_no', 'date', 'transaction_type', 'total_amount', 'narration', 'legs']
+
+
+class FlatTransactionSerializer(serializers.ModelSerializer):
+    """
+    Transaction with `ledger` and `particulars` rendered as plain IDs.
+
+    Used together with `build_ledger_side_table` so every referenced ledger
+    and group is sent once instead of being nested into every row.
+    """
+    class Meta:
+        model = Transaction
+        fields = '__all__'
+
+
+# Joins needed to render a transaction and both of its ledgers without N+1 queries
+TRANSACTION_RELATED_FIELDS = (
+    'ledger__group__nature_group',
+    'particulars__group__nature_group',
+)
+
+
+def build_ledger_side_table(transactions):
+    # Expects transactions fetched with TRANSACTION_RELATED_FIELDS so no
+    # extra queries are issued here.
+    ledgers, main_groups, nature_groups = {}, {}, {}
+    for txn in transactions:
+        for ledger in (txn.ledger, txn.particulars):
+            if ledger.id in ledgers:
+                continue
+            group = ledger.group
+            ledgers[ledger.id] = {
+                'id': ledger.id,
+                'name': ledger.name,
+                'mobile_no': ledger.mobile_no,
+                'opening_balance': ledger.opening_balance,
+                'debit_credit': ledger.debit_credit,
+                'group': group.id,
+            }
+            if group.id not in main_groups:
+                main_groups[group.id] = {
+                    'id': group.id,
+                    'name': group.name,
+                    'nature_group': group.nature_group_id,
+                }
+                nature_group = group.nature_group
+                nature_groups[nature_group.id] = {
+                    'id': nature_group.id,
+                    'name': nature_group.name,
+                }
+    return {
+        'ledgers': list(ledgers.values()),
+        'main_groups': list(main_groups.values()),
+        'nature_groups': list(nature_groups.values()),
+    }
 
 #ShareManagement
 class ShareUserManagementSerializer(serializers.ModelSerializer):
@@ -48,15 +125,14 @@ class ShareUserManagementSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'mobile_no', 'category', 'profitlose_share', 'address']
 
 def get_next_transaction_no():
-    # Get the last transaction and increment the number
-    last_transaction = ProfitLossShareTransaction.objects.order_by('-created_date').first()
-    if last_transaction:
-        last_transaction_no = last_transaction.transaction_no
-        next_transaction_no = str(int(last_transaction_no) + 1)
-    else:
-        # If there are no transactions yet, start with 1
-        next_transaction_no = '1'
-    return next_transaction_no
+    # Allocated from a locked counter so concurrent requests never collide;
+    # the counter is seeded once from the highest number already issued.
+    def last_issued():
+        return ProfitLossShareTransaction.objects.filter(
+            transaction_no__regex=r'^[0-9]+$'
+        ).aggregate(last=Max(Cast('transaction_no', IntegerField())))['last'] or 0
+
+    return str(NumberSequence.next_number('profit_loss_share_transaction', initial=last_issued))
 
 class ShareUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -89,30 +165,53 @@ class ProfitLossShareTransactionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ('transaction_no',)  # Make transaction_no read-only
 
+    @transaction.atomic
     def create(self, validated_data):
         # Generate the next transaction number
-        transaction_no = get_next_transaction_no()
-        validated_data['transaction_no'] = transaction_no
-        
+        validated_data['transaction_no'] = get_next_transaction_no()
         share_users_data = validated_data.pop('share_user_transactions')
-        transaction = ProfitLossShareTransaction.objects.create(**validated_data)
-        
+
         # Calculate total_amount and total_percentage
-        total_amount = sum(user_data['amount'] for user_data in share_users_data)
-        total_percentage = sum(user_data['percentage'] for user_data in share_users_data)
-        
-        transaction.total_amount = total_amount
-        transaction.total_percentage = total_percentage
-        transaction.save()
-
-        for share_user_data in share_users_data:
-            ShareUserTransaction.objects.create(transaction=transaction, **share_user_data)
-        
-        return transaction
+        validated_data['total_amount'] = sum(user_data['amount'] for user_data in share_users_data)
+        validated_data['total_percentage'] = sum(user_data['percentage'] for user_data in share_users_data)
+        profit_loss_transaction = ProfitLossShareTransaction.objects.create(**validated_data)
+
+        ShareUserTransaction.objects.bulk_create([
+            ShareUserTransaction(transaction=profit_loss_transaction, **share_user_data)
+            for share_user_data in share_users_data
+        ])
+        return profit_loss_transaction
+
+class ProfitLossDistributeSerializer(serializers.Serializer):
+    """Input of the distribute action; `share_users` limits it to those ids."""
+    period_from = serializers.DateField()
+    period_to = serializers.DateField()
+    share_users = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if attrs['period_from'] > attrs['period_to']:
+            raise serializers.ValidationError("period_from must be on or before period_to.")
+        return attrs
+
+class CashCountSheetListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        # One INSERT for the whole denomination sheet instead of one per row
+        return CashCountSheet.objects.bulk_create(
+            [CashCountSheet(**item) for item in validated_data]
+        )
 
 class CashCountSheetSerializer(serializers.ModelSerializer):
     class Meta:
         model = CashCountSheet
         fields = ['id', 'created_date', 'currency', 'nos', 'amount']
+        list_serializer_class = CashCountSheetListSerializer
+
 
 
+
+class FiscalYearCloseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FiscalYearClose
+        fields = ['id', 'start_date', 'end_date', 'closed_at']
+        read_only_fields = ['closed_at']
+        extra_kwargs = {'start_date': {'required': False}}
@@ -1,3 +1,327 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from restaurant_app.models import CreditUser, MessTransaction, Order
+from .fiscal import close_fiscal_year
+from .models import (
+    CashCountSheet, DailyPosting, Ledger, MainGroup, NatureGroup, ProfitLossShareTransaction, ShareUsers, Transaction,
+    Voucher, fiscal_lock_scope,
+)
+from .posting import post_business_day
+from .profit_share import DistributionError, distribute_profit_loss, split_amount
+
+User = get_user_model()
+
+
+class LedgerFixtures:
+    def make_ledgers(self):
+        income = NatureGroup.objects.create(name="Income")
+        asset = NatureGroup.objects.create(name="Asset")
+        sales_group = MainGroup.objects.create(name="Sales Account", nature_group=income)
+        cash_group = MainGroup.objects.create(name="Cash-in-Hand", nature_group=asset)
+        MainGroup.objects.create(name="Sundry Debtors", nature_group=asset)
+        self.cash = Ledger.objects.create(name="Cash", group=cash_group)
+        self.bank = Ledger.objects.create(name="Bank", group=cash_group)
+        self.sales = Ledger.objects.create(name="Sales", group=sales_group)
+        self.mess = Ledger.objects.create(name="Mess Income", group=sales_group)
+
+    def make_user(self):
+        return User.objects.create(username="cashier", email="cashier@example.com", passcode="123456", role="admin")
+
+
+class DailyPostingTests(LedgerFixtures, TestCase):
+    day = date(2024, 3, 5)
+
+    def setUp(self):
+        self.make_ledgers()
+        self.user = self.make_user()
+
+    def order(self, payment_method, total, **fields):
+        return Order.objects.create(
+            user=self.user, total_amount=Decimal(total), status="delivered", payment_method=payment_method,
+            created_at=datetime(2024, 3, 5, 12), **fields
+        )
+
+    def ledger_total(self, ledger, field="debit_amount"):
+        return sum(getattr(row, field) for row in Transaction.objects.filter(ledger=ledger))
+
+    def test_cash_orders_without_cash_amount_post_their_total(self):
+        self.order("cash", "10.00")
+        self.order("cash-bank", "10.00", cash_amount=Decimal("4.00"), bank_amount=Decimal("6.00"))
+        self.order("bank", "7.00")
+
+        post_business_day(self.day)
+
+        self.assertEqual(self.ledger_total(self.cash), Decimal("14.00"))
+        self.assertEqual(self.ledger_total(self.bank), Decimal("13.00"))
+        self.assertEqual(self.ledger_total(self.sales, "credit_amount"), Decimal("27.00"))
+
+    def test_credit_orders_without_credit_user_are_skipped_and_reported(self):
+        customer = CreditUser.objects.create(username="customer", mobile_number="5551234", limit_amount=1000)
+        self.order("cash", "10.00")
+        self.order("credit", "25.00", credit_user_id=customer.id)
+        self.order("credit", "8.00")
+        self.order("credit", "2.00")
+
+        posting = post_business_day(self.day)
+
+        self.assertEqual(posting.skipped_orders, 2)
+        self.assertEqual(posting.skipped_amount, Decimal("10.00"))
+        self.assertEqual(posting.total_amount, Decimal("35.00"))
+        self.assertEqual(DailyPosting.objects.count(), 1)
+
+
+class ProfitShareTests(LedgerFixtures, TestCase):
+    def setUp(self):
+        self.make_ledgers()
+        self.partners = [
+            ShareUsers.objects.create(
+                name=f"Partner {n}", mobile_no=f"555000{n}", category="partners",
+                profitlose_share=Decimal("33.33"), address="Doha",
+            )
+            for n in range(3)
+        ]
+
+    def test_split_adds_up_to_the_cent(self):
+        shares = split_amount(Decimal("100.00"), [Decimal("33.33")] * 3)
+        self.assertEqual(sum(shares), Decimal("99.99"))
+        self.assertEqual(sorted(shares), [Decimal("33.33")] * 3)
+
+        shares = split_amount(Decimal("0.05"), [Decimal("50"), Decimal("50")])
+        self.assertEqual(sum(shares), Decimal("0.05"))
+
+    def test_period_profit_is_distributed_in_one_batch(self):
+        Transaction.objects.create(
+            ledger=self.sales, particulars=self.cash, date=date(2024, 3, 5), debit_amount=Decimal("0.00"),
+            credit_amount=Decimal("300.00"), voucher_no=1, debit_credit="credit",
+        )
+
+        share_transaction = distribute_profit_loss(date(2024, 3, 1), date(2024, 3, 31))
+
+        self.assertEqual(share_transaction.status, "profit")
+        rows = share_transaction.share_user_transactions.all()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(sum(row.amount for row in rows), share_transaction.total_amount)
+        self.assertEqual(share_transaction.total_amount, Decimal("299.97"))
+
+    def test_shares_above_100_percent_are_refused(self):
+        ShareUsers.objects.filter(pk=self.partners[0].pk).update(profitlose_share=Decimal("40.00"))
+        with self.assertRaises(DistributionError):
+            distribute_profit_loss(date(2024, 3, 1), date(2024, 3, 31))
+
+    def test_distribute_rejects_malformed_share_users(self):
+        client = APIClient()
+        client.force_authenticate(self.make_user())
+        period = {"period_from": "2024-03-01", "period_to": "2024-03-31"}
+
+        for share_users in ("1,2", ["a"], [1, None], [], {"id": 1}):
+            response = client.post("/api/profit-loss-share-transactions/distribute/", {**period, "share_users": share_users}, format="json")
+            self.assertEqual(response.status_code, 400, share_users)
+            self.assertIn("share_users", response.data)
+        self.assertEqual(ProfitLossShareTransaction.objects.count(), 0)
+
+        response = client.post(
+            "/api/profit-loss-share-transactions/distribute/",
+            {**period, "share_users": [self.partners[0].id]}, format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["share_user_transactions"]), 1)
+
+
+class CashReconciliationTests(LedgerFixtures, TestCase):
+    def setUp(self):
+        self.make_ledgers()
+        self.user = self.make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cash_orders_closed_without_cash_amount_count_their_total(self):
+        created_at = datetime(2024, 3, 5, 12)
+        for payment_method, fields in (
+            ("cash", {}),
+            ("cash", {"cash_amount": Decimal("10.00")}),
+            ("cash-bank", {"cash_amount": Decimal("4.00"), "bank_amount": Decimal("6.00")}),
+            ("bank", {}),
+        ):
+            Order.objects.create(
+                user=self.user, total_amount=Decimal("10.00"), status="delivered",
+                payment_method=payment_method, created_at=created_at, **fields
+            )
+        CashCountSheet.objects.create(created_date=date(2024, 3, 5), currency=1, nos=24, amount=Decimal("24.00"))
+
+        response = self.client.get("/api/cashcount-sheet/reconciliation/", {"date": "2024-03-05"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.data["order_cash"])), Decimal("24.00"))
+        self.assertEqual(Decimal(str(response.data["variance"])), Decimal("0.00"))
+        # Same cash basis as the daily posting
+        post_business_day(date(2024, 3, 5))
+        self.assertEqual(sum(row.debit_amount for row in Transaction.objects.filter(ledger=self.cash)), Decimal("24.00"))
+
+    def test_cash_mess_payment_without_cash_amount_counts_its_receipt(self):
+        payment = MessTransaction.objects.create(received_amount=Decimal("30.00"), status="completed", payment_method="cash")
+        MessTransaction.objects.filter(pk=payment.pk).update(date=date(2024, 3, 5))
+        CashCountSheet.objects.create(created_date=date(2024, 3, 5), currency=1, nos=30, amount=Decimal("30.00"))
+
+        response = self.client.get("/api/cashcount-sheet/reconciliation/", {"date": "2024-03-05"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.data["mess_cash"])), Decimal("30.00"))
+        self.assertEqual(Decimal(str(response.data["variance"])), Decimal("0.00"))
+        post_business_day(date(2024, 3, 5))
+        self.assertEqual(sum(row.debit_amount for row in Transaction.objects.filter(ledger=self.cash)), Decimal("30.00"))
+
+
+class VoucherTests(LedgerFixtures, TestCase):
+    def setUp(self):
+        self.make_ledgers()
+        self.client = APIClient()
+        self.client.force_authenticate(self.make_user())
+
+    def legs(self, **fields):
+        first = {
+            "ledger_id": self.cash.id, "particulars_id": self.sales.id, "date": "2024-03-05",
+            "debit_amount": "50.00", "credit_amount": "0.00", "debit_credit": "debit",
+            "transaction_type": "payin", "remarks": "Counter sale",
+        }
+        second = {
+            **first, "ledger_id": self.sales.id, "particulars_id": self.cash.id,
+            "debit_amount": "0.00", "credit_amount": "50.00", "debit_credit": "credit",
+        }
+        first.update(fields)
+        return {"transaction1": first, "transaction2": second}
+
+    def test_create_makes_one_voucher_for_both_legs(self):
+        response = self.client.post("/api/transactions/", self.legs(), format="json")
+
+        self.assertEqual(response.status_code, 201)
+        voucher = Voucher.objects.get()
+        self.assertEqual(voucher.total_amount, Decimal("50.00"))
+        self.assertEqual(sorted(voucher.legs.values_list("voucher_no", flat=True)), [voucher.voucher_no] * 2)
+
+    def test_invalid_legs_are_rejected_before_a_voucher_is_created(self):
+        for fields in ({"debit_amount": "abc"}, {"date": None}, {"date": "2024-13-45"}):
+            response = self.client.post("/api/transactions/", self.legs(**fields), format="json")
+            self.assertEqual(response.status_code, 400, fields)
+        self.assertFalse(Voucher.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_legs_not_yet_backfilled_are_still_listed(self):
+        for ledger, particulars, debit_credit in ((self.cash, self.sales, "debit"), (self.sales, self.cash, "credit")):
+            Transaction.objects.create(
+                ledger=ledger, particulars=particulars, date=date(2024, 3, 1),
+                debit_amount=Decimal("20.00"), credit_amount=Decimal("20.00"), voucher_no=7, debit_credit=debit_credit, transaction_type="payin",
+            )
+        self.client.post("/api/transactions/", self.legs(), format="json")
+
+        by_number = self.client.get("/api/transactions/filter_by_voucher_no/", {"voucher_no": 7})
+        self.assertEqual(len(by_number.data), 2)
+        by_type = self.client.get("/api/transactions/filter_transaction_by_transaction_type/", {"transaction_type": "payin"})
+        self.assertEqual(sorted(row["voucher_no"] for row in by_type.data), [7, Voucher.objects.get().voucher_no])
+
+
+class TransactionListingTests(LedgerFixtures, TestCase):
+    def setUp(self):
+        self.make_ledgers()
+        self.client = APIClient()
+        self.client.force_authenticate(self.make_user())
+        for n, (ledger, particulars) in enumerate([(self.cash, self.sales), (self.bank, self.mess)] * 3):
+            Transaction.objects.create(
+                ledger=ledger, particulars=particulars, date=date(2024, 3, n + 1), debit_amount=Decimal("10.00"),
+                credit_amount=Decimal("0.00"), voucher_no=n + 1, debit_credit="debit",
+            )
+
+    def test_flat_list_sends_each_ledger_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/transactions/", {"flat": "true"})
+
+        self.assertEqual(response.status_code, 200)
+        rows = response.data["results"]
+        self.assertEqual(len(rows), 6)
+        # Newest first
+        self.assertEqual([row["voucher_no"] for row in rows], [6, 5, 4, 3, 2, 1])
+        self.assertEqual(rows[-1]["ledger"], self.cash.id)
+        self.assertEqual(sorted(ledger["id"] for ledger in response.data["ledgers"]), sorted(
+            [self.cash.id, self.bank.id, self.sales.id, self.mess.id]
+        ))
+        self.assertEqual(len(response.data["main_groups"]), 2)
+        # Ledgers and groups come with the transactions, not per row
+        self.assertLessEqual(len([query for query in queries if "transactions_app_" in query["sql"]]), 2)
+
+    def test_ledger_report_pages_carry_the_opening_balance(self):
+        response = self.client.get(
+            "/api/transactions/ledger_report/", {"ledger": self.cash.id, "from_date": "2024-03-02", "page_size": 1}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["opening_balance"]["balance_amount"], Decimal("10.00"))
+
+
+class LedgerReportTests(LedgerFixtures, TestCase):
+    def setUp(self):
+        self.make_ledgers()
+        self.client = APIClient()
+        self.client.force_authenticate(self.make_user())
+
+    def test_ledger_found_by_name_before_search_backfill(self):
+        Ledger.objects.filter(id=self.cash.id).update(search_name="")
+        Transaction.objects.create(
+            ledger=self.cash, particulars=self.sales, date=date(2024, 3, 1), debit_amount=Decimal("20.00"),
+            credit_amount=Decimal("0.00"), voucher_no=1, debit_credit="debit",
+        )
+
+        response = self.client.get("/api/transactions/ledger_report/", {"ledger": "Cash"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(response.data["opening_balance"]["ledger"], self.cash.id)
+
+
+class FiscalCloseTests(LedgerFixtures, TestCase):
+    def setUp(self):
+        self.make_ledgers()
+
+    def post(self, day, amount="10.00"):
+        return Transaction.objects.create(
+            ledger=self.cash, particulars=self.sales, date=day, debit_amount=Decimal(amount),
+            credit_amount=Decimal("0.00"), voucher_no=Transaction.objects.count() + 1, debit_credit="debit",
+        )
+
+    def test_first_close_with_later_start_date_keeps_earlier_history(self):
+        self.post(date(2023, 6, 1), "40.00")
+        self.post(date(2024, 2, 1), "10.00")
+
+        fiscal_close = close_fiscal_year(date(2024, 12, 31), start_date=date(2024, 1, 1))
+
+        cash = fiscal_close.balances.get(ledger=self.cash)
+        self.assertEqual(cash.closing_balance, Decimal("50.00"))
+        self.assertEqual(cash.total_debit, Decimal("10.00"))
+
+    def test_closed_period_is_locked(self):
+        moved = self.post(date(2025, 1, 10))
+        self.post(date(2024, 5, 1))
+        close_fiscal_year(date(2024, 12, 31))
+
+        with self.assertRaises(DjangoValidationError):
+            self.post(date(2024, 6, 1))
+        moved = Transaction.objects.get(pk=moved.pk)
+        moved.date = date(2024, 6, 1)
+        with self.assertRaises(DjangoValidationError):
+            moved.save()
 
-# Create your tests here.
+    def test_lock_date_is_read_once_per_scope(self):
+        close_fiscal_year(date(2023, 12, 31))
+        with CaptureQueriesContext(connection) as queries, fiscal_lock_scope():
+            for n in range(5):
+                self.post(date(2024, 1, n + 1))
+        lock_queries = [query for query in queries if "fiscalyearclose" in query["sql"].lower()]
+        self.assertEqual(len(lock_queries), 1)
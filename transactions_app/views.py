@@ -1,8 +1,10 @@
 from rest_framework import viewsets,status
 from django.db import transaction 
-from django.db.models import Sum, Q
+from django.conf import settings
+from django.db.models import Min, Sum, Q
 from datetime import datetime
-from django.db.models import F, Min
+from decimal import Decimal, InvalidOperation
+from django.db.models import CharField, F, OuterRef, Prefetch, Subquery, Value
 
 from .models import (
     CashCountSheet,
@@ -10,7 +12,9 @@ from .models import (
     MainGroup, 
     Ledger, 
     Transaction,
-    ShareUsers
+    ShareUsers,
+    Voucher,
+    FiscalYearClose,
     )
 from .serializers import (
      CashCountSheetSerializer,
@@ -20,12 +24,27 @@ from .serializers import (
      TransactionSerializer,
      ShareUserManagementSerializer,
      ProfitLossShareTransaction,
-     ProfitLossShareTransactionSerializer
+     ProfitLossShareTransactionSerializer,
+     ProfitLossDistributeSerializer,
+     VoucherSerializer,
+     FiscalYearCloseSerializer,
      )
+from .serializers import (
+    FlatTransactionSerializer,
+    TRANSACTION_RELATED_FIELDS,
+    build_ledger_side_table,
+)
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.utils.dateparse import parse_date
-from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from django.utils.dateparse import parse_date, parse_time
+from rest_framework.exceptions import NotFound, ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
+from restaurant_app.models import CreditTransaction, MessTransaction, Order
+from .fiscal import FiscalCloseError, close_fiscal_year, reopen_latest_fiscal_year
+from .posting import order_cash_amount, receipt_cash_amount
+from .profit_share import DistributionError, distribute_profit_loss
+from .reports import compute_profit_and_loss, ledger_balance_before, signed_opening_balance
 
 class NatureGroupViewSet(viewsets.ModelViewSet):
     queryset = NatureGroup.objects.all()
@@ -36,14 +55,94 @@ class MainGroupViewSet(viewsets.ModelViewSet):
     serializer_class = MainGroupSerializer
 
 class LedgerViewSet(viewsets.ModelViewSet):
-    queryset = Ledger.objects.all()
+    queryset = Ledger.objects.select_related('group__nature_group')
     serializer_class = LedgerSerializer
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Autocomplete ledgers by name or mobile number prefix.
+
+        Query params: `q` (required), `group` (main group id or name),
+        `nature_group` (name) and `limit` (default 20, max 100).
+        """
+        query = Ledger.normalize_search(request.query_params.get('q'))
+        if not query:
+            return Response([])
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Prefix match as a range so plain b-tree indexes serve it on any database
+        upper_bound = query + '\uffff'
+        matches = Q(search_name__gte=query, search_name__lt=upper_bound)
+        if query[0].isdigit() or query[0] == '+':
+            matches |= Q(mobile_no__gte=query, mobile_no__lt=upper_bound)
+        ledgers = Ledger.objects.filter(matches)
+
+        group = request.query_params.get('group')
+        if group:
+            ledgers = ledgers.filter(group_id=int(group)) if group.isdigit() else ledgers.filter(group__name=group)
+        nature_group = request.query_params.get('nature_group')
+        if nature_group:
+            ledgers = ledgers.filter(group__nature_group__name__iexact=nature_group)
+
+        results = ledgers.order_by('search_name', 'id').values(
+            'id', 'name', 'mobile_no', 'group_id', 'group__name'
+        )[:limit]
+        return Response([
+            {
+                'id': ledger['id'],
+                'name': ledger['name'],
+                'mobile_no': ledger['mobile_no'],
+                'group': ledger['group_id'],
+                'group_name': ledger['group__name'],
+            }
+            for ledger in results
+        ])
+
+
+class LedgerReportPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
 
 class TransactionViewSet(viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
 
+    def get_queryset(self):
+        # Newest first, with id as tie-break so pages are stable
+        return super().get_queryset().select_related(*TRANSACTION_RELATED_FIELDS).order_by('-date', '-id')
+
+    def is_flat_request(self):
+        return str(self.request.query_params.get('flat', '')).lower() in ('1', 'true')
+
+    def serialize_transactions(self, transactions):
+        """
+        Serialize transactions either nested (default) or flat with a
+        deduplicated side-table of ledgers and groups when `?flat=true`.
+        """
+        transactions = list(transactions)
+        if not self.is_flat_request():
+            return self.get_serializer(transactions, many=True).data, {}
+        data = FlatTransactionSerializer(transactions, many=True).data
+        return data, build_ledger_side_table(transactions)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        data, side_table = self.serialize_transactions(page if page is not None else queryset)
+        response = self.get_paginated_response(data) if page is not None else Response(data)
+        if side_table:
+            if page is None:
+                response.data = {'results': data}
+            response.data.update(side_table)
+        return response
+
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         transaction1_data = request.data.get('transaction1')
@@ -52,21 +151,23 @@ class TransactionViewSet(viewsets.ModelViewSet):
         if not transaction1_data or not transaction2_data:
             return Response({"error": "Both transaction1 and transaction2 are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Generate the next voucher number
-        last_transaction = Transaction.objects.order_by('-voucher_no').first()
-        next_voucher_no = (last_transaction.voucher_no + 1) if last_transaction else 1
-
-        # Assign the generated voucher number to both transactions
-        transaction1_data['voucher_no'] = next_voucher_no
-        transaction2_data['voucher_no'] = next_voucher_no
-
+        # Validate both legs before anything is written; the voucher number
+        # comes from the header created below
         serializer1 = self.get_serializer(data=transaction1_data)
         serializer1.is_valid(raise_exception=True)
-        self.perform_create(serializer1)
-
         serializer2 = self.get_serializer(data=transaction2_data)
         serializer2.is_valid(raise_exception=True)
-        self.perform_create(serializer2)
+
+        leg = serializer1.validated_data
+        voucher = Voucher.objects.create(
+            voucher_no=Voucher.next_voucher_no(),
+            date=leg['date'],
+            transaction_type=leg.get('transaction_type') or '',
+            total_amount=max(leg.get('debit_amount') or 0, leg.get('credit_amount') or 0),
+            narration=leg.get('remarks') or '',
+        )
+        serializer1.save(voucher=voucher, voucher_no=voucher.voucher_no)
+        serializer2.save(voucher=voucher, voucher_no=voucher.voucher_no)
 
         return Response(serializer1.data, status=status.HTTP_201_CREATED) 
 
@@ -81,14 +182,29 @@ class TransactionViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def perform_destroy(self, instance):
+        try:
+            instance.delete()
+        except DjangoValidationError as e:
+            raise ValidationError({"error": e.messages})
+
     def perform_update(self, serializer):
-        serializer.save()
+        instance = serializer.save()
+        # Keep the voucher header total in step with edited legs
+        if instance.voucher_id:
+            totals = instance.voucher.legs.aggregate(debit=Sum('debit_amount'), credit=Sum('credit_amount'))
+            Voucher.objects.filter(id=instance.voucher_id).update(
+                total_amount=max(totals['debit'] or 0, totals['credit'] or 0)
+            )
 
     @action(detail=False, methods=['get'])
     def filter_by_voucher_no(self, request):
         voucher_no = request.query_params.get('voucher_no', None)
         if voucher_no is not None:
-            transactions = self.queryset.filter(voucher_no=voucher_no)
+            # Legs backfill_vouchers hasn't linked yet only carry the number
+            transactions = self.get_queryset().filter(
+                Q(voucher__voucher_no=voucher_no) | Q(voucher__isnull=True, voucher_no=voucher_no)
+            )
             serializer = self.get_serializer(transactions, many=True)
             return Response(serializer.data)
         else:
@@ -99,17 +215,22 @@ class TransactionViewSet(viewsets.ModelViewSet):
     def filter_transaction_by_transaction_type(self, request):
         transaction_type = request.query_params.get('transaction_type', None)
         
+        vouchers = Voucher.objects.all()
         if transaction_type:
-            transactions = self.queryset.filter(transaction_type=transaction_type)
-        else:
-            transactions = self.queryset
-
-
-        filtered_transactions = transactions.filter(
-            id__in=transactions.values('voucher_no')
-                              .annotate(min_id=Min('id'))
-                              .values('min_id')
-        )
+            vouchers = vouchers.filter(transaction_type=transaction_type)
+
+        # First leg of each voucher, looked up per header through the voucher FK index
+        first_legs = vouchers.annotate(
+            first_leg=Subquery(
+                Transaction.objects.filter(voucher=OuterRef('pk')).order_by('id').values('id')[:1]
+            )
+        ).values('first_leg')
+        # Legs backfill_vouchers hasn't linked yet, grouped by number as before
+        unlinked = Transaction.objects.filter(voucher__isnull=True)
+        if transaction_type:
+            unlinked = unlinked.filter(transaction_type=transaction_type)
+        unlinked_first_legs = unlinked.values('voucher_no').annotate(first_leg=Min('id')).values('first_leg')
+        filtered_transactions = self.get_queryset().filter(Q(id__in=first_legs) | Q(id__in=unlinked_first_legs))
 
         serializer = self.get_serializer(filtered_transactions, many=True)
         return Response(serializer.data)
@@ -129,13 +250,19 @@ class TransactionViewSet(viewsets.ModelViewSet):
             # If it converts to an integer, assume it's an ID
         except ValueError:
             # Otherwise, treat it as a name and fetch the ID
-            ledger = Ledger.objects.filter(name=ledger_param).first()
+            ledger = Ledger.objects.filter(
+                search_name=Ledger.normalize_search(ledger_param), name=ledger_param
+            ).first()
+            if ledger is None:
+                # Ledgers backfill_ledger_search hasn't reached have no search_name yet
+                ledger = Ledger.objects.filter(name=ledger_param).first()
             ledger_id = ledger.id if ledger else None
 
-        if not ledger_id:
+        ledger = Ledger.objects.filter(id=ledger_id).first() if ledger_id else None
+        if not ledger:
             return Response([])
 
-        queryset = self.queryset.filter(ledger__id=ledger_id)
+        queryset = self.get_queryset().filter(ledger_id=ledger.id).order_by('date', 'id')
 
         if from_date:
             from_date = parse_date(from_date)
@@ -149,8 +276,33 @@ class TransactionViewSet(viewsets.ModelViewSet):
         elif to_date:
             queryset = queryset.filter(date__lte=to_date)
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        paginator = LedgerReportPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        data, side_table = self.serialize_transactions(page)
+
+        response = paginator.get_paginated_response(data)
+        response.data['opening_balance'] = self.get_opening_balance_row(ledger, from_date)
+        response.data.update(side_table)
+        return response
+
+    def get_opening_balance_row(self, ledger, from_date):
+        """
+        Ledger balance carried into the report period, computed from the
+        latest fiscal year close (see reports.ledger_balance_before).
+        """
+        if from_date:
+            opening = ledger_balance_before(ledger, from_date)
+        else:
+            opening = signed_opening_balance(ledger)
+
+        return {
+            'ledger': ledger.id,
+            'particulars': 'Opening Balance',
+            'date': from_date or ledger.date,
+            'debit_amount': opening if opening > 0 else Decimal('0.00'),
+            'credit_amount': -opening if opening < 0 else Decimal('0.00'),
+            'balance_amount': opening,
+        }
     
     @action(detail=False, methods=['get'], url_path='filter-by-nature-group')
     def filter_by_nature_group(self, request):
@@ -176,15 +328,16 @@ class TransactionViewSet(viewsets.ModelViewSet):
             return Response([])  # Return empty response if both dates are not provided
 
         # Fetch filtered transactions
-        transactions = Transaction.objects.filter(filters)
+        transactions = self.get_queryset().filter(filters)
+        data, side_table = self.serialize_transactions(transactions)
 
         # Return empty if no transactions found
-        if not transactions.exists():
+        if not data:
             return Response([])
 
-        # Serialize and return the filtered data
-        serializer = self.get_serializer(transactions, many=True)
-        return Response(serializer.data)
+        if side_table:
+            return Response({'results': data, **side_table})
+        return Response(data)
     
     @action(detail=False, methods=['get'], url_path='profit-and-loss')
     def profit_and_loss(self, request):
@@ -192,43 +345,76 @@ class TransactionViewSet(viewsets.ModelViewSet):
         to_date = request.query_params.get('to_date', None)
 
         # Date filters
-        filters = Q()
         if from_date and to_date:
             from_date_parsed = parse_date(from_date)
             to_date_parsed = parse_date(to_date)
 
-            if from_date_parsed and to_date_parsed:
-                filters &= Q(date__range=(from_date_parsed, to_date_parsed))
-            else:
+            if not (from_date_parsed and to_date_parsed):
                 return Response({"error": "Invalid date format"}, status=status.HTTP_400_BAD_REQUEST)
         else:
             return Response({"error": "Both from_date and to_date are required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Filter transactions for 'Expense' and 'Income'
-        expense_transactions = Transaction.objects.filter(
-            filters & Q(ledger__group__nature_group__name__iexact='Expense')
-        )
-        income_transactions = Transaction.objects.filter(
-            filters & Q(ledger__group__nature_group__name__iexact='Income')
+        return Response(compute_profit_and_loss(from_date_parsed, to_date_parsed))
+
+
+
+class VoucherViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Voucher headers with their legs. Filters: `transaction_type`,
+    `from_date`/`to_date` and `search` (voucher number or narration).
+    """
+    serializer_class = VoucherSerializer
+
+    def get_queryset(self):
+        queryset = Voucher.objects.prefetch_related(
+            Prefetch('legs', queryset=Transaction.objects.select_related(*TRANSACTION_RELATED_FIELDS).order_by('id'))
         )
+        params = self.request.query_params
+
+        transaction_type = params.get('transaction_type')
+        if transaction_type:
+            queryset = queryset.filter(transaction_type=transaction_type)
+
+        from_date = parse_date(params.get('from_date', '') or '')
+        to_date = parse_date(params.get('to_date', '') or '')
+        if from_date:
+            queryset = queryset.filter(date__gte=from_date)
+        if to_date:
+            queryset = queryset.filter(date__lte=to_date)
 
-        # Sum the debit_amount for 'Expense' transactions
-        total_expense = expense_transactions.aggregate(total_debit=Sum('debit_amount'))['total_debit'] or 0
+        search = params.get('search', '').strip()
+        if search.isdigit():
+            queryset = queryset.filter(voucher_no=int(search))
+        elif search:
+            queryset = queryset.filter(narration__icontains=search)
+        return queryset
 
-        # Sum the credit_amount for 'Income' transactions
-        total_income = income_transactions.aggregate(total_credit=Sum('credit_amount'))['total_credit'] or 0
 
-        # Calculate net profit and loss
-        net_profit = total_income - total_expense if total_income > total_expense else 0
-        net_loss = total_expense - total_income if total_expense > total_income else 0
+class FiscalYearCloseViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Fiscal year closes. POST closes the year up to `end_date` and carries
+    every ledger balance forward; `reopen` undoes the most recent close.
+    """
+    queryset = FiscalYearClose.objects.all()
+    serializer_class = FiscalYearCloseSerializer
 
-        return Response({
-            'total_expense': total_expense,
-            'total_income': total_income,
-            'net_profit': net_profit,
-            'net_loss': net_loss,
-        })
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            fiscal_close = close_fiscal_year(
+                serializer.validated_data['end_date'], serializer.validated_data.get('start_date')
+            )
+        except FiscalCloseError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(fiscal_close).data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def reopen(self, request):
+        reopened = reopen_latest_fiscal_year()
+        if not reopened:
+            return Response({"error": "No closed fiscal year to reopen."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"detail": f"Fiscal year ending {reopened.end_date} reopened."})
 
 
 #ShareManagement Section
@@ -258,6 +444,27 @@ class ProfitLossShareTransactionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save()
 
+    @action(detail=False, methods=['post'])
+    def distribute(self, request):
+        """
+        Compute the net profit/loss of `period_from`..`period_to` from the
+        ledgers and split it across share users (optionally only `share_users`).
+        """
+        params = ProfitLossDistributeSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        try:
+            share_transaction = distribute_profit_loss(
+                params.validated_data['period_from'],
+                params.validated_data['period_to'],
+                share_user_ids=params.validated_data.get('share_users'),
+            )
+        except DistributionError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(share_transaction)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 class CashCountSheetViewSet(viewsets.ModelViewSet):
     serializer_class = CashCountSheetSerializer
     def get_queryset(self):
@@ -295,4 +502,70 @@ class CashCountSheetViewSet(viewsets.ModelViewSet):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def reconciliation(self, request):
+        """
+        Compare counted cash for a day against expected cash.
+
+        Expected cash = delivered order cash + mess cash receipts + credit cash
+        receipts - cash payouts, optionally plus an `opening_cash` float.
+        Passing `from_time`/`to_time` narrows orders to a shift; mess, credit
+        and ledger entries only carry a date and are always taken for the day.
+        """
+        day = parse_date(request.query_params.get('date', '') or '')
+        if not day:
+            return Response({"error": "date parameter is required (YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
+
+        orders = Order.objects.filter(status='delivered', created_at__date=day)
+        from_time = parse_time(request.query_params.get('from_time', '') or '')
+        to_time = parse_time(request.query_params.get('to_time', '') or '')
+        if from_time:
+            orders = orders.filter(created_at__time__gte=from_time)
+        if to_time:
+            orders = orders.filter(created_at__time__lte=to_time)
+
+        try:
+            opening_cash = Decimal(request.query_params.get('opening_cash', '0') or '0')
+        except InvalidOperation:
+            return Response({"error": "Invalid opening_cash"}, status=status.HTTP_400_BAD_REQUEST)
+
+        cash_ledger = settings.DAILY_POSTING_LEDGERS['cash']
+        sources = [
+            # Same cash basis as the daily posting
+            ('order_cash', orders, order_cash_amount()),
+            ('mess_cash', MessTransaction.objects.filter(date=day), receipt_cash_amount()),
+            ('credit_cash', CreditTransaction.objects.filter(date=day), receipt_cash_amount()),
+            ('cash_payouts', Transaction.objects.filter(
+                date=day, transaction_type='payout', ledger__name=cash_ledger), 'credit_amount'),
+            ('counted_cash', CashCountSheet.objects.filter(created_date=day), 'amount'),
+        ]
+        # Every source collapses to a single (source, total) row and the rows
+        # are combined with UNION ALL so the database is hit exactly once.
+        combined = [
+            queryset.order_by()
+            .annotate(source=Value(name, output_field=CharField()))
+            .values('source')
+            .annotate(total=Sum(field))
+            .values_list('source', 'total')
+            for name, queryset, field in sources
+        ]
+        totals = {name: Decimal('0.00') for name, _, _ in sources}
+        totals.update(
+            (name, total) for name, total in combined[0].union(*combined[1:], all=True) if total is not None
+        )
+
+        expected_cash = (
+            opening_cash + totals['order_cash'] + totals['mess_cash']
+            + totals['credit_cash'] - totals['cash_payouts']
+        )
+        return Response({
+            'date': day,
+            'from_time': from_time,
+            'to_time': to_time,
+            'opening_cash': opening_cash,
+            **totals,
+            'expected_cash': expected_cash,
+            'variance': totals['counted_cash'] - expected_cash,
+        })